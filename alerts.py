@@ -0,0 +1,232 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from buffet_analyzer import normalize_stock_data
+from rule_compiler import OPERATORS, PICK_THRESHOLD
+from score_history import align_symbols
+from snapshot_store import find_snapshots, load_snapshot
+from valuation_engine import build_valuation_inputs, compute_valuation_methods
+from vectorized_scoring import score_universe
+
+DEFAULT_ALERT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alert_rules.json')
+ALERTS_OUTPUT_PATH = 'data/alerts.ndjson'
+
+# Metrics that come from the analysis rather than straight from the snapshot
+SCORE_METRICS = ['buffett_score', 'technical_score', 'growth_score', 'total_score']
+VALUATION_METRICS = ['intrinsic_value', 'margin_of_safety']
+
+# Constants alert rules can use by name as their value
+NAMED_VALUES = {'pick_threshold': PICK_THRESHOLD}
+
+
+def _to_float(value):
+    if value is None or isinstance(value, (bool, str, list, dict)):
+        return np.nan
+    return float(value)
+
+
+def load_alert_rules(path=DEFAULT_ALERT_RULES_PATH):
+    """Load and validate an alert rule file.
+
+    Each rule has an id, a metric, a condition (op one of >, <, >=, <= and a value) and a
+    message template formatted with symbol, metric, value, previous and current. A value may
+    name a shared constant (see NAMED_VALUES) instead of a number.
+    """
+    with open(path, 'r') as f:
+        rule_set = json.load(f)
+
+    seen_ids = set()
+    for rule in rule_set.get('rules', []):
+        if rule['id'] in seen_ids:
+            raise ValueError(f"Duplicate alert rule id: {rule['id']}")
+        seen_ids.add(rule['id'])
+        if rule.get('op') not in OPERATORS:
+            raise ValueError(f"Alert rule {rule['id']} uses unknown operator {rule.get('op')!r}")
+        rule['value'] = float(NAMED_VALUES.get(rule['value'], rule['value']))
+
+    rule_set['path'] = path
+    return rule_set
+
+
+def snapshot_columns(stock_data, metrics):
+    """Columns of the given metrics for every analyzable stock of a snapshot.
+
+    Snapshot fields are read from the normalized view. Score metrics come from the vectorized
+    scorer and intrinsic value and margin of safety from the valuation engine (the stored value
+    when the snapshot has one), so they are only computed when a rule needs them. Missing values
+    are NaN. Returns the symbol array and the columns.
+    """
+    normalized_data = normalize_stock_data(stock_data)
+    symbols = [symbol for symbol, data in normalized_data.items()
+               if 'error' not in data and '.BO' not in symbol]
+    records = [normalized_data[symbol] for symbol in symbols]
+
+    columns = {}
+    for metric in metrics:
+        if metric not in SCORE_METRICS and metric not in VALUATION_METRICS:
+            columns[metric] = np.array([_to_float(data.get(metric)) for data in records], dtype=float)
+
+    if any(metric in SCORE_METRICS for metric in metrics):
+        scores = score_universe(stock_data)
+        for metric in SCORE_METRICS:
+            columns[metric] = np.asarray(scores[metric], dtype=float)
+
+    if any(metric in VALUATION_METRICS for metric in metrics):
+        inputs = build_valuation_inputs(records)
+        stored_value = np.array([_to_float(data.get('intrinsic_value')) for data in records], dtype=float)
+        stored_margin = np.array([_to_float(data.get('margin_of_safety')) for data in records], dtype=float)
+        median = compute_valuation_methods(inputs)['median']
+        price = inputs['current_price']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            has_stored = stored_value > 0
+            intrinsic_value = np.where(has_stored, stored_value, median)
+            computed_margin = np.where((price > 0) & (intrinsic_value > price),
+                                       (intrinsic_value - price) / intrinsic_value * 100, 0.0)
+        columns['intrinsic_value'] = np.where(intrinsic_value > 0, intrinsic_value, np.nan)
+        columns['margin_of_safety'] = np.where(has_stored, stored_margin,
+                                               np.where(intrinsic_value > 0, computed_margin, np.nan))
+
+    return np.array(symbols, dtype=str), columns
+
+
+def evaluate_alerts(rules, previous_symbols, previous_columns, current_symbols, current_columns):
+    """Evaluate every alert rule over whole columns aligned by symbol.
+
+    The previous snapshot is joined onto the current one with a binary search on its sorted
+    symbols. A rule fires for a stock when its condition holds now and did not hold before;
+    stocks missing a value in either snapshot never fire. Returns a dict mapping rule id to the
+    current-snapshot rows that fired and the aligned previous and current values.
+    """
+    order = np.argsort(previous_symbols, kind='stable')
+    positions = align_symbols(current_symbols, previous_symbols[order])
+    in_previous = positions >= 0
+    previous_rows = order[positions[in_previous]]
+
+    fired = {}
+    for rule in rules['rules']:
+        current = current_columns[rule['metric']]
+        previous = np.full(len(current), np.nan)
+        previous[in_previous] = previous_columns[rule['metric']][previous_rows]
+        condition = OPERATORS[rule['op']]
+        with np.errstate(invalid='ignore'):
+            crossed = condition(current, rule['value']) & ~condition(previous, rule['value']) & ~np.isnan(previous)
+        rows = np.flatnonzero(crossed)
+        fired[rule['id']] = {'rows': rows, 'previous': previous[rows], 'current': current[rows]}
+    return fired
+
+
+def alert_events(rules, fired, symbols, run):
+    """Event dicts for the fired alerts, formatting only the messages of stocks that fired"""
+    rules_by_id = {rule['id']: rule for rule in rules['rules']}
+    events = []
+    for rule_id, hits in fired.items():
+        rule = rules_by_id[rule_id]
+        for row, previous, current in zip(hits['rows'], hits['previous'], hits['current']):
+            symbol = str(symbols[row])
+            events.append({
+                'time': run,
+                'rule': rule_id,
+                'symbol': symbol,
+                'metric': rule['metric'],
+                'threshold': rule['value'],
+                'previous': float(previous),
+                'current': float(current),
+                'message': rule['message'].format(symbol=symbol, metric=rule['metric'], value=rule['value'],
+                                                  previous=float(previous), current=float(current))
+            })
+    return events
+
+
+def write_alert_events(events, path=ALERTS_OUTPUT_PATH):
+    """Append events to an NDJSON file, one JSON object per line"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(''.join(json.dumps(event) + '\n' for event in events))
+
+
+def snapshot_time(stock_data):
+    """Data time of a snapshot (latest last_updated of its stocks), used to label its events"""
+    return max((data.get('last_updated') or '' for data in stock_data.values() if 'error' not in data), default='')
+
+
+def run_alerts(previous_data, current_data, rules):
+    """Evaluate the alert rules between two snapshots and return the events"""
+    metrics = list(dict.fromkeys(rule['metric'] for rule in rules['rules']))
+
+    start = time.perf_counter()
+    previous_symbols, previous_columns = snapshot_columns(previous_data, metrics)
+    current_symbols, current_columns = snapshot_columns(current_data, metrics)
+    columns_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fired = evaluate_alerts(rules, previous_symbols, previous_columns, current_symbols, current_columns)
+    evaluate_time = time.perf_counter() - start
+
+    events = alert_events(rules, fired, current_symbols, snapshot_time(current_data))
+    print(f"Built {len(metrics)} metric columns for both snapshots in {columns_time:.3f}s, "
+          f"evaluated {len(rules['rules'])} rules over {len(current_symbols)} stocks in {evaluate_time * 1000:.2f} ms")
+    return events
+
+
+# ----- BENCHMARK -----
+
+def run_benchmark(sizes=(2_000, 100_000), seed=42):
+    """Time rule evaluation on synthetic aligned columns of growing size"""
+    rules = load_alert_rules()
+    metrics = list(dict.fromkeys(rule['metric'] for rule in rules['rules']))
+    rng = np.random.default_rng(seed)
+    for size in sizes:
+        symbols = np.array([f"S{i:07d}" for i in range(size)])
+        previous_columns = {metric: rng.uniform(0, 100, size) for metric in metrics}
+        current_columns = {metric: values + rng.normal(0, 5, size) for metric, values in previous_columns.items()}
+        # The previous snapshot is shuffled so the symbol join does real work
+        shuffle = rng.permutation(size)
+
+        start = time.perf_counter()
+        fired = evaluate_alerts(rules, symbols[shuffle], {m: v[shuffle] for m, v in previous_columns.items()},
+                                symbols, current_columns)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>9,} stocks: {sum(len(hits['rows']) for hits in fired.values()):,} alerts "
+              f"in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Alert on threshold crossings between two snapshots')
+    parser.add_argument('--previous', type=str, default=None,
+                        help='Earlier snapshot (defaults to the second newest stored snapshot)')
+    parser.add_argument('--current', type=str, default=None,
+                        help='Later snapshot (defaults to the newest stored snapshot)')
+    parser.add_argument('--rules', type=str, default=DEFAULT_ALERT_RULES_PATH, help='Alert rule file')
+    parser.add_argument('--output', type=str, default=ALERTS_OUTPUT_PATH, help='NDJSON file events are appended to')
+    parser.add_argument('--benchmark', action='store_true', help='Time rule evaluation on synthetic columns')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark()
+        raise SystemExit(0)
+
+    previous_path, current_path = args.previous, args.current
+    if not previous_path or not current_path:
+        snapshots = find_snapshots()
+        if len(snapshots) < 2:
+            print(f"Need two snapshots: pass --previous and --current, found {len(snapshots)} daily snapshots")
+            raise SystemExit(1)
+        previous_path = previous_path or snapshots[-2][1]
+        current_path = current_path or snapshots[-1][1]
+
+    previous_data = load_snapshot(previous_path)
+    current_data = load_snapshot(current_path)
+
+    events = run_alerts(previous_data, current_data, load_alert_rules(args.rules))
+    write_alert_events(events, args.output)
+
+    counts = {}
+    for event in events:
+        counts[event['rule']] = counts.get(event['rule'], 0) + 1
+    for rule_id, count in counts.items():
+        print(f"  {rule_id}: {count}")
+    print(f"{len(events)} alerts from {previous_path} to {current_path} appended to {args.output}")
@@ -0,0 +1,371 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from buffet_analyzer import (
+    LIQUIDITY_GATE_DEFAULTS, add_liquidity_arguments, apply_liquidity_gate, build_analysis_sector_index,
+    liquidity_gate_options, load_latest_data
+)
+from rule_compiler import PICK_THRESHOLD, load_rules
+from snapshot_store import SNAPSHOT_PATTERN, find_snapshots, load_snapshot, save_snapshot
+from vectorized_scoring import prepare_frame, score_frame, uses_rank_columns
+
+# Forward return horizons in trading days (one week, one month, one quarter)
+BACKTEST_HORIZONS = [5, 21, 63]
+
+# A close is carried forward over at most this many trading days (holidays, missing snapshots)
+MAX_FILL_DAYS = 5
+
+
+def snapshot_closes(stock_data, symbols):
+    """Stored closes of each symbol (oldest first, ending on the snapshot date), or its current price"""
+    closes = []
+    for symbol in symbols:
+        data = stock_data[symbol]
+        history = data.get('historical_prices') or []
+        if not history and isinstance(data.get('current_price'), (int, float)):
+            history = [data['current_price']]
+        closes.append(history)
+    return closes
+
+
+def snapshot_close_dates(stock_data, symbols):
+    """Trading dates (datetime64 arrays) of each symbol's stored closes, None when the snapshot has none.
+
+    Snapshots collected before the dates were stored, and stocks with only a current price,
+    have none. Symbols with the same dates share one array.
+    """
+    converted = {}
+    close_dates = []
+    for symbol in symbols:
+        data = stock_data[symbol]
+        dates = data.get('historical_dates')
+        if not dates or len(dates) != len(data.get('historical_prices') or []):
+            close_dates.append(None)
+            continue
+        key = tuple(dates)
+        if key not in converted:
+            converted[key] = np.array(dates, dtype='datetime64[D]')
+        close_dates.append(converted[key])
+    return close_dates
+
+
+def liquid_universe(stock_data, liquidity_gate=LIQUIDITY_GATE_DEFAULTS):
+    """The stocks of a snapshot a default analysis run would score.
+
+    liquidity_gate holds the apply_liquidity_gate arguments (the analyzer's defaults unless
+    given), None scores every stock.
+    """
+    if liquidity_gate is None:
+        return stock_data
+    return apply_liquidity_gate(stock_data, **liquidity_gate)[0]
+
+
+def replay_snapshot(stock_data, rules, threshold=PICK_THRESHOLD, liquidity_gate=LIQUIDITY_GATE_DEFAULTS):
+    """Score one snapshot and keep what the backtest needs from it.
+
+    Illiquid stocks are removed first, as in the analysis (see liquid_universe). Returns the
+    scored symbols with their total scores and pick flags, and each symbol's stored closes
+    (historical_prices, oldest first, ending on the snapshot date) and their trading dates for
+    the price grid.
+    """
+    stock_data = liquid_universe(stock_data, liquidity_gate)
+    sector_index = build_analysis_sector_index(stock_data)
+    scores = score_frame(prepare_frame(stock_data, ranks=uses_rank_columns(rules)), sector_index, rules)
+
+    return {
+        'symbols': scores['symbols'],
+        'total_score': scores['total_score'],
+        'picks': scores['total_score'] >= threshold,
+        'closes': snapshot_closes(stock_data, scores['symbols']),
+        'close_dates': snapshot_close_dates(stock_data, scores['symbols'])
+    }
+
+
+def _replay_file(job):
+    """Pool task: load one snapshot file and run the replay function on it"""
+    replay, path, rules_path, options = job
+    stock_data = load_snapshot(path)
+    rules = load_rules(rules_path) if rules_path else load_rules()
+    return replay(stock_data, rules, **options)
+
+
+def replay_snapshots(paths, rules_path=None, workers=1, replay=replay_snapshot, **options):
+    """Run replay(stock_data, rules, **options) on snapshot files in order.
+
+    Files are processed across worker processes when workers > 1.
+    """
+    jobs = [(replay, path, rules_path, options) for path in paths]
+    if workers > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(min(workers, len(jobs))) as pool:
+            return pool.map(_replay_file, jobs)
+    return [_replay_file(job) for job in jobs]
+
+
+def trading_calendar(dates, replays):
+    """Sorted trading dates of the price grid.
+
+    These are the dates of every close stored with a trading date in any snapshot, i.e. the
+    exchange's own calendar including its holidays. Only when no snapshot stores dates (all
+    collected before they were) are business days used, reaching back far enough for the
+    longest stored history.
+    """
+    stored = {id(history_dates): history_dates for replay in replays
+              for history_dates in replay.get('close_dates') or [] if history_dates is not None}
+    if stored:
+        return np.unique(np.concatenate(list(stored.values())))
+
+    snapshot_dates = np.busday_offset(np.asarray(dates, dtype='datetime64[D]'), 0, roll='backward')
+    longest = max((len(history) for replay in replays for history in replay['closes']), default=1)
+    first = np.busday_offset(snapshot_dates[0], -(max(longest, 1) - 1), roll='backward')
+    days = np.arange(first, snapshot_dates[-1] + 1, dtype='datetime64[D]')
+    return days[np.is_busday(days)]
+
+
+def build_price_grid(dates, replays):
+    """Build the trading date x symbol close grid from the closes stored in each snapshot.
+
+    The grid's rows are the trading dates of trading_calendar and each snapshot's row is the
+    last trading date on or before its date. Closes stored with their trading dates land on
+    those rows; closes without dates are taken to end on the snapshot's row. The first
+    snapshot places all of its closes; every later one only adds the closes after the previous
+    snapshot's row, so daily snapshots add one close per stock. Gaps of up to MAX_FILL_DAYS are
+    filled with the previous close. Returns the symbol list, the grid, its trading dates and
+    the grid row of every snapshot date.
+    """
+    symbols = sorted({symbol for replay in replays for symbol in replay['symbols']})
+    columns = {symbol: i for i, symbol in enumerate(symbols)}
+
+    grid_dates = trading_calendar(dates, replays)
+    date_rows = np.searchsorted(grid_dates, np.asarray(dates, dtype='datetime64[D]'), side='right') - 1
+
+    grid = np.full((len(grid_dates), len(symbols)), np.nan)
+    previous_row = -1
+    for end_row, replay in zip(date_rows, replays):
+        histories = replay['closes']
+        history_dates = replay.get('close_dates') or [None] * len(histories)
+        lengths = np.array([len(history) for history in histories], dtype=np.int64)
+        if lengths.sum() == 0:
+            continue
+        values = np.array([close for history in histories for close in history], dtype=float)
+        cols = np.repeat([columns[symbol] for symbol in replay['symbols']], lengths)
+        # Position counted back from the newest close of each symbol, for closes without dates
+        back = np.repeat(np.cumsum(lengths), lengths) - 1 - np.arange(len(values))
+        rows = end_row - back
+
+        dated = np.repeat([closes_dates is not None for closes_dates in history_dates], lengths)
+        if dated.any():
+            stored_dates = np.concatenate([closes_dates for closes_dates in history_dates if closes_dates is not None])
+            rows[dated] = np.searchsorted(grid_dates, stored_dates)
+
+        keep = (rows >= 0) & (rows <= end_row) & (rows > previous_row)
+        grid[rows[keep], cols[keep]] = values[keep]
+        previous_row = end_row
+
+    # Forward fill short gaps along the date axis
+    positions = np.arange(len(grid))[:, None]
+    last_seen = np.where(np.isnan(grid), 0, positions)
+    np.maximum.accumulate(last_seen, axis=0, out=last_seen)
+    filled = grid[last_seen, np.arange(grid.shape[1])]
+    filled[positions - last_seen > MAX_FILL_DAYS] = np.nan
+
+    return symbols, filled, grid_dates, date_rows
+
+
+def forward_returns(grid, date_rows, horizon):
+    """Date x symbol returns over horizon trading days from each snapshot row of the price grid.
+
+    NaN where either close is unknown, the snapshot is older than the grid's first trading date
+    or the horizon runs past the end of the grid.
+    """
+    entry = grid[date_rows]
+    exit_rows = date_rows + horizon
+    evaluated = (date_rows >= 0) & (exit_rows < len(grid))
+    returns = np.full(entry.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[evaluated] = grid[exit_rows[evaluated]] / entry[evaluated] - 1
+    returns[~np.isfinite(returns)] = np.nan
+    return returns
+
+
+def score_matrix(symbols, replays):
+    """Date x symbol matrices of total scores (NaN when not scored) and pick flags"""
+    columns = {symbol: i for i, symbol in enumerate(symbols)}
+    scores = np.full((len(replays), len(symbols)), np.nan)
+    for row, replay in enumerate(replays):
+        scores[row, [columns[symbol] for symbol in replay['symbols']]] = replay['total_score']
+    return scores
+
+
+def evaluate_backtest(dates, replays, horizons=BACKTEST_HORIZONS, threshold=PICK_THRESHOLD):
+    """Forward-return statistics of the pick portfolios formed on each snapshot date.
+
+    Picks are held equal-weighted. For every horizon the forward returns of all scored stocks are
+    read from the price grid in one step. Excess return is the pick portfolio's return minus
+    the equal-weighted return of every scored stock. Hit rate is the share of picks that beat
+    that universe return. Turnover is half the sum of absolute weight changes between
+    consecutive dates. Dates whose horizon runs past the last snapshot are not evaluated.
+    """
+    symbols, grid, grid_dates, date_rows = build_price_grid(dates, replays)
+    scores = score_matrix(symbols, replays)
+    picks = scores >= threshold
+    scored = ~np.isnan(scores)
+
+    results = {'dates': [str(date) for date in dates], 'horizons': {}}
+    for horizon in horizons:
+        returns = forward_returns(grid, date_rows, horizon)
+
+        has_return = ~np.isnan(returns)
+        universe = scored & has_return
+        held = picks & has_return
+        universe_count = universe.sum(axis=1)
+        pick_count = held.sum(axis=1)
+        active = (pick_count > 0) & (universe_count > 0)
+
+        filled_returns = np.where(has_return, returns, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            universe_return = (filled_returns * universe).sum(axis=1) / universe_count
+            pick_return = (filled_returns * held).sum(axis=1) / pick_count
+        hits = (held & (filled_returns > universe_return[:, None])).sum(axis=1)
+
+        excess = pick_return[active] - universe_return[active]
+        results['horizons'][horizon] = {
+            'periods': int(active.sum()),
+            'avg_picks': float(pick_count[active].mean()) if active.any() else 0.0,
+            'hit_rate': float(hits[active].sum() / pick_count[active].sum()) if active.any() else float('nan'),
+            'pick_return': float(pick_return[active].mean()) if active.any() else float('nan'),
+            'universe_return': float(universe_return[active].mean()) if active.any() else float('nan'),
+            'excess_return': float(excess.mean()) if active.any() else float('nan'),
+            'excess_by_date': {str(dates[row]): float(pick_return[row] - universe_return[row])
+                               for row in np.flatnonzero(active)}
+        }
+
+    pick_counts = picks.sum(axis=1)
+    weights = np.divide(picks, pick_counts[:, None], out=np.zeros(picks.shape), where=pick_counts[:, None] > 0)
+    turnover = 0.5 * np.abs(np.diff(weights, axis=0)).sum(axis=1)
+    results['turnover'] = float(turnover.mean()) if len(turnover) else 0.0
+    results['avg_picks'] = float(pick_counts.mean())
+    results['stocks'] = len(symbols)
+    return results
+
+
+def print_backtest(results):
+    """Print the per-horizon summary of a backtest"""
+    dates = results['dates']
+    print(f"Backtest over {len(dates)} snapshots ({dates[0]} to {dates[-1]}), {results['stocks']} stocks, "
+          f"{results['avg_picks']:.1f} picks on average")
+    print(f"{'Horizon':>8} {'Periods':>8} {'Picks':>7} {'Hit rate':>9} {'Picks ret':>10} "
+          f"{'Universe':>9} {'Excess':>8}")
+    for horizon, stats in results['horizons'].items():
+        if stats['periods'] == 0:
+            print(f"{horizon:>7}d {0:>8}   (not enough later snapshots)")
+            continue
+        print(f"{horizon:>7}d {stats['periods']:>8} {stats['avg_picks']:>7.1f} {stats['hit_rate']:>9.1%} "
+              f"{stats['pick_return']:>10.2%} {stats['universe_return']:>9.2%} {stats['excess_return']:>8.2%}")
+    print(f"Average turnover per rebalance: {results['turnover']:.1%}")
+
+
+# ----- BENCHMARK -----
+
+def generate_synthetic_snapshots(stock_data, days=250, seed=42):
+    """Daily snapshots derived from one snapshot by random-walking every stock's price.
+
+    Price-based fields (historical_prices with their historical_dates, ma_50, pe_ratio,
+    pb_ratio, market_cap) follow the walk, so scores and picks move from day to day. The
+    trading calendar is business days with a few weekday holidays, like an exchange's.
+    """
+    rng = np.random.default_rng(seed)
+    symbols = [symbol for symbol, data in stock_data.items() if 'error' not in data]
+    base_prices = np.array([float(stock_data[symbol].get('current_price') or 100) for symbol in symbols])
+    steps = rng.normal(0.0003, 0.02, (days + 50, len(symbols)))
+    paths = base_prices * np.exp(np.cumsum(steps, axis=0))
+
+    business_days = np.busday_offset(np.datetime64('2024-01-01'), np.arange(-49, int(days * 1.1) + 10), roll='forward')
+    holidays = rng.choice(len(business_days), len(business_days) // 25, replace=False)
+    calendar = np.delete(business_days, holidays)[:days + 49]
+    snapshots = []
+    for day in range(days):
+        closes = paths[day:day + 50]
+        close_dates = [str(date) for date in calendar[day:day + 50]]
+        scale = closes[-1] / base_prices
+        snapshot = dict(stock_data)
+        for i, symbol in enumerate(symbols):
+            data = dict(stock_data[symbol])
+            data['historical_prices'] = closes[:, i].tolist()
+            data['historical_dates'] = close_dates
+            data['current_price'] = float(closes[-1, i])
+            data['ma_50'] = float(closes[:, i].mean())
+            for field in ('pe_ratio', 'pb_ratio', 'market_cap'):
+                if isinstance(data.get(field), (int, float)):
+                    data[field] = data[field] * float(scale[i])
+            snapshot[symbol] = data
+        snapshots.append((calendar[day + 49], snapshot))
+    return snapshots
+
+
+def run_benchmark(days=250, threshold=PICK_THRESHOLD, workers=1, liquidity_gate=LIQUIDITY_GATE_DEFAULTS):
+    """Time a replay of a synthetic year of daily snapshots of the full universe.
+
+    The snapshots are written to a temporary snapshot store first, so the timing includes
+    loading them like a real replay.
+    """
+    snapshots = generate_synthetic_snapshots(load_latest_data(), days)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [save_snapshot(stock_data, date, directory, max_snapshots=days) for date, stock_data in snapshots]
+
+        start = time.perf_counter()
+        replays = replay_snapshots(paths, workers=workers, threshold=threshold, liquidity_gate=liquidity_gate)
+        replay_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = evaluate_backtest([date for date, _ in snapshots], replays, threshold=threshold)
+    evaluate_time = time.perf_counter() - start
+
+    print_backtest(results)
+    print(f"Loaded and scored {days} snapshots in {replay_time:.2f}s with {workers} worker(s), "
+          f"computed returns and turnover in {evaluate_time:.3f}s")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Replay stored daily snapshots and measure how the picks performed')
+    parser.add_argument('--snapshots', type=str, default=SNAPSHOT_PATTERN, help='Glob of the daily snapshot files')
+    parser.add_argument('--start', type=str, default=None, help='First snapshot date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=str, default=None, help='Last snapshot date (YYYY-MM-DD)')
+    parser.add_argument('--step', type=int, default=1, help='Rebalance on every Nth snapshot')
+    parser.add_argument('--horizons', type=int, nargs='+', default=BACKTEST_HORIZONS,
+                        help='Forward return horizons in trading days')
+    parser.add_argument('--rules', type=str, default=None, help='Rule set file (defaults to scoring_rules.json)')
+    parser.add_argument('--threshold', type=float, default=PICK_THRESHOLD, help='Total score needed to become a pick')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) - 1),
+                        help='Processes used to score snapshots')
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON to this file')
+    parser.add_argument('--benchmark', action='store_true', help='Replay a synthetic year of snapshots')
+    add_liquidity_arguments(parser)
+    args = parser.parse_args()
+    liquidity_gate = liquidity_gate_options(args)
+
+    if args.benchmark:
+        run_benchmark(threshold=args.threshold, workers=args.workers, liquidity_gate=liquidity_gate)
+        raise SystemExit(0)
+
+    snapshots = find_snapshots(args.snapshots, args.start, args.end)[::max(args.step, 1)]
+    if len(snapshots) < 2:
+        print(f"Need at least two snapshots matching {args.snapshots}, found {len(snapshots)}")
+        raise SystemExit(1)
+
+    start = time.perf_counter()
+    replays = replay_snapshots([path for _, path in snapshots], args.rules, args.workers, threshold=args.threshold,
+                               liquidity_gate=liquidity_gate)
+    results = evaluate_backtest([date for date, _ in snapshots], replays, args.horizons, args.threshold)
+    print_backtest(results)
+    print(f"Replayed {len(snapshots)} snapshots in {time.perf_counter() - start:.2f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
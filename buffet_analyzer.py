@@ -1,13 +1,29 @@
 import json
 import os
+import hashlib
 import numpy as np
 from datetime import datetime
 import pytz
 import re
 import math
-import statistics
+import multiprocessing
+from multiprocessing import shared_memory
 from collections import defaultdict
 
+from correlation import DIVERSIFICATION_PATH, diversification_summary, save_diversification
+from percentile_ranks import compute_percentile_ranks, percentile_ranks_at
+from price_metrics import load_price_matrix
+from rule_compiler import PICK_THRESHOLD, evaluate_record, format_rule_reason, load_rules
+from score_history import (
+    SCORE_FIELDS, SCORE_HISTORY_PATH, append_score_run, compute_movers, load_score_history, save_score_history
+)
+from sector_index import SECTOR_METRICS, build_sector_index, count_sector_peers, sector_peer_stats
+from similar_stocks import build_similarity_index, query_neighbors, similar_stocks_at
+from valuation_engine import (
+    build_valuation_inputs, compute_sensitivity_grid, compute_valuation_methods, sensitivity_at,
+    valuation_methods_at
+)
+
 
 def safe_format(value, format_spec=".2f"):
     if value is None:
@@ -24,120 +40,188 @@ def load_latest_data():
         return {}
 
 
+# ----- SCORING RULES -----
+
+# Threshold checks (metric bands, points and reason templates) are read from scoring_rules.json
+# and compiled once; the analyzers below only score what compares several inputs
+SCORING_RULES = load_rules()
+
+# Category of every rule section, in the order score_stock lists the sections' findings among
+# the checks kept in code (the order the analyzers ran in before the rules were declarative)
+RULE_SECTIONS = {
+    'growth': 'growth',
+    'operating_efficiency': 'buffett',
+    'financial_health': 'buffett',
+    'valuation': 'buffett',
+    'technical_indicators': 'technical',
+    'risk': 'technical',
+    'ownership': 'technical',
+    'corporate_actions': 'technical'
+}
+
+
+def check_rule_sections(compiled):
+    """Make sure score_stock places every section of a compiled rule set under its category"""
+    for rule in compiled['rules']:
+        if RULE_SECTIONS.get(rule['section']) != rule['category']:
+            raise ValueError(f"Rule {rule['id']}: section {rule['section']!r} of category {rule['category']!r} "
+                             f"has no place in score_stock")
+
+
+check_rule_sections(SCORING_RULES)
+
+
+# ----- REASON CODES -----
+
+# Analyzers record reasons and warnings as (code, *args) tuples and only the stocks that are
+# rendered get their text formatted. A ('join', separator, *parts) tuple joins formatted parts.
+# Codes of the scoring rules are formatted with the rule set's templates.
+REASON_TEMPLATES = {
+    'consistent_positive_growth': 'Consistent positive growth across revenue and profits',
+    'expanding_profit_margins': 'Expanding profit margins (profit growth exceeds revenue growth)',
+    'known_historical_moat': 'Known for strong historical moat ({0})',
+    'sector_network_effects': 'Sector with potential network effects ({0})',
+    'sector_brand_moat': 'Sector with potential brand moat ({0})',
+    'sector_switching_costs': 'Sector with potential switching costs ({0})',
+    'pricing_power_margin': 'High profit margin ({0:.1f}%) suggests pricing power',
+    'competitive_advantage_roe': 'Exceptional ROE ({0:.1f}%) indicates sustainable competitive advantage',
+    'potential_moat_advantage': 'Potential {0} advantage indicated',
+    'no_clear_moat': 'No clear economic moat identified',
+    'technical_analysis_skipped_no_price_history': 'Technical analysis skipped - price history not available',
+    'golden_cross': 'Golden Cross pattern (50-day MA above 200-day MA) indicates bullish trend',
+    'death_cross': 'Death Cross pattern (50-day MA below 200-day MA) indicates bearish trend',
+    'price_above_both_moving_averages': 'Price above both 50-day and 200-day moving averages, suggesting bullish trend',
+    'price_below_both_moving_averages': 'Price below both 50-day and 200-day moving averages, suggesting bearish trend',
+    'price_above_50_day_average': 'Price above 50-day moving average, suggesting near-term bullish trend',
+    'price_below_50_day_average': 'Price below 50-day moving average, suggesting near-term bearish trend',
+    'moving_averages_unavailable': 'Moving average data not available',
+    'bullish_macd_crossover': 'Bullish MACD crossover (MACD Line above Signal Line)',
+    'bearish_macd_crossover': 'Bearish MACD crossover (MACD Line below Signal Line)',
+    'macd_unavailable': 'MACD data not available',
+    'sector_unknown': 'Unable to perform sector analysis: sector information missing',
+    'not_enough_sector_peers': 'Not enough peers in {0} sector for comparison',
+    'superior_to_sector_average': 'Superior {0} ({1:.2f}) compared to sector average ({2:.2f})',
+    'outperforms_sector_on_all_metrics': 'Outperforms sector in all {0} key metrics',
+    'limited_sector_comparison': 'Limited sector comparison: only {0} metrics available',
+    'ownership_analysis_skipped_no_shareholding_data': 'Ownership analysis skipped - shareholding data not available',
+    'corporate_actions_data_limited': 'Corporate actions analysis limited - data not available',
+    'favorable_industry': 'Industry with stable cash flows and high entry barriers: {0}',
+    'moderate_industry': 'Industry with moderate business stability: {0}',
+    'unfavorable_industry': 'Industry that Buffett typically avoids: {0}',
+    'neutral_industry': 'Neutral industry assessment: {0}',
+    'favorable_industry_strong_position':
+        'Industry with stable cash flows and high entry barriers: {0}. Appears to have strong market position',
+    'moderate_industry_strong_position':
+        'Industry with moderate business stability: {0}. Appears to have strong market position',
+    'unfavorable_industry_strong_position':
+        'Industry that Buffett typically avoids: {0}. Appears to have strong market position',
+    'neutral_industry_strong_position': 'Neutral industry assessment: {0}. Appears to have strong market position',
+    'favorable_regulation_india': 'Favorable regulatory environment in India for {0}',
+    'challenging_regulation_india': 'Challenging regulatory environment in India for {0}',
+    'neutral_regulation': 'Neutral regulatory assessment',
+    'stable_regulation': 'Generally stable regulatory environment for {0}',
+    'challenging_regulation': 'Often faces regulatory challenges in {0}',
+    'recession_resistant_india': 'Recession-resistant sector in fast-growing Indian economy: {0}',
+    'economically_sensitive_india': "Economically sensitive but benefits from India's growth: {0}",
+    'neutral_macro_india': 'Neutral macroeconomic assessment in Indian context',
+    'recession_resistant': 'Business relatively resistant to economic downturns: {0}',
+    'economically_sensitive': 'Business sensitive to economic cycles: {0}',
+    'neutral_macro': 'Neutral macroeconomic assessment'
+}
+
+
+def format_reason(reason):
+    """Format a reason/warning code tuple into its display text"""
+    if isinstance(reason, str):
+        return reason
+    if reason[0] == 'join':
+        return reason[1].join(format_reason(part) for part in reason[2:])
+    if reason[0] not in REASON_TEMPLATES:
+        return format_rule_reason(SCORING_RULES, reason)
+    return REASON_TEMPLATES[reason[0]].format(*reason[1:])
+
+
+def format_reasons(reasons):
+    """Format a list of reason/warning code tuples"""
+    return [format_reason(reason) for reason in reasons]
+
+
+# ----- RULE INPUTS -----
+
+def _present(value):
+    """None for NaN, so derived inputs are missing wherever one of their inputs is"""
+    return None if value is None or value != value else value
+
+
+def rule_inputs(data):
+    """Values the scoring rules read for one normalized record: its fields plus the derived inputs.
+
+    The derived inputs are the same columns vectorized_scoring.add_derived_columns adds, None
+    where the analyzers skip the check.
+    """
+    sector = data.get('sector') or ''
+    is_financial = any(s in sector for s in ['Bank', 'Financial', 'Insurance'])
+    is_high_yield_sector = any(s in sector for s in ['Utility', 'REIT', 'Energy'])
+
+    fcf = data.get('fcf')
+    market_cap = data.get('market_cap')
+    positive_fcf = fcf is not None and fcf > 0
+    has_market_cap = market_cap is not None and market_cap > 0
+
+    intrinsic_value = data.get('intrinsic_value')
+    current_price = data.get('current_price')
+    margin_of_safety = None
+    if intrinsic_value is not None and current_price is not None and intrinsic_value > 0:
+        margin_of_safety = data.get('margin_of_safety')
+        if margin_of_safety is None:
+            margin_of_safety = ((intrinsic_value - current_price) / intrinsic_value) * 100 \
+                if current_price < intrinsic_value else 0
+
+    def total(first, second):
+        return first + second if first is not None and second is not None else None
+
+    def positive(value):
+        return value if value is not None and value > 0 else None
+
+    inputs = dict(data)
+    inputs.update({
+        'roa_percent': data['returnOnAssets'] * 100 if data.get('returnOnAssets') is not None else None,
+        'fcf_yield': fcf / market_cap * 100 if positive_fcf and has_market_cap else None,
+        'fcf_positive_without_market_cap': 1.0 if positive_fcf and not has_market_cap else 0.0,
+        'positive_pe_ratio': positive(data.get('pe_ratio')),
+        'positive_pb_ratio': positive(data.get('pb_ratio')),
+        'pb_threshold': 2.0 if is_financial else 3.0,
+        'effective_margin_of_safety': margin_of_safety,
+        'institutional_holding': total(data.get('fiiHolding'), data.get('diiHolding')),
+        'institutional_holding_change': total(data.get('fiiHoldingChange'), data.get('diiHoldingChange')),
+        'positive_dividend_yield': positive(data.get('dividendYield')),
+        'dividend_threshold': 4.0 if is_high_yield_sector else 2.0
+    })
+    for column in ('roa_percent', 'fcf_yield', 'effective_margin_of_safety', 'institutional_holding',
+                   'institutional_holding_change'):
+        inputs[column] = _present(inputs[column])
+    return inputs
+
+
 # ----- GROWTH ANALYSIS (NEW) -----
 
-def analyze_growth_metrics(symbol, data):
-    """Analyze revenue and profit growth metrics (YoY and QoQ)"""
+def rule_section(rule_results, section):
+    """(score, reasons, warnings) of one section of evaluate_record's results, empty when the rule set has none"""
+    results = rule_results.get(section)
+    if results is None:
+        return 0, [], []
+    return results['score'], results['reasons'], results['warnings']
+
+
+def analyze_growth_consistency(symbol, data):
+    """Bonuses for growth that is positive across revenue and profits and for expanding margins"""
     score = 0
     reasons = []
     warnings = []
 
-    # Check for YoY Revenue Growth
     revenue_yoy = data.get('revenue_yoy')
-    if revenue_yoy is not None:
-        # Score based on YoY revenue growth
-        if revenue_yoy > 25:
-            score += 3
-            reasons.append(f"Exceptional revenue growth (YoY: {revenue_yoy:.2f}%)")
-        elif revenue_yoy > 15:
-            score += 2
-            reasons.append(f"Strong revenue growth (YoY: {revenue_yoy:.2f}%)")
-        elif revenue_yoy > 8:
-            score += 1
-            reasons.append(f"Solid revenue growth (YoY: {revenue_yoy:.2f}%)")
-        elif revenue_yoy < 0:
-            score -= 1
-            warnings.append(f"Declining revenue (YoY: {revenue_yoy:.2f}%)")
-    else:
-        warnings.append("YoY revenue growth data not available")
-
-    # Check for TTM Revenue Growth (more stable indicator)
-    revenue_ttm_yoy = data.get('revenue_ttm_yoy')
-    if revenue_ttm_yoy is not None:
-        # Score based on TTM revenue growth (slightly higher weight)
-        if revenue_ttm_yoy > 25:
-            score += 3
-            reasons.append(f"Exceptional TTM revenue growth (YoY: {revenue_ttm_yoy:.2f}%)")
-        elif revenue_ttm_yoy > 15:
-            score += 2
-            reasons.append(f"Strong TTM revenue growth (YoY: {revenue_ttm_yoy:.2f}%)")
-        elif revenue_ttm_yoy > 8:
-            score += 1
-            reasons.append(f"Solid TTM revenue growth (YoY: {revenue_ttm_yoy:.2f}%)")
-        elif revenue_ttm_yoy < 0:
-            score -= 1
-            warnings.append(f"Declining TTM revenue (YoY: {revenue_ttm_yoy:.2f}%)")
-
-    # Check for QoQ Revenue Growth
-    revenue_qoq = data.get('revenue_qoq')
-    if revenue_qoq is not None:
-        # Score based on QoQ revenue growth (less weight than YoY)
-        if revenue_qoq > 10:
-            score += 1
-            reasons.append(f"Strong quarterly revenue growth (QoQ: {revenue_qoq:.2f}%)")
-        elif revenue_qoq < -5:
-            score -= 0.5
-            warnings.append(f"Significant quarterly revenue decline (QoQ: {revenue_qoq:.2f}%)")
-
-    # Check for YoY Operating Profit Growth
     op_profit_yoy = data.get('operating_profit_yoy')
-    if op_profit_yoy is not None:
-        # Score based on YoY operating profit growth
-        if op_profit_yoy > 30:
-            score += 3
-            reasons.append(f"Exceptional operating profit growth (YoY: {op_profit_yoy:.2f}%)")
-        elif op_profit_yoy > 20:
-            score += 2
-            reasons.append(f"Strong operating profit growth (YoY: {op_profit_yoy:.2f}%)")
-        elif op_profit_yoy > 10:
-            score += 1
-            reasons.append(f"Solid operating profit growth (YoY: {op_profit_yoy:.2f}%)")
-        elif op_profit_yoy < 0:
-            score -= 1
-            warnings.append(f"Declining operating profit (YoY: {op_profit_yoy:.2f}%)")
-    else:
-        warnings.append("YoY operating profit growth data not available")
-
-    # Check for QoQ Operating Profit Growth
-    op_profit_qoq = data.get('operating_profit_qoq')
-    if op_profit_qoq is not None:
-        # Score based on QoQ operating profit growth (less weight)
-        if op_profit_qoq > 15:
-            score += 1
-            reasons.append(f"Strong quarterly operating profit growth (QoQ: {op_profit_qoq:.2f}%)")
-        elif op_profit_qoq < -10:
-            score -= 0.5
-            warnings.append(f"Significant quarterly operating profit decline (QoQ: {op_profit_qoq:.2f}%)")
-
-    # Check for YoY Net Profit Growth
     net_profit_yoy = data.get('net_profit_yoy')
-    if net_profit_yoy is not None:
-        # Score based on YoY net profit growth
-        if net_profit_yoy > 35:
-            score += 3
-            reasons.append(f"Exceptional net profit growth (YoY: {net_profit_yoy:.2f}%)")
-        elif net_profit_yoy > 25:
-            score += 2
-            reasons.append(f"Strong net profit growth (YoY: {net_profit_yoy:.2f}%)")
-        elif net_profit_yoy > 15:
-            score += 1
-            reasons.append(f"Solid net profit growth (YoY: {net_profit_yoy:.2f}%)")
-        elif net_profit_yoy < 0:
-            score -= 1
-            warnings.append(f"Declining net profit (YoY: {net_profit_yoy:.2f}%)")
-    else:
-        warnings.append("YoY net profit growth data not available")
-
-    # Check for QoQ Net Profit Growth
-    net_profit_qoq = data.get('net_profit_qoq')
-    if net_profit_qoq is not None:
-        # Score based on QoQ net profit growth (less weight)
-        if net_profit_qoq > 15:
-            score += 1
-            reasons.append(f"Strong quarterly net profit growth (QoQ: {net_profit_qoq:.2f}%)")
-        elif net_profit_qoq < -10:
-            score -= 0.5
-            warnings.append(f"Significant quarterly net profit decline (QoQ: {net_profit_qoq:.2f}%)")
 
     # Check for growth consistency
     growth_metrics = [revenue_yoy, op_profit_yoy, net_profit_yoy]
@@ -147,267 +231,326 @@ def analyze_growth_metrics(symbol, data):
         # If all growth metrics are positive, award a consistency bonus
         if all(m > 0 for m in valid_metrics):
             score += 1
-            reasons.append("Consistent positive growth across revenue and profits")
+            reasons.append(('consistent_positive_growth',))
 
         # If profit growth exceeds revenue growth (expanding margins)
         if (op_profit_yoy is not None and revenue_yoy is not None and op_profit_yoy > revenue_yoy) or \
                 (net_profit_yoy is not None and revenue_yoy is not None and net_profit_yoy > revenue_yoy):
             score += 1
-            reasons.append("Expanding profit margins (profit growth exceeds revenue growth)")
+            reasons.append(('expanding_profit_margins',))
 
     return score, reasons, warnings
 
 
-# ----- ENHANCED FUNDAMENTAL ANALYSIS -----
+# ----- SECTOR CLASSIFICATION -----
 
-def analyze_operating_efficiency(symbol, data):
-    """Analyze operating efficiency and profitability metrics"""
-    score = 0
-    reasons = []
-    warnings = []
+FAVORABLE_INDUSTRIES = [
+    'Consumer Staples', 'Consumer Defensive', 'Consumer Goods', 'Utilities',
+    'Insurance', 'Banking', 'Financial Services', 'Financial'
+]
 
-    # Check for profit margin
-    profit_margin = data.get('profit_margin')
-    if profit_margin is not None:
-        if profit_margin > 20:
-            score += 3
-            reasons.append(f"Exceptional profit margin of {profit_margin:.2f}%")
-        elif profit_margin > 15:
-            score += 2
-            reasons.append(f"Strong profit margin of {profit_margin:.2f}%")
-        elif profit_margin > 10:
-            score += 1
-            reasons.append(f"Good profit margin of {profit_margin:.2f}%")
-    else:
-        warnings.append("Profit margin data not available")
-
-    # Check for ROE
-    roe = data.get('roe')
-    if roe is not None:
-        if roe > 20:
-            score += 3
-            reasons.append(f"Exceptional ROE of {roe:.2f}%")
-        elif roe > 15:
-            score += 2
-            reasons.append(f"Strong ROE of {roe:.2f}%")
-        elif roe > 10:
-            score += 1
-            reasons.append(f"Good ROE of {roe:.2f}%")
-    else:
-        warnings.append("ROE data not available")
+MODERATE_INDUSTRIES = [
+    'Healthcare', 'Technology', 'Communication Services', 'Industrial',
+    'Energy', 'Telecom', 'Real Estate', 'Pharmaceutical'
+]
 
-    # Check for ROA if available
-    roa = data.get('returnOnAssets')
-    if roa is not None:
-        roa = roa * 100  # Convert to percentage
-        if roa > 10:
-            score += 2
-            reasons.append(f"Exceptional ROA of {roa:.2f}%")
-        elif roa > 5:
-            score += 1
-            reasons.append(f"Strong ROA of {roa:.2f}%")
+UNFAVORABLE_INDUSTRIES = [
+    'Biotechnology', 'Cryptocurrency', 'Cannabis', 'Airlines', 'Mining',
+    'Oil & Gas E&P', 'Fashion', 'Retail'
+]
 
-    return score, reasons, warnings
+STABLE_REGULATORY_SECTORS = [
+    'Consumer Staples', 'Consumer Goods', 'Insurance', 'Banking', 'Pharmaceutical',
+    'Financial Services', 'Utilities'
+]
 
+CHALLENGING_REGULATORY_SECTORS = [
+    'Healthcare', 'Telecom', 'Energy', 'Banking',
+    'Technology', 'Oil & Gas'
+]
 
-def analyze_financial_health(symbol, data):
-    """Analyze balance sheet strength and financial health"""
-    score = 0
-    reasons = []
-    warnings = []
+INDIA_FAVORABLE_REGULATORY_SECTORS = [
+    'IT Services', 'Technology', 'Consumer Goods', 'Automotive', 'Pharmaceutical'
+]
 
-    # Check for debt-to-equity
-    debt_to_equity = data.get('debt_to_equity')
-    if debt_to_equity is not None:
-        if debt_to_equity < 0.3:
-            score += 3
-            reasons.append(f"Minimal debt-to-equity ratio of {debt_to_equity:.2f}")
-        elif debt_to_equity < 0.5:
-            score += 2
-            reasons.append(f"Low debt-to-equity ratio of {debt_to_equity:.2f}")
-        elif debt_to_equity < 0.7:
-            score += 1
-            reasons.append(f"Moderate debt-to-equity ratio of {debt_to_equity:.2f}")
-        elif debt_to_equity > 1.5:
-            score -= 1
-            warnings.append(f"High debt-to-equity ratio of {debt_to_equity:.2f}")
-    else:
-        warnings.append("Debt-to-equity data not available")
+INDIA_CHALLENGING_REGULATORY_SECTORS = [
+    'Telecom', 'Banking', 'Energy', 'Real Estate'
+]
 
-    # Check for interest coverage ratio if available
-    interest_coverage = data.get('interestCoverageRatio')
-    if interest_coverage is not None:
-        if interest_coverage > 10:
-            score += 2
-            reasons.append(f"Excellent interest coverage ratio of {interest_coverage:.2f}")
-        elif interest_coverage > 5:
-            score += 1
-            reasons.append(f"Strong interest coverage ratio of {interest_coverage:.2f}")
-        elif interest_coverage < 2:
-            score -= 1
-            warnings.append(f"Low interest coverage ratio of {interest_coverage:.2f}")
+RECESSION_RESISTANT_SECTORS = [
+    'Consumer Staples', 'Healthcare', 'Utilities', 'Discount Retail',
+    'Essential Services', 'Consumer Defensive'
+]
 
-    # Check for current ratio if available
-    current_ratio = data.get('currentRatio')
-    if current_ratio is not None:
-        if current_ratio > 2:
-            score += 1
-            reasons.append(f"Strong current ratio of {current_ratio:.2f}")
-        elif current_ratio < 1:
-            score -= 1
-            warnings.append(f"Weak current ratio of {current_ratio:.2f}")
+ECONOMICALLY_SENSITIVE_SECTORS = [
+    'Luxury Goods', 'Travel', 'Hospitality', 'Automotive', 'Construction',
+    'Real Estate', 'Discretionary', 'Industrial', 'Banking'
+]
 
-    # Free Cash Flow analysis
-    fcf = data.get('fcf')
-    if fcf is not None:
-        if fcf > 0:
-            market_cap = data.get('market_cap')
-            if market_cap and market_cap > 0:
-                fcf_yield = (fcf / market_cap) * 100
-                if fcf_yield > 8:
-                    score += 3
-                    reasons.append(f"Excellent FCF yield of {fcf_yield:.2f}%")
-                elif fcf_yield > 5:
-                    score += 2
-                    reasons.append(f"Strong FCF yield of {fcf_yield:.2f}%")
-                elif fcf_yield > 3:
-                    score += 1
-                    reasons.append(f"Positive FCF yield of {fcf_yield:.2f}%")
-            else:
-                score += 1
-                reasons.append("Positive free cash flow")
-    else:
-        warnings.append("Free cash flow data not available")
+NETWORK_EFFECT_SECTORS = [
+    'Technology', 'Social Media', 'Payments', 'E-commerce', 'Telecom',
+    'Software', 'IT Services', 'Platform'
+]
 
-    return score, reasons, warnings
+BRAND_MOAT_SECTORS = [
+    'Consumer Goods', 'Luxury', 'FMCG', 'Automotive', 'Consumer Defensive',
+    'Beverages', 'Fast Food', 'Retail'
+]
 
+SWITCHING_COST_SECTORS = [
+    'Banking', 'Enterprise Software', 'Insurance', 'Financial Services',
+    'Healthcare', 'IT Services'
+]
 
-def analyze_industry_dynamics(symbol, data):
-    sector = data.get('sector', 'Unknown')
+# Classification per (sector, exchange); the universe only has a few dozen distinct sectors
+_sector_classifications = {}
 
-    favorable_industries = [
-        'Consumer Staples', 'Consumer Defensive', 'Consumer Goods', 'Utilities',
-        'Insurance', 'Banking', 'Financial Services', 'Financial'
-    ]
 
-    moderate_industries = [
-        'Healthcare', 'Technology', 'Communication Services', 'Industrial',
-        'Energy', 'Telecom', 'Real Estate', 'Pharmaceutical'
-    ]
+def symbol_exchange(symbol):
+    """Exchange a symbol trades on, as used by the sector classification"""
+    return 'NSE' if '.NS' in symbol else 'OTHER'
 
-    unfavorable_industries = [
-        'Biotechnology', 'Cryptocurrency', 'Cannabis', 'Airlines', 'Mining',
-        'Oil & Gas E&P', 'Fashion', 'Retail'
-    ]
 
-    high_concentration_keywords = [
-        'monopoly', 'duopoly', 'market leader', 'dominant', 'leading'
-    ]
+def _first_match(sector, groups):
+    """Label of the first group whose keywords appear in the sector, or None"""
+    for label, keywords in groups:
+        if any(keyword in sector for keyword in keywords):
+            return label
+    return None
 
-    if any(ind in sector for ind in favorable_industries):
-        score = 2
-        reason = f"Industry with stable cash flows and high entry barriers: {sector}"
-    elif any(ind in sector for ind in moderate_industries):
-        score = 1
-        reason = f"Industry with moderate business stability: {sector}"
-    elif any(ind in sector for ind in unfavorable_industries):
-        score = -1
-        reason = f"Industry that Buffett typically avoids: {sector}"
-    else:
-        score = 0
-        reason = f"Neutral industry assessment: {sector}"
 
-    company_name = data.get('name', '')
-    company_desc = data.get('longBusinessSummary', '')
+def classify_sector(sector, exchange):
+    """Classify a sector for the qualitative analyzers, computed once per (sector, exchange)"""
+    key = (sector, exchange)
+    if key not in _sector_classifications:
+        if exchange == 'NSE':
+            regulatory = _first_match(sector, [('india_favorable', INDIA_FAVORABLE_REGULATORY_SECTORS),
+                                               ('india_challenging', INDIA_CHALLENGING_REGULATORY_SECTORS)])
+        else:
+            regulatory = _first_match(sector, [('stable', STABLE_REGULATORY_SECTORS),
+                                               ('challenging', CHALLENGING_REGULATORY_SECTORS)])
+
+        _sector_classifications[key] = {
+            'industry': _first_match(sector, [('favorable', FAVORABLE_INDUSTRIES),
+                                              ('moderate', MODERATE_INDUSTRIES),
+                                              ('unfavorable', UNFAVORABLE_INDUSTRIES)]),
+            'regulatory': regulatory,
+            'macro': _first_match(sector, [('recession_resistant', RECESSION_RESISTANT_SECTORS),
+                                           ('economically_sensitive', ECONOMICALLY_SENSITIVE_SECTORS)]),
+            'network_effects': any(s in sector for s in NETWORK_EFFECT_SECTORS),
+            'brand_moat': any(s in sector for s in BRAND_MOAT_SECTORS),
+            'switching_costs': any(s in sector for s in SWITCHING_COST_SECTORS)
+        }
+    return _sector_classifications[key]
 
-    if company_desc and any(
-            keyword in (company_name + company_desc).lower() for keyword in high_concentration_keywords):
-        score += 1
-        reason += ". Appears to have strong market position"
 
-    return score, reason
+# ----- BUSINESS SUMMARY KEYWORDS -----
 
+HIGH_CONCENTRATION_KEYWORDS = [
+    'monopoly', 'duopoly', 'market leader', 'dominant', 'leading'
+]
 
-def analyze_regulatory_environment(symbol, data):
-    sector = data.get('sector', 'Unknown')
+STRONG_MOAT_COMPANIES = [
+    'HDFC Bank', 'Asian Paints', 'Hindustan Unilever', 'Nestlé India',
+    'Bajaj Finance', 'TCS', 'Titan Company', 'ITC', 'Britannia',
+    'Page Industries', 'Pidilite Industries'
+]
 
-    stable_regulatory_sectors = [
-        'Consumer Staples', 'Consumer Goods', 'Insurance', 'Banking', 'Pharmaceutical'
-                                                                      'Financial Services', 'Utilities'
-    ]
+MOAT_KEYWORDS = {
+    'brand': ['brand', 'premium', 'loyalty', 'trusted', 'heritage'],
+    'network': ['network effect', 'platform', 'marketplace', 'ecosystem'],
+    'switching': ['switching cost', 'customer lock-in', 'retention', 'stickiness'],
+    'cost': ['low cost', 'scale advantage', 'efficient', 'market share']
+}
 
-    challenging_regulatory_sectors = [
-        'Healthcare', 'Telecom', 'Energy', 'Banking',
-        'Technology', 'Oil & Gas'
-    ]
 
-    if '.NS' in symbol:
-        india_favorable_sectors = [
-            'IT Services', 'Technology', 'Consumer Goods', 'Automotive', 'Pharmaceutical'
-        ]
-
-        india_challenging_sectors = [
-            'Telecom', 'Banking', 'Energy', 'Real Estate'
-        ]
-
-        if any(ind in sector for ind in india_favorable_sectors):
-            score = 1
-            reason = f"Favorable regulatory environment in India for {sector}"
-        elif any(ind in sector for ind in india_challenging_sectors):
-            score = -1
-            reason = f"Challenging regulatory environment in India for {sector}"
-        else:
-            score = 0
-            reason = "Neutral regulatory assessment"
-    else:
-        if any(ind in sector for ind in stable_regulatory_sectors):
-            score = 1
-            reason = f"Generally stable regulatory environment for {sector}"
-        elif any(ind in sector for ind in challenging_regulatory_sectors):
-            score = -1
-            reason = f"Often faces regulatory challenges in {sector}"
-        else:
-            score = 0
-            reason = "Neutral regulatory assessment"
+def _compile_keyword_matcher():
+    """Compile every summary keyword into one regex and map each keyword to its categories.
 
-    return score, reason
+    The alternation sits in a lookahead so overlapping hits are all reported. At a given position
+    only the longest alternative is returned, so each keyword also credits the keywords that are
+    its prefixes.
+    """
+    categories = defaultdict(set)
+    for keyword in HIGH_CONCENTRATION_KEYWORDS:
+        categories[keyword.lower()].add(('concentration', None))
+    for index, company in enumerate(STRONG_MOAT_COMPANIES):
+        categories[company.lower()].add(('company', index))
+    for moat_type, keywords in MOAT_KEYWORDS.items():
+        for keyword in keywords:
+            categories[keyword.lower()].add(('moat', moat_type))
 
+    keywords = sorted(categories, key=len, reverse=True)
+    credits = {keyword: [(prefix, categories[prefix]) for prefix in keywords if keyword.startswith(prefix)]
+               for keyword in keywords}
+    pattern = re.compile('(?=(' + '|'.join(re.escape(keyword) for keyword in keywords) + '))')
+    return pattern, credits
 
-def analyze_macroeconomic_factors(symbol, data):
+
+_keyword_pattern, _keyword_credits = _compile_keyword_matcher()
+_summary_keyword_hits = {}
+
+
+def _credit_rows(credits):
+    """A keyword's credits as (kind, value, length) rows for scan_business_summaries.
+
+    kind 0 is a concentration keyword, 1 a moat company (value is its STRONG_MOAT_COMPANIES
+    index) and 2 a moat keyword (value is the position of its category in MOAT_KEYWORDS).
+    """
+    moat_type_index = {moat_type: index for index, moat_type in enumerate(MOAT_KEYWORDS)}
+    rows = []
+    for prefix, hits in credits:
+        for category, value in hits:
+            if category == 'concentration':
+                rows.append((0, 0, len(prefix)))
+            elif category == 'company':
+                rows.append((1, value, len(prefix)))
+            else:
+                rows.append((2, moat_type_index[value], len(prefix)))
+    return rows
+
+
+_keyword_credit_rows = {keyword: _credit_rows(credits) for keyword, credits in _keyword_credits.items()}
+
+
+def scan_business_summary(name, summary):
+    """Find the summary keyword hits for a company in one pass over its lowercased name and summary.
+
+    Returns a dict with 'concentration' (a high concentration keyword anywhere in name + summary),
+    'strong_moat_company' (the first known moat company found in the name, or None) and
+    'moat_types' (moat keyword categories found in the summary, in MOAT_KEYWORDS order). Results
+    are cached by a hash of the text.
+    """
+    name = (name or '').lower()
+    summary = (summary or '').lower()
+    key = hashlib.sha1(f"{name}\0{summary}".encode('utf-8')).hexdigest()
+    if key in _summary_keyword_hits:
+        return _summary_keyword_hits[key]
+
+    name_length = len(name)
+    concentration = False
+    company_indexes = []
+    moat_types = set()
+    for match in _keyword_pattern.finditer(name + summary):
+        start = match.start()
+        for keyword, hits in _keyword_credits[match.group(1)]:
+            end = start + len(keyword)
+            for category, value in hits:
+                if category == 'concentration':
+                    concentration = True
+                elif category == 'company' and end <= name_length:
+                    company_indexes.append(value)
+                elif category == 'moat' and start >= name_length:
+                    moat_types.add(value)
+
+    result = {
+        'concentration': concentration,
+        'strong_moat_company': STRONG_MOAT_COMPANIES[min(company_indexes)] if company_indexes else None,
+        'moat_types': [moat_type for moat_type in MOAT_KEYWORDS if moat_type in moat_types]
+    }
+    _summary_keyword_hits[key] = result
+    return result
+
+
+def scan_business_summaries(names, summaries):
+    """Summary keyword hits of many companies as boolean columns, the batch form of scan_business_summary.
+
+    The compiled matcher runs once over all lowercased names and summaries joined with a
+    separator no keyword contains, and each hit is assigned to its company by its offset.
+    Returns 'concentration' and 'strong_moat_company' (bool per company) and 'moat_types'
+    (bool per company and MOAT_KEYWORDS category).
+    """
+    names = [(name or '').lower() for name in names]
+    texts = [name + (summary or '').lower() for name, summary in zip(names, summaries)]
+    name_lengths = np.array([len(name) for name in names], dtype=np.int64)
+    text_starts = np.cumsum([0] + [len(text) + 1 for text in texts])[:-1]
+
+    concentration = np.zeros(len(texts), dtype=bool)
+    strong_moat_company = np.zeros(len(texts), dtype=bool)
+    moat_types = np.zeros((len(texts), len(MOAT_KEYWORDS)), dtype=bool)
+
+    matches = [(match.start(), match.group(1)) for match in _keyword_pattern.finditer('\0'.join(texts))]
+    if not matches:
+        return {'concentration': concentration, 'strong_moat_company': strong_moat_company, 'moat_types': moat_types}
+
+    credits = [_keyword_credit_rows[keyword] for _, keyword in matches]
+    kind, value, length = np.array([row for rows in credits for row in rows], dtype=np.int64).reshape(-1, 3).T
+    starts = np.repeat([start for start, _ in matches], [len(rows) for rows in credits])
+    rows = np.searchsorted(text_starts, starts, side='right') - 1
+    offsets = starts - text_starts[rows]
+
+    concentration[rows[kind == 0]] = True
+    # Companies count only when named in the company name, moat keywords only in the summary
+    strong_moat_company[rows[(kind == 1) & (offsets + length <= name_lengths[rows])]] = True
+    in_summary = (kind == 2) & (offsets >= name_lengths[rows])
+    moat_types[rows[in_summary], value[in_summary]] = True
+    return {'concentration': concentration, 'strong_moat_company': strong_moat_company, 'moat_types': moat_types}
+
+
+# Score and reason code per classification label
+# Score, reason code and reason code for a company that also has a strong market position
+INDUSTRY_OUTCOMES = {
+    'favorable': (2, 'favorable_industry', 'favorable_industry_strong_position'),
+    'moderate': (1, 'moderate_industry', 'moderate_industry_strong_position'),
+    'unfavorable': (-1, 'unfavorable_industry', 'unfavorable_industry_strong_position'),
+    None: (0, 'neutral_industry', 'neutral_industry_strong_position')
+}
+
+REGULATORY_OUTCOMES = {
+    'india_favorable': (1, 'favorable_regulation_india'),
+    'india_challenging': (-1, 'challenging_regulation_india'),
+    'stable': (1, 'stable_regulation'),
+    'challenging': (-1, 'challenging_regulation'),
+    None: (0, 'neutral_regulation')
+}
+
+MACRO_OUTCOMES = {
+    'NSE': {
+        'recession_resistant': (2, 'recession_resistant_india'),
+        'economically_sensitive': (0, 'economically_sensitive_india'),
+        None: (1, 'neutral_macro_india')
+    },
+    'OTHER': {
+        'recession_resistant': (1, 'recession_resistant'),
+        'economically_sensitive': (-1, 'economically_sensitive'),
+        None: (0, 'neutral_macro')
+    }
+}
+
+
+def analyze_industry_dynamics(symbol, data):
     sector = data.get('sector', 'Unknown')
+    classification = classify_sector(sector, symbol_exchange(symbol))
 
-    recession_resistant_sectors = [
-        'Consumer Staples', 'Healthcare', 'Utilities', 'Discount Retail',
-        'Essential Services', 'Consumer Defensive'
-    ]
+    score, code, strong_position_code = INDUSTRY_OUTCOMES[classification['industry']]
 
-    economically_sensitive_sectors = [
-        'Luxury Goods', 'Travel', 'Hospitality', 'Automotive', 'Construction',
-        'Real Estate', 'Discretionary', 'Industrial', 'Banking'
-    ]
+    company_name = data.get('name', '')
+    company_desc = data.get('longBusinessSummary', '')
 
-    if '.NS' in symbol:
-        if any(ind in sector for ind in recession_resistant_sectors):
-            score = 2
-            reason = f"Recession-resistant sector in fast-growing Indian economy: {sector}"
-        elif any(ind in sector for ind in economically_sensitive_sectors):
-            score = 0
-            reason = f"Economically sensitive but benefits from India's growth: {sector}"
-        else:
-            score = 1
-            reason = f"Neutral macroeconomic assessment in Indian context"
-    else:
-        if any(ind in sector for ind in recession_resistant_sectors):
-            score = 1
-            reason = f"Business relatively resistant to economic downturns: {sector}"
-        elif any(ind in sector for ind in economically_sensitive_sectors):
-            score = -1
-            reason = f"Business sensitive to economic cycles: {sector}"
-        else:
-            score = 0
-            reason = "Neutral macroeconomic assessment"
+    if company_desc and scan_business_summary(company_name, company_desc)['concentration']:
+        return score + 1, (strong_position_code, sector)
+    return score, (code, sector)
 
-    return score, reason
+
+def analyze_regulatory_environment(symbol, data):
+    sector = data.get('sector', 'Unknown')
+    classification = classify_sector(sector, symbol_exchange(symbol))
+
+    score, code = REGULATORY_OUTCOMES[classification['regulatory']]
+    if classification['regulatory'] is None:
+        return score, (code,)
+    return score, (code, sector)
+
+
+def analyze_macroeconomic_factors(symbol, data):
+    sector = data.get('sector', 'Unknown')
+    exchange = symbol_exchange(symbol)
+    classification = classify_sector(sector, exchange)
+
+    score, code = MACRO_OUTCOMES[exchange][classification['macro']]
+    if classification['macro'] is None:
+        return score, (code,)
+    return score, (code, sector)
 
 
 def analyze_economic_moat(symbol, data):
@@ -415,192 +558,69 @@ def analyze_economic_moat(symbol, data):
     sector = data.get('sector', 'Unknown')
     profit_margin = data.get('profit_margin', 0) or 0
     roe = data.get('roe', 0) or 0
-    company_desc = data.get('longBusinessSummary', '').lower() if data.get('longBusinessSummary') else ''
+    classification = classify_sector(sector, symbol_exchange(symbol))
+    keyword_hits = scan_business_summary(name, data.get('longBusinessSummary'))
 
     high_margin = profit_margin > 20
     exceptional_roe = roe > 25
 
-    network_effect_sectors = [
-        'Technology', 'Social Media', 'Payments', 'E-commerce', 'Telecom',
-        'Software', 'IT Services', 'Platform'
-    ]
-
-    brand_moat_sectors = [
-        'Consumer Goods', 'Luxury', 'FMCG', 'Automotive', 'Consumer Defensive',
-        'Beverages', 'Fast Food', 'Retail'
-    ]
-
-    switching_cost_sectors = [
-        'Banking', 'Enterprise Software', 'Insurance', 'Financial Services',
-        'Healthcare', 'IT Services'
-    ]
-
-    strong_moat_companies = [
-        'HDFC Bank', 'Asian Paints', 'Hindustan Unilever', 'Nestlé India',
-        'Bajaj Finance', 'TCS', 'Titan Company', 'ITC', 'Britannia',
-        'Page Industries', 'Pidilite Industries'
-    ]
-
-    moat_keywords = {
-        'brand': ['brand', 'premium', 'loyalty', 'trusted', 'heritage'],
-        'network': ['network effect', 'platform', 'marketplace', 'ecosystem'],
-        'switching': ['switching cost', 'customer lock-in', 'retention', 'stickiness'],
-        'cost': ['low cost', 'scale advantage', 'efficient', 'market share']
-    }
-
     score = 0
     moat_types = []
 
-    for company in strong_moat_companies:
-        if company.lower() in name.lower():
-            score += 2
-            moat_types.append(f"Known for strong historical moat ({company})")
-            break
+    if keyword_hits['strong_moat_company']:
+        score += 2
+        moat_types.append(('known_historical_moat', keyword_hits['strong_moat_company']))
 
-    if any(s in sector for s in network_effect_sectors):
+    if classification['network_effects']:
         score += 1
-        moat_types.append(f"Sector with potential network effects ({sector})")
+        moat_types.append(('sector_network_effects', sector))
 
-    if any(s in sector for s in brand_moat_sectors):
+    if classification['brand_moat']:
         score += 1
-        moat_types.append(f"Sector with potential brand moat ({sector})")
+        moat_types.append(('sector_brand_moat', sector))
 
-    if any(s in sector for s in switching_cost_sectors):
+    if classification['switching_costs']:
         score += 1
-        moat_types.append(f"Sector with potential switching costs ({sector})")
+        moat_types.append(('sector_switching_costs', sector))
 
     if high_margin:
         score += 1
-        moat_types.append(f"High profit margin ({profit_margin:.1f}%) suggests pricing power")
+        moat_types.append(('pricing_power_margin', profit_margin))
 
     if exceptional_roe:
         score += 1
-        moat_types.append(f"Exceptional ROE ({roe:.1f}%) indicates sustainable competitive advantage")
+        moat_types.append(('competitive_advantage_roe', roe))
 
-    for moat_type, keywords in moat_keywords.items():
-        if any(keyword in company_desc for keyword in keywords):
-            score += 0.5
-            moat_types.append(f"Potential {moat_type} advantage indicated")
+    for moat_type in keyword_hits['moat_types']:
+        score += 0.5
+        moat_types.append(('potential_moat_advantage', moat_type))
 
     score = min(score, 4)
 
     if not moat_types:
-        moat_types.append("No clear economic moat identified")
+        moat_types.append(('no_clear_moat',))
 
-    return score, ", ".join(moat_types)
-
-
-def analyze_valuation(symbol, data):
-    """Analyze valuation metrics"""
-    score = 0
-    reasons = []
-    warnings = []
-
-    # P/E Ratio analysis
-    pe_ratio = data.get('pe_ratio')
-    if pe_ratio is not None and pe_ratio > 0:
-        if pe_ratio < 15:
-            score += 3
-            reasons.append(f"Attractive P/E ratio of {pe_ratio:.2f}")
-        elif pe_ratio < 20:
-            score += 2
-            reasons.append(f"Reasonable P/E ratio of {pe_ratio:.2f}")
-        elif pe_ratio < 25:
-            score += 1
-            reasons.append(f"Acceptable P/E ratio of {pe_ratio:.2f}")
-        elif pe_ratio > 30:
-            score -= 1
-            warnings.append(f"High P/E ratio of {pe_ratio:.2f}")
-    else:
-        warnings.append("P/E ratio data not available")
-
-    # P/B Ratio analysis
-    pb_ratio = data.get('pb_ratio')
-    if pb_ratio is not None and pb_ratio > 0:
-        sector = data.get('sector', 'Unknown')
-        is_financial = any(s in sector for s in ['Bank', 'Financial', 'Insurance'])
-
-        threshold = 2 if is_financial else 3
-        if pb_ratio < threshold * 0.5:
-            score += 2
-            reasons.append(f"Very attractive P/B ratio of {pb_ratio:.2f}")
-        elif pb_ratio < threshold:
-            score += 1
-            reasons.append(f"Reasonable P/B ratio of {pb_ratio:.2f}")
-        elif pb_ratio > threshold * 2:
-            score -= 1
-            warnings.append(f"High P/B ratio of {pb_ratio:.2f}")
-
-    # Intrinsic value and margin of safety
-    intrinsic_value = data.get('intrinsic_value')
-    current_price = data.get('current_price')
-    margin_of_safety = data.get('margin_of_safety')
-
-    if intrinsic_value is not None and current_price is not None and intrinsic_value > 0:
-        if margin_of_safety is None:
-            margin_of_safety = ((
-                                            intrinsic_value - current_price) / intrinsic_value) * 100 if current_price < intrinsic_value else 0
-
-        if margin_of_safety > 40:
-            score += 4
-            reasons.append(f"Huge margin of safety: {margin_of_safety:.2f}%")
-        elif margin_of_safety > 30:
-            score += 3
-            reasons.append(f"Substantial margin of safety: {margin_of_safety:.2f}%")
-        elif margin_of_safety > 20:
-            score += 2
-            reasons.append(f"Good margin of safety: {margin_of_safety:.2f}%")
-        elif margin_of_safety > 10:
-            score += 1
-            reasons.append(f"Some margin of safety: {margin_of_safety:.2f}%")
-        elif margin_of_safety < 0:
-            score -= 1
-            warnings.append(f"No margin of safety, stock may be overvalued by {-margin_of_safety:.2f}%")
-    else:
-        warnings.append("Intrinsic value calculation not available")
-
-    # Dividend yield if available
-    dividend_yield = data.get('dividendYield')
-    if dividend_yield is not None and dividend_yield > 0:
-        if dividend_yield > 4:
-            score += 2
-            reasons.append(f"High dividend yield of {dividend_yield:.2f}%")
-        elif dividend_yield > 2:
-            score += 1
-            reasons.append(f"Good dividend yield of {dividend_yield:.2f}%")
-
-    return score, reasons, warnings
+    return score, ('join', ', ', *moat_types)
 
 
 # ----- TECHNICAL INDICATORS ANALYSIS -----
 
-def analyze_technical_indicators(symbol, data):
-    """Analyze technical indicators when available"""
-    score = 0
-    reasons = []
-    warnings = []
+def analyze_technical_indicators(symbol, data, indicator_rules=(0, [], [])):
+    """Analyze technical indicators when price history is available.
+
+    RSI is scored by the rules; their (score, reasons, warnings) for the technical_indicators
+    section are passed in and listed before the moving average and MACD checks.
+    """
+    score, reasons, warnings = indicator_rules
+    reasons = list(reasons)
+    warnings = list(warnings)
 
     # Check if technical data is available
     price_history_available = data.get('price_history_available', False)
     if not price_history_available:
-        warnings.append("Technical analysis skipped - price history not available")
+        warnings.append(('technical_analysis_skipped_no_price_history',))
         return score, reasons, warnings
 
-    # RSI Analysis
-    rsi = data.get('rsi')
-    if rsi is not None:
-        if rsi < 30:
-            score += 2
-            reasons.append(f"Oversold RSI ({rsi:.2f}) suggests potential buying opportunity")
-        elif rsi < 40:
-            score += 1
-            reasons.append(f"RSI ({rsi:.2f}) indicates potential undervaluation")
-        elif rsi > 70:
-            score -= 1
-            reasons.append(f"Overbought RSI ({rsi:.2f}) suggests potential overvaluation")
-    else:
-        warnings.append("RSI data not available")
-
     # Moving Average Analysis
     ma_50 = data.get('ma_50')
     ma_200 = data.get('ma_200')
@@ -610,29 +630,29 @@ def analyze_technical_indicators(symbol, data):
         # Golden Cross / Death Cross
         if ma_50 > ma_200:
             score += 1
-            reasons.append(f"Golden Cross pattern (50-day MA above 200-day MA) indicates bullish trend")
+            reasons.append(('golden_cross',))
         elif ma_50 < ma_200:
             score -= 1
-            reasons.append(f"Death Cross pattern (50-day MA below 200-day MA) indicates bearish trend")
+            reasons.append(('death_cross',))
 
         # Current price relative to MAs
         if current_price is not None:
             if current_price > ma_50 and current_price > ma_200:
                 score += 1
-                reasons.append(f"Price above both 50-day and 200-day moving averages, suggesting bullish trend")
+                reasons.append(('price_above_both_moving_averages',))
             elif current_price < ma_50 and current_price < ma_200:
                 score -= 1
-                reasons.append(f"Price below both 50-day and 200-day moving averages, suggesting bearish trend")
+                reasons.append(('price_below_both_moving_averages',))
     elif ma_50 is not None:
         if current_price is not None:
             if current_price > ma_50:
                 score += 0.5
-                reasons.append(f"Price above 50-day moving average, suggesting near-term bullish trend")
+                reasons.append(('price_above_50_day_average',))
             else:
                 score -= 0.5
-                reasons.append(f"Price below 50-day moving average, suggesting near-term bearish trend")
+                reasons.append(('price_below_50_day_average',))
     else:
-        warnings.append("Moving average data not available")
+        warnings.append(('moving_averages_unavailable',))
 
     # MACD Analysis
     macd_line = data.get('macd_line')
@@ -642,27 +662,58 @@ def analyze_technical_indicators(symbol, data):
     if macd_line is not None and macd_signal is not None:
         if macd_line > macd_signal and macd_histogram > 0:
             score += 2
-            reasons.append(f"Bullish MACD crossover (MACD Line above Signal Line)")
+            reasons.append(('bullish_macd_crossover',))
         elif macd_line < macd_signal and macd_histogram < 0:
             score -= 1
-            reasons.append(f"Bearish MACD crossover (MACD Line below Signal Line)")
+            reasons.append(('bearish_macd_crossover',))
     else:
-        warnings.append("MACD data not available")
+        warnings.append(('macd_unavailable',))
 
     return score, reasons, warnings
 
 
 # ----- SECTOR PERFORMANCE ANALYSIS -----
 
-def analyze_sector_performance(symbol, data, all_stocks_data):
-    """Compare stock against sector averages using consistently available metrics"""
+def normalize_debt_to_equity(debt_to_equity):
+    """Convert debt-to-equity reported as a percentage into a ratio"""
+    if debt_to_equity and debt_to_equity > 3:
+        return debt_to_equity / 100
+    return debt_to_equity
+
+
+def normalize_stock_data(stock_data):
+    """Build the normalized view of a snapshot that the analyzers read from.
+
+    Returns a new dict of new records; stock_data itself is never modified. Debt-to-equity
+    reported as a percentage is converted to a ratio here, once, instead of inside the analysis.
+    """
+    normalized = {}
+    for symbol, data in stock_data.items():
+        record = dict(data)
+        if 'error' not in record and record.get('debt_to_equity'):
+            record['debt_to_equity'] = normalize_debt_to_equity(record['debt_to_equity'])
+        normalized[symbol] = record
+    return normalized
+
+
+def build_analysis_sector_index(stock_data):
+    """Build the sector aggregate index over the normalized view of a raw snapshot"""
+    return build_sector_index(normalize_stock_data(stock_data))
+
+
+def analyze_sector_performance(symbol, data, all_stocks_data, sector_index=None):
+    """Compare stock against sector averages using consistently available metrics.
+
+    Sector aggregates come from sector_index (see build_sector_index); when it is not given, one is
+    built from all_stocks_data, so callers scoring many stocks should build it once and pass it in.
+    """
     score = 0
     reasons = []
     warnings = []
 
     sector = data.get('sector', 'Unknown')
     if sector == 'Unknown':
-        warnings.append("Unable to perform sector analysis: sector information missing")
+        warnings.append(('sector_unknown',))
         return score, reasons, warnings
 
     # Only use consistently available metrics
@@ -673,16 +724,11 @@ def analyze_sector_performance(symbol, data, all_stocks_data):
         'revenue_yoy': {'higher_better': True, 'name': 'Revenue Growth (YoY)'}
     }
 
-    # Collect sector peers
-    sector_stocks = {}
-    for sym, stock_data in all_stocks_data.items():
-        if 'error' in stock_data:
-            continue
-        if stock_data.get('sector') == sector and sym != symbol:
-            sector_stocks[sym] = stock_data
+    if sector_index is None:
+        sector_index = build_analysis_sector_index(all_stocks_data)
 
-    if len(sector_stocks) < 2:
-        warnings.append(f"Not enough peers in {sector} sector for comparison")
+    if count_sector_peers(sector_index, symbol, sector) < 2:
+        warnings.append(('not_enough_sector_peers', sector))
         return score, reasons, warnings
 
     # Compare across available metrics
@@ -694,16 +740,14 @@ def analyze_sector_performance(symbol, data, all_stocks_data):
         if metric not in data or data[metric] is None:
             continue
 
-        # Get peer values for this metric
-        peer_values = [s[metric] for s in sector_stocks.values()
-                       if metric in s and s[metric] is not None]
+        # Get peer aggregates for this metric (excluding the stock itself)
+        peer_stats = sector_peer_stats(sector_index, symbol, sector, metric)
 
-        if len(peer_values) < 2:
+        if peer_stats is None or peer_stats['count'] < 2:
             continue
 
         # Calculate sector average
-        sector_avg = sum(peer_values) / len(peer_values)
-        data[f'sector_avg_{metric}'] = sector_avg
+        sector_avg = peer_stats['mean']
 
         # Compare performance
         total_metrics_compared += 1
@@ -713,452 +757,622 @@ def analyze_sector_performance(symbol, data, all_stocks_data):
         if props['higher_better'] and performance_ratio > 1.2:
             score += 1
             outperformance_count += 1
-            reasons.append(
-                f"Superior {props['name']} ({data[metric]:.2f}) compared to sector average ({sector_avg:.2f})")
+            reasons.append(('superior_to_sector_average', props['name'], data[metric], sector_avg))
 
         # For metrics where lower is better
         elif not props['higher_better'] and performance_ratio < 0.8:
             score += 1
             outperformance_count += 1
-            reasons.append(
-                f"Superior {props['name']} ({data[metric]:.2f}) compared to sector average ({sector_avg:.2f})")
+            reasons.append(('superior_to_sector_average', props['name'], data[metric], sector_avg))
 
     # If we compared at least 2 metrics
     if total_metrics_compared >= 2:
         if outperformance_count == total_metrics_compared:
             score += 1  # Bonus for outperforming in all metrics
-            reasons.append(f"Outperforms sector in all {total_metrics_compared} key metrics")
+            reasons.append(('outperforms_sector_on_all_metrics', total_metrics_compared))
     else:
-        warnings.append(f"Limited sector comparison: only {total_metrics_compared} metrics available")
+        warnings.append(('limited_sector_comparison', total_metrics_compared))
 
     return score, reasons, warnings
 
 
-# ----- OWNERSHIP ANALYSIS -----
+# ----- DATA COVERAGE -----
 
-def analyze_ownership_patterns(symbol, data):
-    """Analyze ownership patterns if data is available"""
-    score = 0
-    reasons = []
-    warnings = []
+def analyze_ownership_coverage(symbol, data):
+    """Warning when there is no shareholding data for the ownership rules"""
+    if not data.get('shareholding_data_available', False):
+        return 0, [], [('ownership_analysis_skipped_no_shareholding_data',)]
+    return 0, [], []
 
-    # Check if shareholding data is available
-    shareholding_data_available = data.get('shareholding_data_available', False)
-    if not shareholding_data_available:
-        warnings.append("Ownership analysis skipped - shareholding data not available")
-        return score, reasons, warnings
 
-    # Promoter holdings analysis
-    promoter_holding = data.get('promoterHolding')
-    if promoter_holding is not None:
-        if promoter_holding > 50:
-            score += 2
-            reasons.append(f"Strong promoter commitment with {promoter_holding:.2f}% holding")
-        elif promoter_holding > 30:
-            score += 1
-            reasons.append(f"Significant promoter holding of {promoter_holding:.2f}%")
+def analyze_corporate_actions_coverage(symbol, data):
+    """Warning when the corporate action rules had neither corporate action data nor a dividend yield"""
+    if not data.get('corporate_actions_available', False) and data.get('dividendYield') is None:
+        return 0, [], [('corporate_actions_data_limited',)]
+    return 0, [], []
 
-    # Changes in holdings
-    promoter_change = data.get('promoterHoldingChange')
-    if promoter_change is not None:
-        if promoter_change > 2:
-            score += 2
-            reasons.append(f"Recent promoter buying (+{promoter_change:.2f}%)")
-        elif promoter_change > 0.5:
-            score += 1
-            reasons.append(f"Modest increase in promoter holding (+{promoter_change:.2f}%)")
-        elif promoter_change < -2:
-            score -= 2
-            warnings.append(f"Significant promoter selling ({promoter_change:.2f}%)")
-        elif promoter_change < -0.5:
-            score -= 1
-            warnings.append(f"Recent promoter selling ({promoter_change:.2f}%)")
 
-    # Institutional holdings
-    fii_holding = data.get('fiiHolding')
-    dii_holding = data.get('diiHolding')
+# ----- INTRINSIC VALUE CALCULATION -----
 
-    if fii_holding is not None and dii_holding is not None:
-        total_institutional = fii_holding + dii_holding
-        if total_institutional > 45:
-            score += 1
-            reasons.append(f"Strong institutional interest ({total_institutional:.2f}% total holding)")
+def valuation_at(valuations, row):
+    """One stock's valuation methods dict and the engine's median across them (None without any)"""
+    median = valuations['median'][row]
+    return valuation_methods_at(valuations, row), None if np.isnan(median) else float(median)
 
-    # Changes in institutional holdings
-    fii_change = data.get('fiiHoldingChange')
-    dii_change = data.get('diiHoldingChange')
 
-    if fii_change is not None and dii_change is not None:
-        combined_change = fii_change + dii_change
-        if combined_change > 3:
-            score += 1
-            reasons.append(f"Strong institutional buying (+{combined_change:.2f}%)")
-        elif combined_change < -3:
-            score -= 1
-            warnings.append(f"Significant institutional selling ({combined_change:.2f}%)")
+def calculate_intrinsic_value_alternative(data):
+    """Calculate intrinsic value using alternative methods based on available data"""
+    return valuation_at(compute_valuation_methods(build_valuation_inputs([data])), 0)
 
-    return score, reasons, warnings
 
+def calculate_final_intrinsic_value(data, alternative_methods, methods_median):
+    """Calculate final intrinsic value based on available methods.
 
-# ----- DIVIDEND AND CORPORATE ACTIONS ANALYSIS -----
+    methods_median is the valuation engine's median across the methods (the median rather than
+    the mean avoids outliers).
+    """
+    intrinsic_value = data.get('intrinsic_value', 0)
 
-def analyze_corporate_actions(symbol, data):
-    """Analyze dividends and other corporate actions if available"""
-    score = 0
-    reasons = []
-    warnings = []
+    if not intrinsic_value or intrinsic_value == 0:
+        if alternative_methods:
+            if methods_median is not None:
+                intrinsic_value = methods_median
 
-    # Check dividend yield
-    dividend_yield = data.get('dividendYield')
-    if dividend_yield is not None and dividend_yield > 0:
-        sector = data.get('sector', 'Unknown')
-        is_high_yield_sector = any(s in sector for s in ['Utility', 'REIT', 'Energy'])
+                current_price = data.get('current_price', 0) or 0
+                if current_price > 0 and intrinsic_value > current_price:
+                    margin_of_safety = ((intrinsic_value - current_price) / intrinsic_value) * 100
+                else:
+                    margin_of_safety = 0
 
-        threshold = 4 if is_high_yield_sector else 2
-        if dividend_yield > threshold * 1.5:
-            score += 2
-            reasons.append(f"Excellent dividend yield of {dividend_yield:.2f}%")
-        elif dividend_yield > threshold:
-            score += 1
-            reasons.append(f"Good dividend yield of {dividend_yield:.2f}%")
+                return intrinsic_value, margin_of_safety, alternative_methods
 
-    # Check payout ratio
-    payout_ratio = data.get('payoutRatio')
-    if payout_ratio is not None:
-        if 30 <= payout_ratio <= 60:
-            score += 1
-            reasons.append(f"Healthy dividend payout ratio of {payout_ratio:.2f}%")
-        elif payout_ratio > 80:
-            score -= 1
-            warnings.append(f"High payout ratio of {payout_ratio:.2f}% may be unsustainable")
+    return intrinsic_value, data.get('margin_of_safety', 0), alternative_methods
 
-    # Check for buybacks
-    has_recent_buyback = data.get('hasRecentBuyback', False)
-    if has_recent_buyback:
-        score += 2
-        reasons.append("Recent share buyback indicates shareholder-friendly management")
 
-    # Check corporate actions data availability
-    corporate_actions_available = data.get('corporate_actions_available', False)
-    if not corporate_actions_available and dividend_yield is None:
-        warnings.append("Corporate actions analysis limited - data not available")
+# ----- LIQUIDITY GATE -----
 
-    return score, reasons, warnings
+# Defaults for the liquidity pre-filter
+MIN_AVG_DAILY_TRADED_VALUE = 10_000_000  # ₹1 crore per day
+MIN_TURNOVER_RATIO = 0.0  # Percent of market cap traded per day (0 disables the check)
+MAX_ZERO_VOLUME_DAYS = 10
+# apply_liquidity_gate arguments of a default run, shared by the backtest and calibration replays
+LIQUIDITY_GATE_DEFAULTS = {
+    'min_traded_value': MIN_AVG_DAILY_TRADED_VALUE,
+    'min_turnover_ratio': MIN_TURNOVER_RATIO,
+    'max_zero_volume_days': MAX_ZERO_VOLUME_DAYS
+}
 
 
-# ----- INTRINSIC VALUE CALCULATION -----
+def apply_liquidity_gate(stock_data, min_traded_value=MIN_AVG_DAILY_TRADED_VALUE,
+                         min_turnover_ratio=MIN_TURNOVER_RATIO, max_zero_volume_days=MAX_ZERO_VOLUME_DAYS):
+    """Remove illiquid stocks before analysis.
 
-def calculate_intrinsic_value_alternative(data):
-    """Calculate intrinsic value using alternative methods based on available data"""
-    methods = {}
+    Stocks without liquidity data (older snapshots or missing price history) are kept so that the
+    gate never hides a stock just because volume was not collected. Returns the filtered data and
+    the number of stocks removed.
+    """
+    liquid_data = {}
+    removed_count = 0
 
-    # Method 1: Graham's formula
-    try:
-        eps = data.get('eps') or data.get('trailingEPS')
-        if eps and eps > 0:
-            # Basic growth estimate based on industry
-            sector = data.get('sector', '')
-            growth_rate = 5  # Default growth rate
-
-            if 'Technology' in sector or 'Software' in sector:
-                growth_rate = 8
-            elif 'Consumer' in sector:
-                growth_rate = 6
-            elif 'Health' in sector:
-                growth_rate = 7
-            elif 'Financial' in sector or 'Bank' in sector:
-                growth_rate = 5
-
-            graham_value = (eps * (8.5 + (2 * growth_rate)))
-            methods['graham'] = {
-                'value': graham_value,
-                'description': f"Graham's formula with {growth_rate}% growth estimate"
-            }
-    except:
-        pass
+    for symbol, data in stock_data.items():
+        if 'error' not in data:
+            traded_value = data.get('avg_daily_traded_value')
+            turnover_ratio = data.get('turnover_ratio')
+            zero_volume_days = data.get('zero_volume_days')
+
+            if (traded_value is not None and traded_value < min_traded_value) or \
+                    (turnover_ratio is not None and turnover_ratio < min_turnover_ratio) or \
+                    (zero_volume_days is not None and zero_volume_days > max_zero_volume_days):
+                removed_count += 1
+                continue
+
+        liquid_data[symbol] = data
+
+    return liquid_data, removed_count
+
+
+def add_liquidity_arguments(parser):
+    """Add the liquidity gate options to a command-line parser (see liquidity_gate_options)"""
+    parser.add_argument('--min-traded-value', type=float, default=MIN_AVG_DAILY_TRADED_VALUE,
+                        help='Minimum average daily traded value in rupees')
+    parser.add_argument('--min-turnover-ratio', type=float, default=MIN_TURNOVER_RATIO,
+                        help='Minimum daily turnover as a percent of market cap')
+    parser.add_argument('--max-zero-volume-days', type=int, default=MAX_ZERO_VOLUME_DAYS,
+                        help='Maximum number of sessions without any volume')
+    parser.add_argument('--no-liquidity-gate', action='store_true', help='Analyze all stocks regardless of liquidity')
+
+
+def liquidity_gate_options(args):
+    """apply_liquidity_gate arguments from parsed liquidity options, or None with --no-liquidity-gate"""
+    if args.no_liquidity_gate:
+        return None
+    return {
+        'min_traded_value': args.min_traded_value,
+        'min_turnover_ratio': args.min_turnover_ratio,
+        'max_zero_volume_days': args.max_zero_volume_days
+    }
 
-    # Method 2: Dividend Discount Model
-    try:
-        dividend_yield = data.get('dividendYield')
-        current_price = data.get('current_price')
 
-        if dividend_yield and dividend_yield > 0 and current_price and current_price > 0:
-            current_dividend = (dividend_yield / 100) * current_price
+# ----- INTEGRATED ANALYSIS FUNCTION -----
 
-            # Calculate growth rate based on industry or use conservative estimate
-            sector = data.get('sector', '')
-            growth_rate = 3  # Default conservative growth rate
+def score_stock(symbol, data, all_stocks_data, sector_index, valuation=None):
+    """Run every analyzer on a single stock and combine the results into its scores.
 
-            if 'Technology' in sector or 'Software' in sector:
-                growth_rate = 5
-            elif 'Consumer' in sector:
-                growth_rate = 4
+    data must be a record of the normalized view (see normalize_stock_data). It is only read,
+    never modified, so the result depends on nothing but the inputs. valuation is the stock's
+    (valuation methods, median) pair (see valuation_at) when the methods were computed for the
+    whole universe at once.
+    """
+    # Initialize scores and analysis containers
+    buffett_score = 0
+    technical_score = 0
+    growth_score = 0  # New score category for growth metrics
+    buffett_reasons = []
+    technical_reasons = []
+    growth_reasons = []  # New reasons list for growth metrics
+    warnings = []
+    missing_data = []
+    qualitative_factors = {}
+
+    # Check for missing key metrics
+    for key_metric in ['roe', 'debt_to_equity', 'pe_ratio', 'market_cap', 'current_price']:
+        if key_metric not in data or data[key_metric] is None:
+            missing_data.append(key_metric)
+
+    # Every threshold check (growth, profitability, balance sheet, valuation, RSI, risk, ownership
+    # and dividends) is a rule of the scoring rule set; each section's findings are listed where
+    # its checks belong among the ones kept in code
+    rule_results = evaluate_record(SCORING_RULES, rule_inputs(data))
+
+    # ----- ANALYZE GROWTH METRICS -----
+    growth_analysis_score, growth_analysis_reasons, growth_analysis_warnings = rule_section(rule_results, 'growth')
+    growth_score += growth_analysis_score
+    growth_reasons.extend(growth_analysis_reasons)
+    warnings.extend(growth_analysis_warnings)
+
+    consistency_score, consistency_reasons, consistency_warnings = analyze_growth_consistency(symbol, data)
+    growth_score += consistency_score
+    growth_reasons.extend(consistency_reasons)
+    warnings.extend(consistency_warnings)
+
+    # ----- FUNDAMENTAL ANALYSIS (BUFFETT CRITERIA) -----
+
+    # 1. Operating efficiency
+    efficiency_score, efficiency_reasons, efficiency_warnings = rule_section(rule_results, 'operating_efficiency')
+    buffett_score += efficiency_score
+    buffett_reasons.extend(efficiency_reasons)
+    warnings.extend(efficiency_warnings)
+
+    # 2. Financial health
+    health_score, health_reasons, health_warnings = rule_section(rule_results, 'financial_health')
+    buffett_score += health_score
+    buffett_reasons.extend(health_reasons)
+    warnings.extend(health_warnings)
+
+    # 3. Valuation
+    valuation_score, valuation_reasons, valuation_warnings = rule_section(rule_results, 'valuation')
+    buffett_score += valuation_score
+    buffett_reasons.extend(valuation_reasons)
+    warnings.extend(valuation_warnings)
+
+    # 4. Analyze qualitative factors
+    industry_score, industry_reason = analyze_industry_dynamics(symbol, data)
+    qualitative_factors['industry_dynamics'] = {
+        'score': industry_score,
+        'reason': industry_reason
+    }
+    buffett_score += industry_score
+    if industry_score > 0:
+        buffett_reasons.append(industry_reason)
+    elif industry_score < 0:
+        warnings.append(industry_reason)
+
+    regulatory_score, regulatory_reason = analyze_regulatory_environment(symbol, data)
+    qualitative_factors['regulatory_environment'] = {
+        'score': regulatory_score,
+        'reason': regulatory_reason
+    }
+    buffett_score += regulatory_score
+    if regulatory_score > 0:
+        buffett_reasons.append(regulatory_reason)
+    elif regulatory_score < 0:
+        warnings.append(regulatory_reason)
+
+    macro_score, macro_reason = analyze_macroeconomic_factors(symbol, data)
+    qualitative_factors['macroeconomic_factors'] = {
+        'score': macro_score,
+        'reason': macro_reason
+    }
+    buffett_score += macro_score
+    if macro_score > 0:
+        buffett_reasons.append(macro_reason)
+    elif macro_score < 0:
+        warnings.append(macro_reason)
+
+    moat_score, moat_reason = analyze_economic_moat(symbol, data)
+    qualitative_factors['economic_moat'] = {
+        'score': moat_score,
+        'reason': moat_reason
+    }
+    buffett_score += moat_score
+    if moat_score > 0:
+        buffett_reasons.append(moat_reason)
+    elif moat_score < 0:
+        warnings.append(moat_reason)
+
+    # ----- CALCULATE INTRINSIC VALUE -----
+    if valuation is None:
+        valuation = calculate_intrinsic_value_alternative(data)
+    alternative_methods, methods_median = valuation
+    intrinsic_value, margin_of_safety, valuation_methods = calculate_final_intrinsic_value(
+        data, alternative_methods, methods_median)
+
+    # The computed valuation is part of the result; the valuation score above used the input's
+    if not (intrinsic_value and intrinsic_value > 0):
+        intrinsic_value = data.get('intrinsic_value', 0)
+        margin_of_safety = data.get('margin_of_safety', 0)
+        valuation_methods = data.get('valuation_methods', {})
 
-            # Use 10% as discount rate
-            discount_rate = 0.10
-            ddm_value = current_dividend * (1 + growth_rate / 100) / (discount_rate - growth_rate / 100)
+    # ----- TECHNICAL ANALYSIS (OPTIONAL) -----
+
+    # 1. Analyze technical indicators (RSI rules, then moving averages and MACD) and risk
+    tech_score, tech_reasons, tech_warnings = analyze_technical_indicators(
+        symbol, data, rule_section(rule_results, 'technical_indicators'))
+    technical_score += tech_score
+    technical_reasons.extend(tech_reasons)
+    warnings.extend(tech_warnings)
+
+    risk_score, risk_reasons, risk_warnings = rule_section(rule_results, 'risk')
+    technical_score += risk_score
+    technical_reasons.extend(risk_reasons)
+    warnings.extend(risk_warnings)
+
+    # 2. Sector comparison (using available metrics)
+    sector_score, sector_reasons, sector_warnings = analyze_sector_performance(symbol, data, all_stocks_data, sector_index)
+    technical_score += sector_score
+    technical_reasons.extend(sector_reasons)
+    warnings.extend(sector_warnings)
+
+    # 3. Ownership analysis (if available)
+    ownership_score, ownership_reasons, ownership_warnings = analyze_ownership_coverage(symbol, data)
+    rules_score, rules_reasons, rules_warnings = rule_section(rule_results, 'ownership')
+    technical_score += ownership_score + rules_score
+    technical_reasons.extend(ownership_reasons + rules_reasons)
+    warnings.extend(ownership_warnings + rules_warnings)
+
+    # 4. Corporate actions analysis
+    corporate_score, corporate_reasons, corporate_warnings = rule_section(rule_results, 'corporate_actions')
+    coverage_score, coverage_reasons, coverage_warnings = analyze_corporate_actions_coverage(symbol, data)
+    technical_score += corporate_score + coverage_score
+    technical_reasons.extend(corporate_reasons + coverage_reasons)
+    warnings.extend(corporate_warnings + coverage_warnings)
+
+    # ----- CALCULATE TOTAL SCORE -----
+    total_score = buffett_score + technical_score + growth_score
+
+    return {
+        'buffett_score': buffett_score,
+        'technical_score': technical_score,
+        'growth_score': growth_score,
+        'total_score': total_score,
+        'buffett_reasons': buffett_reasons,
+        'technical_reasons': technical_reasons,
+        'growth_reasons': growth_reasons,
+        'warnings': warnings,
+        'missing_data': missing_data,
+        'qualitative_factors': qualitative_factors,
+        'intrinsic_value': intrinsic_value,
+        'margin_of_safety': margin_of_safety,
+        'valuation_methods': valuation_methods
+    }
 
-            methods['ddm'] = {
-                'value': ddm_value,
-                'description': f"Dividend Discount Model with {growth_rate}% growth"
-            }
-    except:
-        pass
 
-    # Method 3: PE Multiple
-    try:
-        eps = data.get('eps') or data.get('trailingEPS')
-        if eps and eps > 0:
-            sector = data.get('sector', '')
-            pe_multiple = 15  # Default PE multiple
-
-            if 'Technology' in sector:
-                pe_multiple = 20
-            elif 'Consumer' in sector:
-                pe_multiple = 18
-            elif 'Utilities' in sector:
-                pe_multiple = 14
-            elif 'Financial' in sector:
-                pe_multiple = 12
-
-            pe_value = eps * pe_multiple
-            methods['pe_multiple'] = {
-                'value': pe_value,
-                'description': f"P/E Multiple Method ({pe_multiple}x earnings)"
-            }
-    except:
-        pass
+# ----- INCREMENTAL ANALYSIS CACHE -----
+
+ANALYSIS_CACHE_PATH = 'data/analysis_cache.json'
+
+# Version of the analyzer code, valuation methods and analysis output; bump it whenever the
+# structural checks, valuations or the saved output change so that cached results are recomputed
+ANALYZER_VERSION = '2025.5'
+# Rule thresholds and templates are covered by the rule set's version and a digest of its contents
+ANALYSIS_VERSION = f"{ANALYZER_VERSION}/{SCORING_RULES['version']}/{SCORING_RULES['digest'][:12]}"
+
+
+def sector_aggregate_digests(sector_index):
+    """Hash each sector's member count and metric sums and counts.
 
-    # Method 4: Book Value Method
+    Together with a stock's own values these determine the leave-one-out peer means and counts
+    it is compared against.
+    """
+    digests = {}
+    for sector, members in sector_index['members'].items():
+        aggregates = [[metric, sector_index['aggregates'][(sector, metric)]['sum'],
+                       sector_index['aggregates'][(sector, metric)]['count']]
+                      for metric in sector_index['metrics'] if (sector, metric) in sector_index['aggregates']]
+        payload = json.dumps([sector, members, aggregates], default=str)
+        digests[sector] = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    return digests
+
+
+def rule_input_fields(rules):
+    """Record fields a compiled rule set reads (metrics, flags, scales and missing-data metrics)"""
+    fields = set()
+    for rule in rules['rules']:
+        fields.update([rule['metric'], rule['requires'], rule['missing_metric']])
+        fields.update(condition[3] for condition in rule['conditions'])
+    fields.discard(None)
+    return fields
+
+
+# Record fields score_stock reads outside the scoring rules: the raw inputs of the derived rule
+# inputs, the structural and qualitative checks, the missing-data check and the valuation methods
+ANALYZER_INPUT_FIELDS = [
+    'name', 'sector', 'longBusinessSummary', 'revenue_yoy', 'operating_profit_yoy', 'net_profit_yoy',
+    'profit_margin', 'roe', 'debt_to_equity', 'pe_ratio', 'pb_ratio', 'market_cap', 'current_price',
+    'returnOnAssets', 'fcf', 'intrinsic_value', 'margin_of_safety', 'valuation_methods', 'fiiHolding',
+    'diiHolding', 'fiiHoldingChange', 'diiHoldingChange', 'dividendYield', 'price_history_available', 'ma_50',
+    'ma_200', 'macd_line', 'macd_signal', 'macd_histogram', 'shareholding_data_available',
+    'corporate_actions_available', 'eps', 'trailingEPS', 'bookValue'
+]
+
+# Every field a stock's analysis depends on; bookkeeping such as last_updated or the price
+# history does not change the analysis and is left out of the cache key. The derived rule
+# inputs are computed from the fields listed here.
+ANALYSIS_INPUT_FIELDS = sorted(set(ANALYZER_INPUT_FIELDS) | set(SECTOR_METRICS) |
+                               (rule_input_fields(SCORING_RULES) - set(rule_inputs({}))))
+
+
+def analysis_cache_key(symbol, data, sector_digest):
+    """Hash of everything a stock's analysis depends on.
+
+    That is the record's ANALYSIS_INPUT_FIELDS, the analysis version (which covers the scoring
+    rules) and the digest of its sector's aggregates (see sector_aggregate_digests).
+    """
+    inputs = [data.get(field) for field in ANALYSIS_INPUT_FIELDS]
+    payload = json.dumps([symbol, ANALYSIS_VERSION, sector_digest, inputs], default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def load_analysis_cache(path=ANALYSIS_CACHE_PATH):
+    """Load cached analyses keyed by symbol, or an empty cache when there is none"""
     try:
-        book_value = data.get('bookValue')
-        if book_value and book_value > 0:
-            sector = data.get('sector', '')
-            pb_multiple = 1.5  # Default PB multiple
-
-            if 'Financial' in sector or 'Bank' in sector:
-                pb_multiple = 1.2
-            elif 'Technology' in sector:
-                pb_multiple = 3.0
-            elif 'Consumer' in sector:
-                pb_multiple = 2.5
-
-            book_value_based = book_value * pb_multiple
-            methods['book_value'] = {
-                'value': book_value_based,
-                'description': f"Book Value Method ({pb_multiple}x book value)"
-            }
-    except:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+        if cache.get('version') == ANALYSIS_VERSION:
+            return cache.get('entries', {})
+    except Exception:
         pass
+    return {}
 
-    return methods
 
+def save_analysis_cache(entries, path=ANALYSIS_CACHE_PATH):
+    """Save cached analyses keyed by symbol"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(json.dumps({'version': ANALYSIS_VERSION, 'entries': entries}))
 
-def calculate_final_intrinsic_value(data, alternative_methods):
-    """Calculate final intrinsic value based on available methods"""
-    intrinsic_value = data.get('intrinsic_value', 0)
 
-    if not intrinsic_value or intrinsic_value == 0:
-        if alternative_methods:
-            values = [method_data['value'] for method_data in alternative_methods.values()]
+# ----- PARALLEL ANALYSIS -----
 
-            if values:
-                # Use median instead of mean to avoid outliers
-                intrinsic_value = statistics.median(values)
+# Integers above this cannot round-trip through float64 and are broadcast instead
+MAX_EXACT_FLOAT_INT = 2 ** 53
 
-                current_price = data.get('current_price', 0) or 0
-                if current_price > 0 and intrinsic_value > current_price:
-                    margin_of_safety = ((intrinsic_value - current_price) / intrinsic_value) * 100
-                else:
-                    margin_of_safety = 0
+# Column kinds in the shared kind matrix
+FIELD_ABSENT, FIELD_FLOAT, FIELD_INT = 0, 1, 2
 
-                return intrinsic_value, margin_of_safety, alternative_methods
+_worker_state = {}
 
-    return intrinsic_value, data.get('margin_of_safety', 0), alternative_methods
 
+def _is_shared_number(value):
+    """Whether a value can be stored in the shared float64 columns and restored exactly"""
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return abs(value) <= MAX_EXACT_FLOAT_INT
+    return isinstance(value, float)
 
-# ----- INTEGRATED ANALYSIS FUNCTION -----
 
-def buffett_analysis(stock_data):
+def _split_stock_fields(stock_data, symbols):
+    """Split stock dicts into numeric columns and the remaining (string, list, dict, None) fields.
+
+    Returns the numeric field names, a symbol x field float64 value matrix, a matching kind matrix
+    (FIELD_ABSENT / FIELD_FLOAT / FIELD_INT), and per symbol the non-numeric fields and key order.
+    """
+    fields = sorted({key for symbol in symbols for key, value in stock_data[symbol].items()
+                     if _is_shared_number(value)})
+    field_positions = {field: i for i, field in enumerate(fields)}
+
+    values = np.full((len(symbols), len(fields)), np.nan)
+    kinds = np.zeros((len(symbols), len(fields)), dtype=np.int8)
+    other_fields = []
+    key_orders = []
+    for row, symbol in enumerate(symbols):
+        others = {}
+        for key, value in stock_data[symbol].items():
+            if _is_shared_number(value):
+                column = field_positions[key]
+                values[row, column] = value
+                kinds[row, column] = FIELD_INT if isinstance(value, int) else FIELD_FLOAT
+            else:
+                others[key] = value
+        other_fields.append(others)
+        key_orders.append(list(stock_data[symbol].keys()))
+
+    return fields, values, kinds, other_fields, key_orders
+
+
+def _init_worker(shared_names, shape, fields, symbols, other_fields, key_orders, sector_index, valuations):
+    """Pool initializer: attach the shared numeric columns and keep the broadcast state"""
+    values_memory = shared_memory.SharedMemory(name=shared_names[0])
+    kinds_memory = shared_memory.SharedMemory(name=shared_names[1])
+    _worker_state.update({
+        'memory': (values_memory, kinds_memory),
+        'values': np.ndarray(shape, dtype=np.float64, buffer=values_memory.buf),
+        'kinds': np.ndarray(shape, dtype=np.int8, buffer=kinds_memory.buf),
+        'fields': fields,
+        'symbols': symbols,
+        'other_fields': other_fields,
+        'key_orders': key_orders,
+        'sector_index': sector_index,
+        'valuations': valuations
+    })
+
+
+def _rebuild_stock(row):
+    """Rebuild one stock dict in a worker from the shared columns and broadcast fields"""
+    state = _worker_state
+    numbers = {}
+    for column in np.flatnonzero(state['kinds'][row]):
+        value = float(state['values'][row, column])
+        numbers[state['fields'][column]] = int(value) if state['kinds'][row, column] == FIELD_INT else value
+
+    others = state['other_fields'][row]
+    return {key: others[key] if key in others else numbers[key] for key in state['key_orders'][row]}
+
+
+def _score_shard(rows):
+    """Score a shard of stocks in a worker, returning (symbol, analysis) pairs"""
+    results = []
+    for row in rows:
+        symbol = _worker_state['symbols'][row]
+        analysis = score_stock(symbol, _rebuild_stock(row), None, _worker_state['sector_index'],
+                               _worker_state['valuations'][row])
+        results.append((symbol, analysis))
+    return results
+
+
+def score_stocks_parallel(stock_data, symbols, sector_index, workers, valuations):
+    """Score stocks across worker processes that read numeric inputs from shared memory.
+
+    stock_data is the normalized view (see normalize_stock_data). Numeric fields go into
+    shared-memory columns. Strings, the sector index and the precomputed (valuation methods,
+    median) pairs (one per symbol) are sent once per worker through the pool initializer. Returns a dict
+    mapping symbol to its analysis, in symbols order.
+    """
+    fields, values, kinds, other_fields, key_orders = _split_stock_fields(stock_data, symbols)
+
+    values_memory = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    kinds_memory = shared_memory.SharedMemory(create=True, size=max(kinds.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=values_memory.buf)[:] = values
+        np.ndarray(kinds.shape, dtype=np.int8, buffer=kinds_memory.buf)[:] = kinds
+
+        shard_size = max(1, math.ceil(len(symbols) / (workers * 4)))
+        shards = [list(range(start, min(start + shard_size, len(symbols))))
+                  for start in range(0, len(symbols), shard_size)]
+
+        initargs = ((values_memory.name, kinds_memory.name), values.shape, fields, symbols,
+                    other_fields, key_orders, sector_index, valuations)
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            shard_results = pool.map(_score_shard, shards)
+    finally:
+        values_memory.close()
+        values_memory.unlink()
+        kinds_memory.close()
+        kinds_memory.unlink()
+
+    return {symbol: analysis for results in shard_results for symbol, analysis in results}
+
+
+def buffett_analysis(stock_data, workers=1, cache_path=ANALYSIS_CACHE_PATH, history_path=SCORE_HISTORY_PATH):
     buffett_picks = {}
     detailed_analysis = {}
 
-    for symbol, data in stock_data.items():
-        if 'error' in data:
-            continue
+    # Analyzers read from a normalized view so the input snapshot is never modified, and
+    # sector aggregates are computed once for the whole universe
+    normalized_data = normalize_stock_data(stock_data)
+    sector_index = build_sector_index(normalized_data)
+
+    symbols = [symbol for symbol, data in normalized_data.items()
+               if 'error' not in data and '.BO' not in symbol]  # Skip BSE stocks for now
+
+    # Only stocks whose inputs, rules or sector aggregates changed are scored again
+    cache = load_analysis_cache(cache_path) if cache_path else {}
+    sector_digests = sector_aggregate_digests(sector_index)
+    keys = {symbol: analysis_cache_key(symbol, normalized_data[symbol],
+                                       sector_digests[normalized_data[symbol].get('sector')])
+            for symbol in symbols}
+    stale_symbols = [symbol for symbol in symbols if cache.get(symbol, {}).get('key') != keys[symbol]]
+
+    # Valuation methods of the stocks to score are computed in one vectorized pass
+    valuations = compute_valuation_methods(build_valuation_inputs([normalized_data[s] for s in stale_symbols]))
+    stock_valuations = [valuation_at(valuations, row) for row in range(len(stale_symbols))]
+
+    if workers > 1 and stale_symbols:
+        scored = score_stocks_parallel(normalized_data, stale_symbols, sector_index, workers, stock_valuations)
+        print(f"Scored {len(scored)} stocks with {workers} worker processes")
+    else:
+        scored = {symbol: score_stock(symbol, normalized_data[symbol], normalized_data, sector_index, valuation)
+                  for symbol, valuation in zip(stale_symbols, stock_valuations)}
 
-        if '.BO' in symbol:  # Skip BSE stocks for now
-            continue
+    analyses = {symbol: scored[symbol] if symbol in scored else cache[symbol]['analysis'] for symbol in symbols}
 
-        # Initialize scores and analysis containers
-        buffett_score = 0
-        technical_score = 0
-        growth_score = 0  # New score category for growth metrics
-        buffett_reasons = []
-        technical_reasons = []
-        growth_reasons = []  # New reasons list for growth metrics
-        warnings = []
-        missing_data = []
-        qualitative_factors = {}
-
-        # Check for missing key metrics
-        for key_metric in ['roe', 'debt_to_equity', 'pe_ratio', 'market_cap', 'current_price']:
-            if key_metric not in data or data[key_metric] is None:
-                missing_data.append(key_metric)
-
-        # Standardize debt_to_equity format
-        if data.get('debt_to_equity') and data['debt_to_equity'] > 3:
-            data['debt_to_equity'] = data['debt_to_equity'] / 100
-
-        # ----- ANALYZE GROWTH METRICS (NEW) -----
-        growth_analysis_score, growth_analysis_reasons, growth_analysis_warnings = analyze_growth_metrics(symbol, data)
-        growth_score += growth_analysis_score
-        growth_reasons.extend(growth_analysis_reasons)
-        warnings.extend(growth_analysis_warnings)
-
-        # ----- FUNDAMENTAL ANALYSIS (BUFFETT CRITERIA) -----
-
-        # 1. Analyze operating efficiency
-        efficiency_score, efficiency_reasons, efficiency_warnings = analyze_operating_efficiency(symbol, data)
-        buffett_score += efficiency_score
-        buffett_reasons.extend(efficiency_reasons)
-        warnings.extend(efficiency_warnings)
-
-        # 2. Analyze financial health
-        health_score, health_reasons, health_warnings = analyze_financial_health(symbol, data)
-        buffett_score += health_score
-        buffett_reasons.extend(health_reasons)
-        warnings.extend(health_warnings)
-
-        # 3. Analyze valuation
-        valuation_score, valuation_reasons, valuation_warnings = analyze_valuation(symbol, data)
-        buffett_score += valuation_score
-        buffett_reasons.extend(valuation_reasons)
-        warnings.extend(valuation_warnings)
-
-        # 4. Analyze qualitative factors
-        industry_score, industry_reason = analyze_industry_dynamics(symbol, data)
-        qualitative_factors['industry_dynamics'] = {
-            'score': industry_score,
-            'reason': industry_reason
-        }
-        buffett_score += industry_score
-        if industry_score > 0:
-            buffett_reasons.append(industry_reason)
-        elif industry_score < 0:
-            warnings.append(industry_reason)
-
-        regulatory_score, regulatory_reason = analyze_regulatory_environment(symbol, data)
-        qualitative_factors['regulatory_environment'] = {
-            'score': regulatory_score,
-            'reason': regulatory_reason
-        }
-        buffett_score += regulatory_score
-        if regulatory_score > 0:
-            buffett_reasons.append(regulatory_reason)
-        elif regulatory_score < 0:
-            warnings.append(regulatory_reason)
-
-        macro_score, macro_reason = analyze_macroeconomic_factors(symbol, data)
-        qualitative_factors['macroeconomic_factors'] = {
-            'score': macro_score,
-            'reason': macro_reason
-        }
-        buffett_score += macro_score
-        if macro_score > 0:
-            buffett_reasons.append(macro_reason)
-        elif macro_score < 0:
-            warnings.append(macro_reason)
-
-        moat_score, moat_reason = analyze_economic_moat(symbol, data)
-        qualitative_factors['economic_moat'] = {
-            'score': moat_score,
-            'reason': moat_reason
-        }
-        buffett_score += moat_score
-        if moat_score > 0:
-            buffett_reasons.append(moat_reason)
-        elif moat_score < 0:
-            warnings.append(moat_reason)
-
-        # ----- CALCULATE INTRINSIC VALUE -----
-        alternative_valuation_methods = calculate_intrinsic_value_alternative(data)
-        intrinsic_value, margin_of_safety, valuation_methods = calculate_final_intrinsic_value(
-            data, alternative_valuation_methods)
-
-        if intrinsic_value and intrinsic_value > 0:
-            data['intrinsic_value'] = intrinsic_value
-            data['margin_of_safety'] = margin_of_safety
-            data['valuation_methods'] = valuation_methods
-
-        # ----- TECHNICAL ANALYSIS (OPTIONAL) -----
-
-        # 1. Analyze technical indicators
-        tech_score, tech_reasons, tech_warnings = analyze_technical_indicators(symbol, data)
-        technical_score += tech_score
-        technical_reasons.extend(tech_reasons)
-        warnings.extend(tech_warnings)
-
-        # 2. Sector comparison (using available metrics)
-        sector_score, sector_reasons, sector_warnings = analyze_sector_performance(symbol, data, stock_data)
-        technical_score += sector_score
-        technical_reasons.extend(sector_reasons)
-        warnings.extend(sector_warnings)
-
-        # 3. Ownership analysis (if available)
-        ownership_score, ownership_reasons, ownership_warnings = analyze_ownership_patterns(symbol, data)
-        technical_score += ownership_score
-        technical_reasons.extend(ownership_reasons)
-        warnings.extend(ownership_warnings)
-
-        # 4. Corporate actions analysis
-        corporate_score, corporate_reasons, corporate_warnings = analyze_corporate_actions(symbol, data)
-        technical_score += corporate_score
-        technical_reasons.extend(corporate_reasons)
-        warnings.extend(corporate_warnings)
-
-        # ----- CALCULATE TOTAL SCORE -----
-        total_score = buffett_score + technical_score + growth_score
+    if cache_path:
+        print(f"Analysis cache: {len(symbols) - len(stale_symbols)} hits, {len(stale_symbols)} misses")
+
+    # Intrinsic value ranges over the growth x discount rate x multiple grid, and universe and
+    # sector percentile ranks; both depend on the whole universe so they are never cached
+    analyzed_records = [normalized_data[symbol] for symbol in symbols]
+    sensitivity = compute_sensitivity_grid(build_valuation_inputs(analyzed_records))
+    ranks = compute_percentile_ranks(analyzed_records, [data.get('sector', 'Unknown') for data in analyzed_records])
+
+    # Most similar companies by fundamentals, found for all picks in one batch query
+    similarity_index = build_similarity_index(analyzed_records, symbols)
+    pick_rows = [row for row, symbol in enumerate(symbols) if analyses[symbol]['total_score'] >= PICK_THRESHOLD]
+    neighbors, neighbor_distances = query_neighbors(similarity_index, pick_rows)
+    neighbor_at = {row: i for i, row in enumerate(pick_rows)}
+    names = [data['name'] for data in analyzed_records]
+
+    for row, (symbol, analysis) in enumerate(analyses.items()):
+        data = normalized_data[symbol]
 
         # Record detailed analysis for all stocks
         detailed_analysis[symbol] = {
             'name': data['name'],
             'sector': data.get('sector', 'Unknown'),
-            'buffett_score': buffett_score,
-            'technical_score': technical_score,
-            'growth_score': growth_score,
-            'total_score': total_score,
-            'buffett_reasons': buffett_reasons,
-            'technical_reasons': technical_reasons,
-            'growth_reasons': growth_reasons,
-            'warnings': warnings,
-            'missing_data': missing_data
+            'buffett_score': analysis['buffett_score'],
+            'technical_score': analysis['technical_score'],
+            'growth_score': analysis['growth_score'],
+            'total_score': analysis['total_score'],
+            'buffett_reasons': analysis['buffett_reasons'],
+            'technical_reasons': analysis['technical_reasons'],
+            'growth_reasons': analysis['growth_reasons'],
+            'warnings': analysis['warnings'],
+            'missing_data': analysis['missing_data'],
+            'valuation_range': sensitivity_at(sensitivity, row),
+            'percentile_ranks': percentile_ranks_at(ranks, row)
         }
+        if row in neighbor_at:
+            detailed_analysis[symbol]['similar_stocks'] = similar_stocks_at(
+                similarity_index, neighbors, neighbor_distances, neighbor_at[row], names)
 
         # Add to picks if it meets the threshold
-        if total_score >= 10:
+        if analysis['total_score'] >= PICK_THRESHOLD:
             buffett_picks[symbol] = {
                 'name': data['name'],
                 'symbol': symbol,
                 'sector': data.get('sector', 'Unknown'),
                 'price': data.get('current_price', 0),
-                'intrinsic_value': data.get('intrinsic_value', 0),
-                'margin_of_safety': data.get('margin_of_safety', 0),
+                'intrinsic_value': analysis['intrinsic_value'],
+                'margin_of_safety': analysis['margin_of_safety'],
                 'pe_ratio': data.get('pe_ratio', 0),
                 'roe': data.get('roe', 0),
                 'debt_to_equity': data.get('debt_to_equity', 0),
                 'market_cap': data.get('market_cap', 0),
-                'buffett_score': buffett_score,
-                'technical_score': technical_score,
-                'growth_score': growth_score,
-                'total_score': total_score,
-                'buffett_reasons': buffett_reasons,
-                'technical_reasons': technical_reasons,
-                'growth_reasons': growth_reasons,
-                'warnings': warnings,
-                'missing_data': missing_data,
-                'qualitative_factors': qualitative_factors,
-                'valuation_methods': data.get('valuation_methods', {}),
+                'buffett_score': analysis['buffett_score'],
+                'technical_score': analysis['technical_score'],
+                'growth_score': analysis['growth_score'],
+                'total_score': analysis['total_score'],
+                'buffett_reasons': analysis['buffett_reasons'],
+                'technical_reasons': analysis['technical_reasons'],
+                'growth_reasons': analysis['growth_reasons'],
+                'warnings': analysis['warnings'],
+                'missing_data': analysis['missing_data'],
+                'qualitative_factors': analysis['qualitative_factors'],
+                'valuation_methods': analysis['valuation_methods'],
+                'valuation_range': detailed_analysis[symbol]['valuation_range'],
+                'percentile_ranks': detailed_analysis[symbol]['percentile_ranks'],
+                'similar_stocks': detailed_analysis[symbol].get('similar_stocks', []),
                 'technical_indicators': {
                     'rsi': data.get('rsi'),
                     'ma_50': data.get('ma_50'),
@@ -1167,6 +1381,24 @@ def buffett_analysis(stock_data):
                     'macd_signal': data.get('macd_signal'),
                     'macd_histogram': data.get('macd_histogram')
                 },
+                'risk_metrics': {
+                    'volatility': data.get('volatility'),
+                    'beta': data.get('beta'),
+                    'max_drawdown': data.get('max_drawdown'),
+                    'atr': data.get('atr'),
+                    'atr_percent': data.get('atr_percent')
+                },
+                'momentum': {
+                    'return_1w': data.get('return_1w'),
+                    'return_1m': data.get('return_1m'),
+                    'return_3m': data.get('return_3m'),
+                    'return_6m': data.get('return_6m'),
+                    'return_12m': data.get('return_12m'),
+                    'high_52w': data.get('high_52w'),
+                    'low_52w': data.get('low_52w'),
+                    'high_52w_distance': data.get('high_52w_distance'),
+                    'low_52w_distance': data.get('low_52w_distance')
+                },
                 'growth_metrics': {
                     'revenue_yoy': data.get('revenue_yoy'),
                     'revenue_qoq': data.get('revenue_qoq'),
@@ -1178,11 +1410,29 @@ def buffett_analysis(stock_data):
                 }
             }
 
-    # Save detailed analysis for all stocks
+    # Save detailed analysis for all stocks; reason codes are formatted only here. It is written
+    # on every run, cached or not, since the ranks and ranges above depend on the whole universe
+    for analysis in detailed_analysis.values():
+        for key in ('buffett_reasons', 'technical_reasons', 'growth_reasons', 'warnings'):
+            analysis[key] = format_reasons(analysis[key])
+
     os.makedirs('data', exist_ok=True)
     with open('data/detailed_analysis.json', 'w') as f:
         json.dump(detailed_analysis, f, indent=2)
 
+    if cache_path:
+        save_analysis_cache({symbol: {'key': keys[symbol], 'analysis': analyses[symbol]}
+                             for symbol in symbols}, cache_path)
+
+    # Append this run's scores to the history; the snapshot's data time labels the run so that
+    # analyzing the same snapshot again replaces its run instead of adding one
+    if history_path:
+        run = max((normalized_data[symbol].get('last_updated') or '' for symbol in symbols), default='') or \
+            datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%Y-%m-%d %H:%M')
+        history = append_score_run(load_score_history(history_path), run, symbols,
+                                   [[analyses[symbol][field] for field in SCORE_FIELDS] for symbol in symbols])
+        save_score_history(history, history_path)
+
     # Sort picks by total score
     sorted_picks = dict(sorted(buffett_picks.items(), key=lambda x: x[1]['total_score'], reverse=True))
     return sorted_picks
@@ -1216,7 +1466,106 @@ def increment_visit_count():
         return 1, 1
 
 
-def generate_html_report(buffett_picks):
+def movers_html(movers, limit=10):
+    """Movers section of the report: pick list entries and exits and the largest score changes"""
+    def mover_items(rows, show_rank):
+        if not rows:
+            return '<li class="text-muted">None</li>'
+        items = ''
+        for row in rows[:limit]:
+            previous_score = '-' if row['previous_score'] is None else f"{row['previous_score']:g}"
+            score = '-' if row['score'] is None else f"{row['score']:g}"
+            rank = ''
+            if show_rank and row['rank_change'] is not None:
+                rank = f" <small class=\"text-muted\">rank {row['rank']} ({row['rank_change']:+d})</small>"
+            items += f"<li><span class=\"ticker-symbol\">{row['symbol'].replace('.NS', '')}</span> {previous_score} &rarr; {score}{rank}</li>"
+        if len(rows) > limit:
+            items += f'<li class="text-muted">and {len(rows) - limit} more</li>'
+        return items
+
+    columns = [
+        ('New picks', 'bi-box-arrow-in-right text-success', movers['entries'], False),
+        ('Dropped picks', 'bi-box-arrow-right text-danger', movers['exits'], False),
+        ('Largest score rises', 'bi-arrow-up-circle text-success', movers['risers'], True),
+        ('Largest score falls', 'bi-arrow-down-circle text-danger', movers['fallers'], True)
+    ]
+    html = f"""
+            <div class="col-12 mb-4">
+                <div class="card">
+                    <div class="card-body">
+                        <h5 class="card-title">Movers since the previous run</h5>
+                        <p class="small text-muted">Score changes from data of {movers['previous_run']} to {movers['current_run']}; {movers['changed']} stocks changed score.</p>
+                        <div class="row">
+    """
+    for title, icon, rows, show_rank in columns:
+        html += f"""
+                            <div class="col-md-3">
+                                <h6><i class="bi {icon}"></i> {title} ({len(rows)})</h6>
+                                <ul class="list-unstyled small">{mover_items(rows, show_rank)}</ul>
+                            </div>
+        """
+    html += """
+                        </div>
+                    </div>
+                </div>
+            </div>
+    """
+    return html
+
+
+def diversification_html(diversification, limit=5):
+    """Diversification section of the report: correlation of the picks, sector mix and clusters"""
+    def pick_list(symbols):
+        return ', '.join(f'<span class="ticker-symbol">{symbol.replace(".NS", "")}</span>' for symbol in symbols)
+
+    average = diversification['average_correlation']
+    effective = diversification['effective_picks']
+    largest = diversification['largest_sector']
+    summary = f"{diversification['priced_picks']} of {diversification['picks']} picks have price history"
+    if average is not None:
+        summary += (f"; their daily returns over the last {diversification['lookback_days']} sessions have an average "
+                    f"pairwise correlation of {average:.2f}")
+        if 'universe' in diversification and diversification['universe']['average_correlation'] is not None:
+            summary += f" (all stocks: {diversification['universe']['average_correlation']:.2f})"
+        if effective is not None:
+            summary += f", about {effective:.1f} independent positions in an equal-weight portfolio"
+
+    cluster_items = ''
+    for cluster in diversification['clusters'][:limit]:
+        sectors = ', '.join(cluster['sectors'])
+        correlation = '' if cluster['average_correlation'] is None else f" ({cluster['average_correlation']:.2f})"
+        cluster_items += f"<li>{pick_list(cluster['symbols'])}{correlation} <small class=\"text-muted\">{sectors}</small></li>"
+    if len(diversification['clusters']) > limit:
+        cluster_items += f'<li class="text-muted">and {len(diversification["clusters"]) - limit} more</li>'
+    if not cluster_items:
+        cluster_items = '<li class="text-muted">None</li>'
+
+    pair_items = ''.join(f"<li>{pick_list(pair['symbols'])} {pair['correlation']:.2f}</li>"
+                         for pair in diversification['top_pairs'][:limit]) or '<li class="text-muted">None</li>'
+
+    return f"""
+            <div class="col-12 mb-4">
+                <div class="card">
+                    <div class="card-body">
+                        <h5 class="card-title">Diversification of the picks</h5>
+                        <p class="small text-muted">{summary}. The largest sector, {largest['sector']}, holds {largest['picks']} picks ({largest['share']:.0f}%).</p>
+                        <div class="row">
+                            <div class="col-md-6">
+                                <h6><i class="bi bi-diagram-3"></i> Move together (correlation &ge; {diversification['cluster_correlation']:.2f}, {len(diversification['clusters'])} clusters)</h6>
+                                <ul class="list-unstyled small">{cluster_items}</ul>
+                            </div>
+                            <div class="col-md-6">
+                                <h6><i class="bi bi-link-45deg"></i> Most correlated pairs</h6>
+                                <ul class="list-unstyled small">{pair_items}</ul>
+                            </div>
+                        </div>
+                    </div>
+                </div>
+            </div>
+    """
+
+
+def generate_html_report(buffett_picks, liquidity_removed=0, movers=None, diversification=None):
     """Generate HTML report of Buffett picks"""
     total_visits, today_visits = increment_visit_count()
 
@@ -1519,6 +1868,8 @@ def generate_html_report(buffett_picks):
                                     <li>RSI (Relative Strength Index): Identifies overbought/oversold conditions</li>
                                     <li>Moving Averages: 50-day and 200-day for trends and support/resistance</li>
                                     <li>MACD: Momentum assessment and signal crossovers</li>
+                                    <li>Risk: Annualized volatility, beta vs. NIFTY 50 and maximum drawdown</li>
+                                    <li>Momentum: 1-week to 12-month returns and distance from the 52-week high and low</li>
                                 </ol>
                             </div>
                             <div class="col-md-6">
@@ -1533,7 +1884,7 @@ def generate_html_report(buffett_picks):
                     </div>
                 </div>
 
-                <p class="small mb-0 mt-3">Stocks are scored based on Buffett principles, growth metrics, and technical indicators. Minimum threshold: 10 total points.</p>
+                <p class="small mb-0 mt-3">Stocks are scored based on Buffett principles, growth metrics, and technical indicators. Minimum threshold: """ + f"{PICK_THRESHOLD:g}" + """ total points.</p>
             </div>
 
             <div class="row" id="stockContainer">
@@ -1547,10 +1898,17 @@ def generate_html_report(buffett_picks):
                 <div class="alert alert-info">
                     <strong>Found {len(buffett_picks)} companies</strong> matching enhanced investment criteria 
                     with a combined market cap of ₹{total_market_cap_billions:,.2f} billion.
+                    {f'<br><small>{liquidity_removed} illiquid stocks were excluded by the liquidity filter before analysis.</small>' if liquidity_removed else ''}
                 </div>
             </div>
     """
 
+    if movers:
+        html += movers_html(movers)
+
+    if diversification:
+        html += diversification_html(diversification)
+
     for symbol, data in buffett_picks.items():
         display_symbol = symbol.replace('.NS', '')
         exchange = "NSE"
@@ -1628,10 +1986,12 @@ def generate_html_report(buffett_picks):
 
         qualitative_factors = data.get('qualitative_factors', {})
         technical_indicators = data.get('technical_indicators', {})
+        risk_metrics = data.get('risk_metrics', {})
+        momentum = data.get('momentum', {})
         growth_metrics = data.get('growth_metrics', {})
 
         missing_data = data.get('missing_data', [])
-        warnings_list = data.get('warnings', [])
+        warnings_list = format_reasons(data.get('warnings', []))
 
         has_missing_data = len(missing_data) > 0
         has_warnings = len(warnings_list) > 0
@@ -1639,6 +1999,8 @@ def generate_html_report(buffett_picks):
 
         valuation_methods = data.get('valuation_methods', {})
         has_alternative_valuations = len(valuation_methods) > 0
+        valuation_range = data.get('valuation_range')
+        similar_stocks = data.get('similar_stocks', [])
 
         html += f"""
                 <div class="col-md-6 col-lg-4 stock-card-container" 
@@ -1797,8 +2159,19 @@ def generate_html_report(buffett_picks):
         ma_200 = technical_indicators.get('ma_200')
         macd_line = technical_indicators.get('macd_line')
         macd_signal = technical_indicators.get('macd_signal')
+        volatility = risk_metrics.get('volatility')
+        beta = risk_metrics.get('beta')
+        max_drawdown = risk_metrics.get('max_drawdown')
+
+        momentum_returns = [(label, momentum.get(field)) for label, field in
+                            [('1W', 'return_1w'), ('1M', 'return_1m'), ('3M', 'return_3m'),
+                             ('6M', 'return_6m'), ('12M', 'return_12m')]]
+        high_52w_distance = momentum.get('high_52w_distance')
+        low_52w_distance = momentum.get('low_52w_distance')
 
-        has_technical_data = any(v is not None for v in [rsi, ma_50, ma_200, macd_line, macd_signal])
+        has_technical_data = any(v is not None for v in [rsi, ma_50, ma_200, macd_line, macd_signal,
+                                                         volatility, beta, max_drawdown, high_52w_distance] +
+                                 [value for _, value in momentum_returns])
 
         if has_technical_data:
             html += """
@@ -1836,8 +2209,61 @@ def generate_html_report(buffett_picks):
                                     </div>
                 """
 
+            if volatility is not None:
+                volatility_class = "success" if volatility < 25 else "danger" if volatility > 45 else "warning"
+                html += f"""
+                                    <div class="col-4 text-center">
+                                        <small>Volatility</small>
+                                        <div class="text-{volatility_class} fw-bold">{volatility:.1f}%</div>
+                                    </div>
+                """
+
+            if beta is not None:
+                beta_class = "success" if beta < 1 else "danger" if beta > 1.5 else "warning"
+                html += f"""
+                                    <div class="col-4 text-center">
+                                        <small>Beta</small>
+                                        <div class="text-{beta_class} fw-bold">{beta:.2f}</div>
+                                    </div>
+                """
+
+            if max_drawdown is not None:
+                drawdown_class = "success" if max_drawdown < 15 else "danger" if max_drawdown > 30 else "warning"
+                html += f"""
+                                    <div class="col-4 text-center">
+                                        <small>Max Drawdown</small>
+                                        <div class="text-{drawdown_class} fw-bold">{max_drawdown:.1f}%</div>
+                                    </div>
+                """
+
             html += """
                                 </div>
+            """
+
+            if any(value is not None for _, value in momentum_returns):
+                html += """
+                                <div class="row mt-2">
+                """
+                for label, value in momentum_returns:
+                    if value is None:
+                        continue
+                    return_class = "success" if value > 0 else "danger" if value < 0 else "secondary"
+                    html += f"""
+                                    <div class="col text-center">
+                                        <small>{label}</small>
+                                        <div class="text-{return_class} fw-bold">{value:+.1f}%</div>
+                                    </div>
+                    """
+                html += """
+                                </div>
+                """
+
+            if high_52w_distance is not None and low_52w_distance is not None:
+                html += f"""
+                                <div class="text-center mt-1"><small class="text-muted">{-high_52w_distance:.1f}% below 52-week high of ₹{momentum.get('high_52w', 0):,.2f}, {low_52w_distance:.1f}% above 52-week low of ₹{momentum.get('low_52w', 0):,.2f}</small></div>
+                """
+
+            html += """
                             </div>
             """
         else:
@@ -1857,6 +2283,9 @@ def generate_html_report(buffett_picks):
             for method_name, method_data in valuation_methods.items():
                 method_value = method_data.get('value', 0)
                 method_desc = method_data.get('description', '')
+                percentiles = method_data.get('percentiles')
+                if percentiles:
+                    method_desc += f"; 10th-90th percentile ₹{percentiles['p10']:,.2f} – ₹{percentiles['p90']:,.2f}"
                 html += f"""
                                         <li><strong>{method_name.capitalize()}</strong>: ₹{method_value:,.2f} 
                                             <div><small class="text-muted">{method_desc}</small></div>
@@ -1868,6 +2297,24 @@ def generate_html_report(buffett_picks):
                             </div>
             """
 
+        if valuation_range:
+            band_text = f" ({valuation_range['band']} margin of safety)" if valuation_range['band'] else ''
+            html += f"""
+                            <div class="mt-2">
+                                <small class="text-muted"><i class="bi bi-sliders"></i> Value range across growth, discount rate and multiple scenarios:
+                                ₹{valuation_range['low']:,.2f} – ₹{valuation_range['high']:,.2f}, base ₹{valuation_range['base']:,.2f}{band_text}</small>
+                            </div>
+            """
+
+        if similar_stocks:
+            similar_names = ', '.join(f'<span title="{s["name"]}">{s["symbol"].replace(".NS", "")}</span>'
+                                      for s in similar_stocks)
+            html += f"""
+                            <div class="mt-2">
+                                <small class="text-muted"><i class="bi bi-people"></i> Similar fundamentals: {similar_names}</small>
+                            </div>
+            """
+
         # Add tabbed content for Buffett, Growth, and Technical reasons
         html += """
                             <ul class="nav nav-tabs mt-4" role="tablist">
@@ -1887,7 +2334,7 @@ def generate_html_report(buffett_picks):
                                     <h6 class="mb-2">Why Buffett Would Like It:</h6>
         """
 
-        buffett_reasons = data.get('buffett_reasons', [])
+        buffett_reasons = format_reasons(data.get('buffett_reasons', []))
         if buffett_reasons:
             html += """
                                     <ul class="reasons">
@@ -1909,7 +2356,7 @@ def generate_html_report(buffett_picks):
                                     <h6 class="mb-2">Growth Analysis:</h6>
         """
 
-        growth_reasons = data.get('growth_reasons', [])
+        growth_reasons = format_reasons(data.get('growth_reasons', []))
         if growth_reasons:
             html += """
                                     <ul class="reasons">
@@ -1931,7 +2378,7 @@ def generate_html_report(buffett_picks):
                                     <h6 class="mb-2">Technical & Quantitative Factors:</h6>
         """
 
-        technical_reasons = data.get('technical_reasons', [])
+        technical_reasons = format_reasons(data.get('technical_reasons', []))
         if technical_reasons:
             html += """
                                     <ul class="reasons">
@@ -2110,9 +2557,48 @@ def generate_html_report(buffett_picks):
     print("Enhanced HTML report generated at output/index.html")
 
 
+def parse_arguments():
+    """Parse command-line arguments"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Analyze collected stock data using Buffett principles')
+    add_liquidity_arguments(parser)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes for the analysis (1 runs serially)')
+    parser.add_argument('--no-cache', action='store_true', help='Score every stock again, ignoring cached results')
+    parser.add_argument('--no-history', action='store_true',
+                        help='Do not record this run in the score history or show movers')
+    parser.add_argument('--no-diversification', action='store_true',
+                        help='Skip the return correlation and diversification check of the picks')
+    parser.add_argument('--universe-correlation', action='store_true',
+                        help='Also compute correlation statistics of every priced stock as a baseline')
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_arguments()
+
     print("Starting ")
     stock_data = load_latest_data()
-    buffett_picks = buffett_analysis(stock_data)
-    generate_html_report(buffett_picks)
+
+    liquidity_removed = 0
+    liquidity_gate = liquidity_gate_options(args)
+    if liquidity_gate is not None:
+        stock_data, liquidity_removed = apply_liquidity_gate(stock_data, **liquidity_gate)
+        print(f"Liquidity gate removed {liquidity_removed} illiquid stocks")
+
+    buffett_picks = buffett_analysis(stock_data, workers=args.workers,
+                                     cache_path=None if args.no_cache else ANALYSIS_CACHE_PATH,
+                                     history_path=None if args.no_history else SCORE_HISTORY_PATH)
+    movers = None if args.no_history else compute_movers(load_score_history(SCORE_HISTORY_PATH))
+
+    diversification = None
+    if not args.no_diversification and buffett_picks:
+        diversification = diversification_summary(buffett_picks, load_price_matrix(),
+                                                  universe=args.universe_correlation)
+        if diversification:
+            save_diversification(diversification, DIVERSIFICATION_PATH)
+        else:
+            print("No price matrix for the picks, skipping the diversification check")
+
+    generate_html_report(buffett_picks, liquidity_removed, movers, diversification)
     print(f"Analysis complete. Found {len(buffett_picks)} stocks matching criteria")
@@ -0,0 +1,368 @@
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from backtest import (
+    SNAPSHOT_PATTERN, build_price_grid, find_snapshots, forward_returns, generate_synthetic_snapshots,
+    liquid_universe, replay_snapshots, snapshot_close_dates, snapshot_closes
+)
+from buffet_analyzer import (
+    LIQUIDITY_GATE_DEFAULTS, add_liquidity_arguments, build_analysis_sector_index, liquidity_gate_options,
+    load_latest_data
+)
+from rule_compiler import PICK_THRESHOLD, evaluate_rules, load_rules
+from vectorized_scoring import (
+    prepare_frame, score_growth_consistency_columns, score_sector_columns, score_trend_columns, uses_rank_columns
+)
+
+CALIBRATION_OUTPUT_PATH = 'data/calibration_frontier.json'
+
+# Score components outside the rule set and the category each one counts towards
+EXTRA_COMPONENTS = {
+    'qualitative': 'buffett',
+    'growth_consistency': 'growth',
+    'trend': 'technical',
+    'sector_performance': 'technical'
+}
+
+GROUPINGS = ['category', 'section', 'rule']
+
+DEFAULT_WEIGHTS = [0.0, 0.5, 1.0, 1.5, 2.0]
+# Pick thresholds swept around the current one
+DEFAULT_THRESHOLDS = [PICK_THRESHOLD + offset for offset in (-4, -2, 0, 2, 4, 6)]
+CALIBRATION_HORIZON = 21
+MAX_CONFIGS = 2000
+MIN_AVG_PICKS = 5
+
+# Weight vectors scored together by one vectorized pass
+CONFIG_BATCH_SIZE = 8
+
+
+def component_groups(rules, group_by='category'):
+    """Ordered group names and the group of every rule and extra component.
+
+    group_by 'category' gives one weight per score category, 'section' one per rule section plus
+    one per extra component, and 'rule' one per rule plus one per extra component.
+    """
+    if group_by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping {group_by!r}; expected one of {GROUPINGS}")
+
+    membership = {}
+    for rule in rules['rules']:
+        membership[rule['id']] = {'category': rule['category'], 'section': rule['section'], 'rule': rule['id']}[group_by]
+    for component, category in EXTRA_COMPONENTS.items():
+        membership[component] = category if group_by == 'category' else component
+    return list(dict.fromkeys(membership.values())), membership
+
+
+def replay_components(stock_data, rules, group_by='category', liquidity_gate=LIQUIDITY_GATE_DEFAULTS):
+    """Score one snapshot into per-group score components instead of totals.
+
+    Every stock's total score under a weight vector is its components dotted with the weights,
+    so a snapshot is scored once and any number of weightings are evaluated from the result.
+    Illiquid stocks are removed first, as in the analysis and the backtest (see liquid_universe).
+    """
+    stock_data = liquid_universe(stock_data, liquidity_gate)
+    groups, membership = component_groups(rules, group_by)
+    sector_index = build_analysis_sector_index(stock_data)
+    frame = prepare_frame(stock_data, ranks=uses_rank_columns(rules))
+    c = frame['columns']
+    p = frame['present']
+    count = len(frame['symbols'])
+
+    evaluation = evaluate_rules(rules, c, p, count)
+    extras = {
+        'qualitative': frame['qualitative_score'],
+        'growth_consistency': score_growth_consistency_columns(c, p),
+        'trend': score_trend_columns(c, p),
+        'sector_performance': score_sector_columns(frame, sector_index)
+    }
+
+    components = np.zeros((count, len(groups)))
+    for rule in rules['rules']:
+        components[:, groups.index(membership[rule['id']])] += rule['points'][evaluation['bands'][rule['id']]]
+    for component, values in extras.items():
+        components[:, groups.index(membership[component])] += values
+
+    return {'symbols': frame['symbols'], 'components': components, 'groups': groups,
+            'closes': snapshot_closes(stock_data, frame['symbols']),
+            'close_dates': snapshot_close_dates(stock_data, frame['symbols'])}
+
+
+def build_calibration_dataset(dates, replays, horizon=CALIBRATION_HORIZON):
+    """Align component replays into the arrays the sweep works on.
+
+    Returns the date x symbol x group component tensor (float32), the scored mask, the forward
+    returns over horizon (NaN filled with 0) with their availability mask, and whether each
+    stock beat the equal-weighted universe on each date.
+    """
+    symbols, grid, grid_dates, date_rows = build_price_grid(dates, replays)
+    columns = {symbol: i for i, symbol in enumerate(symbols)}
+    groups = replays[0]['groups']
+
+    tensor = np.zeros((len(replays), len(symbols), len(groups)), dtype=np.float32)
+    scored = np.zeros((len(replays), len(symbols)), dtype=bool)
+    for row, replay in enumerate(replays):
+        cols = [columns[symbol] for symbol in replay['symbols']]
+        tensor[row, cols] = replay['components']
+        scored[row, cols] = True
+
+    returns = forward_returns(grid, date_rows, horizon)
+    has_return = ~np.isnan(returns)
+    universe = scored & has_return
+    filled_returns = np.where(has_return, returns, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        universe_return = (filled_returns * universe).sum(axis=1) / universe.sum(axis=1)
+
+    return {
+        'groups': groups,
+        'tensor': tensor,
+        'scored': scored,
+        'returns': filled_returns,
+        'has_return': has_return,
+        'universe_return': universe_return,
+        'beats_universe': has_return & (filled_returns > universe_return[:, None])
+    }
+
+
+# ----- SWEEP -----
+
+_calibration_state = {}
+
+
+def _init_calibration_worker(dataset, thresholds):
+    """Pool initializer: keep the dataset and thresholds for every task of the worker"""
+    _calibration_state['dataset'] = dataset
+    _calibration_state['thresholds'] = np.asarray(thresholds, dtype=float)
+
+
+def evaluate_configs(weights):
+    """Metrics of a batch of weight vectors at every threshold, in one vectorized pass.
+
+    Returns an array of shape (len(weights), len(thresholds), 4) holding excess return, hit rate,
+    turnover and average picks. Excess return and hit rate are averaged over the dates with
+    picks and known returns (NaN when there are none).
+    """
+    dataset = _calibration_state['dataset']
+    thresholds = _calibration_state['thresholds']
+    totals = np.einsum('dng,bg->bdn', dataset['tensor'], np.asarray(weights, dtype=np.float32))
+
+    scored = dataset['scored']
+    has_return = dataset['has_return']
+    returns = dataset['returns']
+    universe_return = dataset['universe_return']
+    beats_universe = dataset['beats_universe']
+    with_universe = ~np.isnan(universe_return)
+
+    metrics = np.full((len(weights), len(thresholds), 4), np.nan)
+    for t, threshold in enumerate(thresholds):
+        picks = (totals >= threshold) & scored
+        held = picks & has_return
+        pick_count = held.sum(axis=2)
+        active = (pick_count > 0) & with_universe
+        active_dates = active.sum(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pick_return = (held * returns).sum(axis=2) / pick_count
+            excess = np.where(active, pick_return - universe_return, 0.0).sum(axis=1) / active_dates
+            hits = np.where(active, (held & beats_universe).sum(axis=2), 0).sum(axis=1)
+            hit_rate = hits / np.where(active, pick_count, 0).sum(axis=1)
+
+        all_picks = picks.sum(axis=2)
+        position_weights = picks / np.maximum(all_picks, 1)[:, :, None]
+        turnover = 0.5 * np.abs(np.diff(position_weights, axis=1)).sum(axis=2).mean(axis=1)
+
+        metrics[:, t, 0] = excess
+        metrics[:, t, 1] = hit_rate
+        metrics[:, t, 2] = turnover
+        metrics[:, t, 3] = all_picks.mean(axis=1)
+    return metrics
+
+
+def weight_grid(group_count, weights=DEFAULT_WEIGHTS, max_configs=MAX_CONFIGS, seed=42):
+    """Weight vectors to sweep: the full grid, or a seeded sample of it when that is too large.
+
+    The all-ones vector (the current rule set) is always included and the all-zero one never.
+    """
+    total = len(weights) ** group_count
+    baseline = (1.0,) * group_count
+    if total <= max_configs:
+        vectors = [vector for vector in itertools.product(weights, repeat=group_count) if any(vector)]
+    else:
+        rng = np.random.default_rng(seed)
+        sampled = {tuple(float(w) for w in rng.choice(weights, group_count)) for _ in range(max_configs * 2)}
+        vectors = [vector for vector in sampled if any(vector)][:max_configs - 1]
+    if baseline not in vectors:
+        vectors.insert(0, baseline)
+    return np.array(sorted(vectors), dtype=float)
+
+
+def run_sweep(dataset, vectors, thresholds, workers=1):
+    """Evaluate every weight vector at every threshold, across worker processes when workers > 1"""
+    batches = [vectors[i:i + CONFIG_BATCH_SIZE] for i in range(0, len(vectors), CONFIG_BATCH_SIZE)]
+    if workers > 1 and len(batches) > 1:
+        with multiprocessing.Pool(workers, initializer=_init_calibration_worker,
+                                  initargs=(dataset, thresholds)) as pool:
+            results = pool.map(evaluate_configs, batches)
+    else:
+        _init_calibration_worker(dataset, thresholds)
+        results = [evaluate_configs(batch) for batch in batches]
+    return np.concatenate(results)
+
+
+def pareto_frontier(objectives):
+    """Indexes of the non-dominated rows of an (n, k) array where every objective is maximized"""
+    order = np.lexsort(objectives.T[::-1])[::-1]
+    # In descending lexicographic order no row can be dominated by a later one
+    frontier = []
+    for index in order:
+        point = objectives[index]
+        kept = objectives[frontier]
+        if not np.any(np.all(kept >= point, axis=1) & np.any(kept > point, axis=1)):
+            frontier.append(index)
+    return frontier
+
+
+def calibration_frontier(groups, vectors, thresholds, metrics, min_avg_picks=MIN_AVG_PICKS):
+    """Configurations on the Pareto frontier of excess return, hit rate and (low) turnover.
+
+    Configurations averaging fewer than min_avg_picks picks or never evaluated are left out.
+    Configurations with identical metrics (usually the same picks from different weights) are
+    reported once, keeping the weights closest to the current rule set.
+    """
+    configs = []
+    rows = []
+    for v, vector in enumerate(vectors):
+        for t, threshold in enumerate(thresholds):
+            excess, hit_rate, turnover, avg_picks = metrics[v, t]
+            if np.isnan(excess) or avg_picks < min_avg_picks:
+                continue
+            configs.append({
+                'weights': {group: float(weight) for group, weight in zip(groups, vector)},
+                'threshold': float(threshold),
+                'excess_return': float(excess),
+                'hit_rate': float(hit_rate),
+                'turnover': float(turnover),
+                'avg_picks': float(avg_picks)
+            })
+            rows.append((excess, hit_rate, -turnover))
+
+    if not rows:
+        return [], len(configs)
+    distinct = {}
+    for i in pareto_frontier(np.array(rows)):
+        config = configs[i]
+        key = (rows[i], config['avg_picks'])
+        change = sum(abs(weight - 1.0) for weight in config['weights'].values())
+        if key not in distinct or change < distinct[key][0]:
+            equivalent = distinct[key][1]['equivalent_configs'] + 1 if key in distinct else 1
+            distinct[key] = (change, dict(config, equivalent_configs=equivalent))
+        else:
+            distinct[key][1]['equivalent_configs'] += 1
+
+    frontier = [config for _, config in distinct.values()]
+    frontier.sort(key=lambda config: config['excess_return'], reverse=True)
+    return frontier, len(configs)
+
+
+def baseline_metrics(groups, vectors, thresholds, metrics, threshold=PICK_THRESHOLD):
+    """Metrics of the current rule set (all weights 1) at the current pick threshold, if swept"""
+    baseline = np.flatnonzero(np.all(vectors == 1.0, axis=1))
+    if len(baseline) == 0 or threshold not in list(thresholds):
+        return None
+    excess, hit_rate, turnover, avg_picks = metrics[baseline[0], list(thresholds).index(threshold)]
+    return {'excess_return': float(excess), 'hit_rate': float(hit_rate), 'turnover': float(turnover),
+            'avg_picks': float(avg_picks)}
+
+
+def print_frontier(frontier, baseline, evaluated, limit=15):
+    """Print the best frontier configurations next to the current settings"""
+    print(f"{len(frontier)} Pareto-optimal configurations out of {evaluated} evaluated")
+    if baseline:
+        print(f"Current settings: excess {baseline['excess_return']:.2%}, hit rate {baseline['hit_rate']:.1%}, "
+              f"turnover {baseline['turnover']:.1%}, {baseline['avg_picks']:.1f} picks")
+    for config in frontier[:limit]:
+        weights = ', '.join(f"{group}={weight:g}" for group, weight in config['weights'].items())
+        print(f"  threshold {config['threshold']:g}: excess {config['excess_return']:.2%}, "
+              f"hit rate {config['hit_rate']:.1%}, turnover {config['turnover']:.1%}, "
+              f"{config['avg_picks']:.1f} picks | {weights}")
+
+
+def calibrate(dates, replays, weights=DEFAULT_WEIGHTS, thresholds=DEFAULT_THRESHOLDS, horizon=CALIBRATION_HORIZON,
+              max_configs=MAX_CONFIGS, min_avg_picks=MIN_AVG_PICKS, workers=1):
+    """Sweep weight vectors and thresholds over component replays and return the results"""
+    dataset = build_calibration_dataset(dates, replays, horizon)
+    vectors = weight_grid(len(dataset['groups']), weights, max_configs)
+
+    start = time.perf_counter()
+    metrics = run_sweep(dataset, vectors, thresholds, workers)
+    elapsed = time.perf_counter() - start
+
+    frontier, evaluated = calibration_frontier(dataset['groups'], vectors, thresholds, metrics, min_avg_picks)
+    print(f"Swept {len(vectors)} weight vectors x {len(thresholds)} thresholds "
+          f"({len(vectors) * len(thresholds)} configurations) in {elapsed:.2f}s")
+    return {
+        'horizon': horizon,
+        'dates': [str(date) for date in dates],
+        'groups': dataset['groups'],
+        'configurations': len(vectors) * len(thresholds),
+        'baseline': baseline_metrics(dataset['groups'], vectors, thresholds, metrics),
+        'frontier': frontier,
+        'evaluated': evaluated
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Calibrate scoring weights and the pick threshold on stored snapshots')
+    parser.add_argument('--snapshots', type=str, default=SNAPSHOT_PATTERN, help='Glob of the daily snapshot files')
+    parser.add_argument('--start', type=str, default=None, help='First snapshot date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=str, default=None, help='Last snapshot date (YYYY-MM-DD)')
+    parser.add_argument('--step', type=int, default=1, help='Rebalance on every Nth snapshot')
+    parser.add_argument('--rules', type=str, default=None, help='Rule set file (defaults to scoring_rules.json)')
+    parser.add_argument('--group-by', choices=GROUPINGS, default='category', help='What each weight applies to')
+    parser.add_argument('--weights', type=float, nargs='+', default=DEFAULT_WEIGHTS, help='Weight values to sweep')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=DEFAULT_THRESHOLDS,
+                        help='Pick thresholds to sweep')
+    parser.add_argument('--horizon', type=int, default=CALIBRATION_HORIZON, help='Forward return horizon in trading days')
+    parser.add_argument('--max-configs', type=int, default=MAX_CONFIGS,
+                        help='Weight vectors to sweep; larger grids are sampled')
+    parser.add_argument('--min-picks', type=float, default=MIN_AVG_PICKS,
+                        help='Leave out configurations with fewer picks on average')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) - 1),
+                        help='Processes used to replay snapshots and sweep configurations')
+    parser.add_argument('--output', type=str, default=CALIBRATION_OUTPUT_PATH, help='Where to write the frontier')
+    parser.add_argument('--benchmark', action='store_true', help='Calibrate on a synthetic year of snapshots')
+    add_liquidity_arguments(parser)
+    args = parser.parse_args()
+    liquidity_gate = liquidity_gate_options(args)
+
+    start = time.perf_counter()
+    if args.benchmark:
+        rules = load_rules(args.rules) if args.rules else load_rules()
+        snapshots = generate_synthetic_snapshots(load_latest_data())[::max(args.step, 1)]
+        dates = [date for date, _ in snapshots]
+        replays = [replay_components(stock_data, rules, args.group_by, liquidity_gate) for _, stock_data in snapshots]
+    else:
+        snapshots = find_snapshots(args.snapshots, args.start, args.end)[::max(args.step, 1)]
+        if len(snapshots) < 2:
+            print(f"Need at least two snapshots matching {args.snapshots}, found {len(snapshots)}")
+            raise SystemExit(1)
+        dates = [date for date, _ in snapshots]
+        replays = replay_snapshots([path for _, path in snapshots], args.rules, args.workers,
+                                   replay=replay_components, group_by=args.group_by, liquidity_gate=liquidity_gate)
+    print(f"Replayed {len(dates)} snapshots into {len(replays[0]['groups'])} score components "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    results = calibrate(dates, replays, args.weights, args.thresholds, args.horizon, args.max_configs,
+                        args.min_picks, args.workers)
+    print_frontier(results['frontier'], results['baseline'], results['evaluated'])
+
+    if args.output and not args.benchmark:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Frontier saved to {args.output}")
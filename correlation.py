@@ -0,0 +1,359 @@
+import json
+import os
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+from price_metrics import MIN_RETURN_OBSERVATIONS, compute_return_matrix, load_price_matrix
+from rule_compiler import PICK_THRESHOLD
+
+DIVERSIFICATION_PATH = 'data/diversification.json'
+
+# Daily returns the correlations are measured over (about one trading year)
+CORRELATION_LOOKBACK = 252
+MIN_OVERLAP = MIN_RETURN_OBSERVATIONS
+# Picks correlated at least this much on average (average linkage) form a cluster
+CLUSTER_CORRELATION = 0.7
+# Symbols per block of the universe-wide pass; each block pair holds a few BLOCK_SIZE x BLOCK_SIZE arrays
+BLOCK_SIZE = 512
+TOP_PAIRS = 10
+HISTOGRAM_EDGES = np.linspace(-1, 1, 21)
+
+
+def return_panel(close, symbols=None, lookback=CORRELATION_LOOKBACK):
+    """Daily returns over the last lookback days of a close matrix (see load_price_matrix).
+
+    Returns the symbols that have a price column (all columns when symbols is None, otherwise
+    those of the given symbols in their order) and a days x symbol array of their returns, NaN
+    where a symbol did not trade on either day.
+    """
+    if close is None or close.empty:
+        return [], np.zeros((0, 0))
+    if symbols is None:
+        found = list(close.columns)
+    else:
+        columns = set(close.columns)
+        found = [symbol for symbol in symbols if symbol in columns]
+    values = close[found].to_numpy(dtype=float)[-(lookback + 1):]
+    return found, compute_return_matrix(values)
+
+
+def _center(returns):
+    """Returns minus each symbol's mean with missing days zeroed, and the observed-day mask"""
+    observed = ~np.isnan(returns)
+    with np.errstate(invalid='ignore'):
+        mean = np.where(observed, returns, 0.0).sum(axis=0) / observed.sum(axis=0)
+    return np.where(observed, returns - mean, 0.0), observed.astype(float)
+
+
+def block_correlation(values_a, mask_a, values_b, mask_b, min_overlap=MIN_OVERLAP):
+    """Pairwise-complete Pearson correlations between two blocks of centered returns (see _center).
+
+    Each pair only uses the days both symbols traded, so the result matches a pandas corr with
+    min_periods=min_overlap, computed with six matrix products instead of a loop over pairs.
+    Pairs with fewer common days or no variance are NaN.
+    """
+    overlap = mask_a.T @ mask_b
+    sum_a = values_a.T @ mask_b
+    sum_b = mask_a.T @ values_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = values_a.T @ values_b - sum_a * sum_b / overlap
+        variance_a = (values_a ** 2).T @ mask_b - sum_a ** 2 / overlap
+        variance_b = mask_a.T @ values_b ** 2 - sum_b ** 2 / overlap
+        correlation = covariance / np.sqrt(variance_a * variance_b)
+    correlation[(overlap < min_overlap) | ~(variance_a > 0) | ~(variance_b > 0)] = np.nan
+    return np.clip(correlation, -1, 1)
+
+
+def correlation_blocks(returns, min_overlap=MIN_OVERLAP, block_size=BLOCK_SIZE):
+    """Yield (start_a, start_b, correlations) for every block pair on or above the diagonal"""
+    values, mask = _center(returns)
+    count = returns.shape[1]
+    for start_a in range(0, count, block_size):
+        block_a = slice(start_a, start_a + block_size)
+        for start_b in range(start_a, count, block_size):
+            block_b = slice(start_b, start_b + block_size)
+            yield start_a, start_b, block_correlation(values[:, block_a], mask[:, block_a],
+                                                      values[:, block_b], mask[:, block_b], min_overlap)
+
+
+def correlation_matrix(returns, min_overlap=MIN_OVERLAP, block_size=BLOCK_SIZE):
+    """Full symbol x symbol correlation matrix of a return panel, with ones on the diagonal"""
+    count = returns.shape[1]
+    matrix = np.empty((count, count))
+    for start_a, start_b, block in correlation_blocks(returns, min_overlap, block_size):
+        rows = slice(start_a, start_a + block.shape[0])
+        columns = slice(start_b, start_b + block.shape[1])
+        matrix[rows, columns] = block
+        matrix[columns, rows] = block.T
+    np.fill_diagonal(matrix, 1.0)
+    return matrix
+
+
+def average_linkage(distance):
+    """Agglomerative clustering of a symmetric distance matrix with average linkage.
+
+    Repeatedly merges the two closest clusters and updates the distances to the merged cluster
+    as the size-weighted average (Lance-Williams), so the matrix is never recomputed. Returns an
+    (n - 1) x 4 array of merges in the SciPy linkage layout: the two cluster ids (n + k for the
+    cluster made by merge k), their distance and the size of the merged cluster.
+    """
+    count = len(distance)
+    distance = np.array(distance, dtype=float)
+    np.fill_diagonal(distance, np.inf)
+    ids = np.arange(count)
+    sizes = np.ones(count)
+    merges = np.zeros((max(count - 1, 0), 4))
+
+    for step in range(count - 1):
+        i, j = sorted(np.unravel_index(np.argmin(distance), distance.shape))
+        merges[step] = [min(ids[i], ids[j]), max(ids[i], ids[j]), distance[i, j], sizes[i] + sizes[j]]
+
+        # The merged cluster takes row i; row j is retired
+        merged = (sizes[i] * distance[i] + sizes[j] * distance[j]) / (sizes[i] + sizes[j])
+        distance[i] = merged
+        distance[:, i] = merged
+        distance[i, i] = np.inf
+        distance[j] = np.inf
+        distance[:, j] = np.inf
+        sizes[i] += sizes[j]
+        ids[i] = count + step
+    return merges
+
+
+def cut_clusters(merges, count, max_distance):
+    """Clusters formed by the merges at or below max_distance, as lists of member indexes.
+
+    Average linkage never merges at a smaller distance than an earlier merge, so the cut stops
+    at the first merge above max_distance. Clusters are ordered largest first.
+    """
+    members = {i: [i] for i in range(count)}
+    for step, (a, b, distance, _) in enumerate(merges):
+        if distance > max_distance:
+            break
+        members[count + step] = members.pop(int(a)) + members.pop(int(b))
+    return sorted((sorted(group) for group in members.values()), key=lambda group: (-len(group), group[0]))
+
+
+def _upper_values(matrix):
+    return matrix[np.triu_indices(len(matrix), k=1)]
+
+
+def _top_pairs(matrix, symbols, limit):
+    rows, columns = np.triu_indices(len(matrix), k=1)
+    values = matrix[rows, columns]
+    order = np.argsort(-np.nan_to_num(values, nan=-np.inf), kind='stable')[:limit]
+    return [{'symbols': [symbols[rows[k]], symbols[columns[k]]], 'correlation': float(values[k])}
+            for k in order if not np.isnan(values[k])]
+
+
+def universe_correlation_stats(returns, symbols, min_overlap=MIN_OVERLAP, block_size=BLOCK_SIZE, limit=TOP_PAIRS):
+    """Correlation statistics of a whole universe without holding its correlation matrix.
+
+    Block pairs are reduced as they are computed into the average pairwise correlation, a
+    histogram, each symbol's average correlation to the others and the most correlated pairs,
+    so memory stays at a few block_size x block_size arrays however many symbols there are.
+    """
+    count = len(symbols)
+    symbol_sums = np.zeros(count)
+    symbol_counts = np.zeros(count)
+    histogram = np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=int)
+    total, pairs = 0.0, 0
+    top_values = np.array([])
+    top_rows = np.array([], dtype=int)
+    top_columns = np.array([], dtype=int)
+
+    for start_a, start_b, block in correlation_blocks(returns, min_overlap, block_size):
+        rows = np.arange(start_a, start_a + block.shape[0])
+        columns = np.arange(start_b, start_b + block.shape[1])
+        if start_a == start_b:
+            # Diagonal blocks count each pair once, from the strictly upper triangle
+            block = block.copy()
+            block[np.tril_indices(len(block))] = np.nan
+        valid = ~np.isnan(block)
+        filled = np.where(valid, block, 0.0)
+        symbol_sums[rows] += filled.sum(axis=1)
+        symbol_counts[rows] += valid.sum(axis=1)
+        symbol_sums[columns] += filled.sum(axis=0)
+        symbol_counts[columns] += valid.sum(axis=0)
+        total += filled.sum()
+        pairs += int(valid.sum())
+        histogram += np.histogram(block[valid], bins=HISTOGRAM_EDGES)[0]
+
+        # Keep the best pairs of this block and of the blocks before it
+        flat = np.where(valid, block, -np.inf).ravel()
+        best = np.argpartition(-flat, min(limit, flat.size) - 1)[:limit] if flat.size else np.array([], dtype=int)
+        best = best[np.isfinite(flat[best])]
+        top_values = np.concatenate([top_values, flat[best]])
+        top_rows = np.concatenate([top_rows, rows[best // block.shape[1]]])
+        top_columns = np.concatenate([top_columns, columns[best % block.shape[1]]])
+        keep = np.argsort(-top_values, kind='stable')[:limit]
+        top_values, top_rows, top_columns = top_values[keep], top_rows[keep], top_columns[keep]
+
+    with np.errstate(invalid='ignore'):
+        symbol_average = symbol_sums / symbol_counts
+    ranked = np.argsort(-np.nan_to_num(symbol_average, nan=-np.inf), kind='stable')[:limit]
+    return {
+        'symbols': count,
+        'pairs': pairs,
+        'average_correlation': total / pairs if pairs else None,
+        'histogram': {'edges': HISTOGRAM_EDGES.tolist(), 'counts': histogram.tolist()},
+        'top_pairs': [{'symbols': [symbols[i], symbols[j]], 'correlation': float(value)}
+                      for i, j, value in zip(top_rows, top_columns, top_values)],
+        'most_correlated': [{'symbol': symbols[i], 'average_correlation': float(symbol_average[i])}
+                            for i in ranked if not np.isnan(symbol_average[i])]
+    }
+
+
+def diversification_summary(picks, close, cluster_correlation=CLUSTER_CORRELATION, lookback=CORRELATION_LOOKBACK,
+                            universe=False, block_size=BLOCK_SIZE):
+    """Diversification of the pick list from the return correlations of the picks.
+
+    picks maps symbol to a dict with its sector (the analysis picks). Reports the average
+    pairwise correlation, the effective number of independent picks of an equal-weight
+    portfolio, the sector mix, the most correlated pairs and the clusters of picks that move
+    together (average linkage on 1 - correlation, cut at cluster_correlation). Pairs without
+    enough common trading days count as uncorrelated for clustering. With universe=True the
+    same statistics of every priced stock are added as a baseline. Returns None without prices.
+    """
+    symbols, returns = return_panel(close, list(picks), lookback)
+    if not symbols:
+        return None
+
+    matrix = correlation_matrix(returns, block_size=block_size)
+    pair_values = _upper_values(matrix)
+    pair_values = pair_values[~np.isnan(pair_values)]
+    average = float(pair_values.mean()) if len(pair_values) else None
+
+    distance = 1 - np.nan_to_num(matrix, nan=0.0)
+    clusters = []
+    for members in cut_clusters(average_linkage(distance), len(symbols), 1 - cluster_correlation):
+        if len(members) < 2:
+            break
+        within = _upper_values(matrix[np.ix_(members, members)])
+        clusters.append({
+            'symbols': [symbols[i] for i in members],
+            'average_correlation': float(np.nanmean(within)) if (~np.isnan(within)).any() else None,
+            'sectors': dict(Counter(picks[symbols[i]].get('sector') or 'Unknown' for i in members).most_common())
+        })
+
+    sectors = Counter(data.get('sector') or 'Unknown' for data in picks.values())
+    largest_sector, largest_count = sectors.most_common(1)[0]
+    summary = {
+        'picks': len(picks),
+        'priced_picks': len(symbols),
+        'lookback_days': int(returns.shape[0]),
+        'average_correlation': average,
+        'median_correlation': float(np.median(pair_values)) if len(pair_values) else None,
+        'highly_correlated_pairs': int((pair_values >= cluster_correlation).sum()),
+        # Independent bets an equal-weight portfolio of the picks amounts to at the average correlation
+        'effective_picks': len(symbols) / (1 + (len(symbols) - 1) * average) if average is not None else None,
+        'largest_sector': {'sector': largest_sector, 'picks': largest_count, 'share': largest_count / len(picks) * 100},
+        'sectors': dict(sectors.most_common()),
+        'cluster_correlation': cluster_correlation,
+        'clusters': clusters,
+        'top_pairs': _top_pairs(matrix, symbols, TOP_PAIRS)
+    }
+    if universe:
+        universe_symbols, universe_returns = return_panel(close, None, lookback)
+        summary['universe'] = universe_correlation_stats(universe_returns, universe_symbols, block_size=block_size)
+    return summary
+
+
+def save_diversification(summary, path=DIVERSIFICATION_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+# ----- BENCHMARK -----
+
+def synthetic_returns(days, count, factors=10, missing=0.02, seed=42):
+    """Daily returns of a market plus one sector factor per symbol with some missing days, so
+    correlations have real structure"""
+    rng = np.random.default_rng(seed)
+    sector = rng.integers(factors, size=count)
+    exposure = rng.uniform(0, 2, count)
+    market = rng.normal(0, 0.008, (days, 1))
+    sector_returns = rng.normal(0, 0.01, (days, factors))
+    returns = market + sector_returns[:, sector] * exposure + rng.normal(0, 0.01, (days, count))
+    returns[rng.random((days, count)) < missing] = np.nan
+    return returns
+
+
+def run_benchmark(sizes=(500, 2_000, 8_000), block_size=BLOCK_SIZE):
+    """Time the blocked universe pass and check it against a full pairwise-complete matrix"""
+    for count in sizes:
+        returns = synthetic_returns(CORRELATION_LOOKBACK, count)
+        symbols = [f"S{i:05d}" for i in range(count)]
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        stats = universe_correlation_stats(returns, symbols, block_size=block_size)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{count:>6,} symbols: {stats['pairs']:,} pairs in {elapsed:.2f}s, peak memory {peak / 2**20:.0f} MB "
+              f"(full matrix would be {count * count * 8 / 2**20:.0f} MB), "
+              f"average correlation {stats['average_correlation']:.4f}")
+
+        if count <= 2_000:
+            full = _upper_values(correlation_matrix(returns, block_size=count))
+            full_average = np.nanmean(full)
+            print(f"        full matrix average {full_average:.4f}, "
+                  f"difference {abs(full_average - stats['average_correlation']):.2e}")
+
+    # Clustering a pick-list-sized matrix
+    returns = synthetic_returns(CORRELATION_LOOKBACK, 800)
+    start = time.perf_counter()
+    merges = average_linkage(1 - np.nan_to_num(correlation_matrix(returns), nan=0.0))
+    elapsed = time.perf_counter() - start
+    clusters = [group for group in cut_clusters(merges, 800, 1 - CLUSTER_CORRELATION) if len(group) > 1]
+    print(f"   800 picks: correlation and average linkage in {elapsed:.2f}s, {len(clusters)} clusters")
+
+
+if __name__ == "__main__":
+    import argparse
+    from price_metrics import PRICE_MATRIX_PATH
+    parser = argparse.ArgumentParser(description='Return correlations and diversification of the pick list')
+    parser.add_argument('--prices', type=str, default=PRICE_MATRIX_PATH, help='Close matrix saved by the collector')
+    parser.add_argument('--picks', type=str, default='data/detailed_analysis.json',
+                        help='Detailed analysis whose stocks at or above --threshold are the picks')
+    parser.add_argument('--threshold', type=float, default=PICK_THRESHOLD, help='Total score a pick needs')
+    parser.add_argument('--cluster-correlation', type=float, default=CLUSTER_CORRELATION,
+                        help='Average correlation at which picks are clustered together')
+    parser.add_argument('--universe', action='store_true', help='Add universe-wide statistics (blocked pass)')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='Symbols per block of the universe pass')
+    parser.add_argument('--output', type=str, default=DIVERSIFICATION_PATH, help='Where the summary is written')
+    parser.add_argument('--benchmark', action='store_true', help='Time the blocked pass on synthetic returns')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(block_size=args.block_size)
+        raise SystemExit(0)
+
+    close = load_price_matrix(args.prices)
+    if close is None:
+        print(f"No price matrix at {args.prices}; run the data collector first")
+        raise SystemExit(1)
+    with open(args.picks, 'r') as f:
+        analysis = json.load(f)
+    picks = {symbol: data for symbol, data in analysis.items() if (data.get('total_score') or 0) >= args.threshold}
+
+    summary = diversification_summary(picks, close, args.cluster_correlation, universe=args.universe,
+                                      block_size=args.block_size)
+    if summary is None:
+        print("None of the picks have price history")
+        raise SystemExit(1)
+    save_diversification(summary, args.output)
+    print(f"{summary['priced_picks']} of {summary['picks']} picks priced over {summary['lookback_days']} days: "
+          f"average correlation {summary['average_correlation']:.2f}, "
+          f"{summary['effective_picks']:.1f} effective picks, {len(summary['clusters'])} clusters")
+    for cluster in summary['clusters']:
+        print(f"  {cluster['average_correlation']:.2f}: {', '.join(cluster['symbols'])}")
+    if 'universe' in summary:
+        print(f"Universe average correlation {summary['universe']['average_correlation']:.2f} "
+              f"over {summary['universe']['pairs']:,} pairs")
+    print(f"Summary written to {args.output}")
@@ -11,6 +11,13 @@ import ssl
 import random
 import traceback
 from tqdm import tqdm
+from price_metrics import (
+    BENCHMARK_SYMBOL, build_price_matrices, compute_liquidity_metrics, compute_return_metrics, compute_risk_metrics,
+    save_price_matrix
+)
+from statement_ratios import apply_statement_metrics, latest_free_cash_flow, statement_metrics
+from snapshot_store import save_snapshot
+from statements_panel import build_statements_panel, save_statements_panel
 
 # Configure SSL context and disable warnings
 ssl._create_default_https_context = ssl._create_unverified_context
@@ -18,6 +25,9 @@ import warnings
 
 warnings.filterwarnings('ignore')
 
+# One year of daily history covers the 12-month return, the 52-week range and the 200-day average
+PRICE_HISTORY_PERIOD = "1y"
+
 
 def get_all_indian_stocks():
     """Get complete list of stocks from both NSE and BSE"""
@@ -233,11 +243,14 @@ def calculate_basic_technical_indicators(df):
     try:
         # Use only closing prices
         close_prices = df['Close'].values
+        # Trading date of each stored close, so backtests align on the exchange's own calendar
+        close_dates = pd.DatetimeIndex(df.index).strftime('%Y-%m-%d')
 
         # Basic indicators
         result = {
             'price_history_available': True,
-            'historical_prices': close_prices[-50:].tolist() if len(close_prices) >= 50 else close_prices.tolist()
+            'historical_prices': close_prices[-50:].tolist() if len(close_prices) >= 50 else close_prices.tolist(),
+            'historical_dates': close_dates[-50:].tolist() if len(close_dates) >= 50 else close_dates.tolist()
         }
 
         # 50-day and 200-day moving averages
@@ -397,8 +410,13 @@ def extract_growth_metrics(stock):
     except Exception as e:
         print(f"Error extracting growth metrics: {e}")
         return {}
-def process_single_stock(symbol):
-    """Process a single stock with all required data"""
+def process_single_stock(symbol, price_histories=None, statements=None):
+    """Process a single stock with all required data.
+
+    If price_histories is given, the fetched OHLCV frame is stored in it for the batched
+    universe-wide stages that run after collection. Likewise statements collects the full
+    annual statements (every period, not only the latest) for the statements panel.
+    """
     try:
         print(f"Processing {symbol}")
 
@@ -444,78 +462,15 @@ def process_single_stock(symbol):
             print(f"Warning: Failed to fetch cash flow statement for {symbol}: {e}")
             cash_flow = pd.DataFrame()
 
-        # Calculate fundamental metrics
-        try:
-            if 'returnOnEquity' in info:
-                roe = info['returnOnEquity'] * 100
-            else:
-                if not income_stmt.empty and not balance_sheet.empty:
-                    net_income = None
-                    for field in ['Net Income', 'Net Income From Continuing Operation Net Minority Interest',
-                                  'Net Income Common Stockholders']:
-                        if field in income_stmt.index:
-                            net_income = income_stmt.loc[field].iloc[0]
-                            break
-
-                    total_equity = None
-                    for field in ['Stockholders Equity', 'Total Equity Gross Minority Interest', 'Common Stock Equity']:
-                        if field in balance_sheet.index:
-                            total_equity = balance_sheet.loc[field].iloc[0]
-                            break
-
-                    roe = (
-                                      net_income / total_equity) * 100 if net_income and total_equity and total_equity > 0 else None
-                else:
-                    roe = None
-        except Exception:
-            roe = None
+        if statements is not None:
+            statements[symbol] = {'balance_sheet': balance_sheet, 'income_stmt': income_stmt, 'cashflow': cash_flow}
 
+        # ROE and D/E come from Yahoo's info; statement-derived values fill them in after collection.
+        # FCF is set here so the per-batch saves have it
+        roe = info['returnOnEquity'] * 100 if info.get('returnOnEquity') is not None else None
+        debt_to_equity = info['debtToEquity'] / 100 if info.get('debtToEquity') is not None else None
         try:
-            if 'debtToEquity' in info:
-                debt_to_equity = info['debtToEquity'] / 100
-            else:
-                if not balance_sheet.empty:
-                    total_debt = None
-                    if 'Total Debt' in balance_sheet.index:
-                        total_debt = balance_sheet.loc['Total Debt'].iloc[0]
-                    else:
-                        long_term_debt = balance_sheet.loc['Long Term Debt'].iloc[
-                            0] if 'Long Term Debt' in balance_sheet.index else 0
-                        short_term_debt = balance_sheet.loc['Current Debt'].iloc[
-                            0] if 'Current Debt' in balance_sheet.index else 0
-                        total_debt = long_term_debt + short_term_debt
-
-                    total_equity = None
-                    for field in ['Stockholders Equity', 'Total Equity Gross Minority Interest', 'Common Stock Equity']:
-                        if field in balance_sheet.index:
-                            total_equity = balance_sheet.loc[field].iloc[0]
-                            break
-
-                    debt_to_equity = total_debt / total_equity if total_debt is not None and total_equity is not None and total_equity > 0 else None
-                else:
-                    debt_to_equity = None
-        except Exception:
-            debt_to_equity = None
-
-        # Try to calculate FCF
-        try:
-            if not cash_flow.empty:
-                operating_cf = None
-                for field in ['Operating Cash Flow', 'CashFlowFromOperations', 'CashFromOperations']:
-                    if field in cash_flow.index:
-                        operating_cf = cash_flow.loc[field].iloc[0]
-                        break
-
-                capital_expenditure = None
-                for field in ['Capital Expenditure', 'CapitalExpenditures', 'Capex']:
-                    if field in cash_flow.index:
-                        capital_expenditure = cash_flow.loc[field].iloc[0]
-                        break
-
-                fcf = operating_cf - abs(
-                    capital_expenditure) if operating_cf is not None and capital_expenditure is not None else None
-            else:
-                fcf = None
+            fcf = latest_free_cash_flow(cash_flow)
         except Exception:
             fcf = None
 
@@ -557,9 +512,10 @@ def process_single_stock(symbol):
 
         # Always try to get technical data for all stocks
         try:
-            # Use period="6mo" to match yfinance's expected format
-            hist_data = fetch_historical_price_data(symbol, period="6mo")
+            hist_data = fetch_historical_price_data(symbol, period=PRICE_HISTORY_PERIOD)
             if hist_data is not None and not hist_data.empty:
+                if price_histories is not None:
+                    price_histories[symbol] = hist_data
                 technical_data = calculate_basic_technical_indicators(hist_data)
                 if technical_data:
                     stock_data.update(technical_data)
@@ -578,11 +534,67 @@ def process_single_stock(symbol):
         }, False
 
 
+def add_price_metrics(all_data, price_histories):
+    """Compute risk, liquidity and return metrics for all collected symbols in one batch.
+
+    The results are stored with the existing technical fields of each symbol, and the close
+    matrix is saved for the correlation stage of the analysis.
+    """
+    if not price_histories:
+        return
+
+    print(f"Calculating risk, liquidity and return metrics for {len(price_histories)} stocks...")
+    benchmark_history = fetch_historical_price_data(BENCHMARK_SYMBOL, period=PRICE_HISTORY_PERIOD)
+    if benchmark_history is None:
+        print(f"Benchmark {BENCHMARK_SYMBOL} unavailable, beta will not be calculated")
+
+    try:
+        matrices = build_price_matrices(price_histories, ('Close', 'High', 'Low', 'Volume'))
+        risk_metrics = compute_risk_metrics(
+            matrices['Close'],
+            matrices['High'],
+            matrices['Low'],
+            benchmark_history['Close'] if benchmark_history is not None else None
+        )
+        market_caps = {symbol: data.get('market_cap') for symbol, data in all_data.items()}
+        liquidity_metrics = compute_liquidity_metrics(matrices['Close'], matrices['Volume'], market_caps)
+        return_metrics = compute_return_metrics(matrices['Close'])
+        save_price_matrix(matrices['Close'])
+    except Exception as e:
+        print(f"Error calculating price metrics: {e}")
+        traceback.print_exc()
+        return
+
+    for metrics_by_symbol in (risk_metrics, liquidity_metrics, return_metrics):
+        for symbol, metrics in metrics_by_symbol.items():
+            if symbol in all_data and 'error' not in all_data[symbol]:
+                all_data[symbol].update(metrics)
+
+
+def add_statement_metrics(all_data, statements):
+    """Store every collected symbol's multi-period statements as one symbol x period x line-item
+    panel and derive the statement ratios, growth rates and line items of all symbols from it.
+    """
+    if not statements:
+        return
+
+    try:
+        panel = build_statements_panel(statements)
+        save_statements_panel(panel)
+        print(f"Saved statements panel: {len(panel['symbols'])} symbols, {len(panel['items'])} line items")
+        apply_statement_metrics(all_data, statement_metrics(panel))
+    except Exception as e:
+        print(f"Error deriving statement metrics: {e}")
+        traceback.print_exc()
+
+
 def process_stocks(symbols_to_process, batch_size=25, max_runtime=None):
     """Process a list of stocks in batches with runtime checks"""
     print(f"Starting to process {len(symbols_to_process)} stocks...")
 
     all_data = {}
+    price_histories = {}
+    statements = {}
     start_time = time.time()
 
     # Create a counter for successful and failed stocks
@@ -608,7 +620,7 @@ def process_stocks(symbols_to_process, batch_size=25, max_runtime=None):
 
         # Process each stock in the batch
         for symbol in current_batch:
-            stock_data, success = process_single_stock(symbol)
+            stock_data, success = process_single_stock(symbol, price_histories, statements)
             all_data[symbol] = stock_data
 
             # Update counters
@@ -630,6 +642,10 @@ def process_stocks(symbols_to_process, batch_size=25, max_runtime=None):
             print(f"Pausing for {sleep_time} seconds to respect API limits...")
             time.sleep(sleep_time)
 
+    # Batched stages over the whole universe
+    add_price_metrics(all_data, price_histories)
+    add_statement_metrics(all_data, statements)
+
     return all_data
 
 
@@ -639,10 +655,8 @@ def save_data(data):
         output_dir = 'data'
         os.makedirs(output_dir, exist_ok=True)
 
-        # Save daily snapshot
-        daily_file = f"{output_dir}/stock_data_{datetime.now().strftime('%Y-%m-%d')}.json"
-        with open(daily_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Save daily snapshot to the snapshot store the backtest replays
+        daily_file = save_snapshot(data, datetime.now().strftime('%Y-%m-%d'))
 
         # Update latest data
         with open(f"{output_dir}/latest.json", 'w') as f:
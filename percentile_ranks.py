@@ -0,0 +1,142 @@
+import time
+
+import numpy as np
+
+# Metrics ranked across the universe and within each sector
+RANKED_METRICS = [
+    'revenue_yoy', 'revenue_ttm_yoy', 'revenue_qoq', 'operating_profit_yoy', 'operating_profit_qoq',
+    'net_profit_yoy', 'net_profit_qoq', 'profit_margin', 'roe', 'returnOnAssets', 'debt_to_equity',
+    'interestCoverageRatio', 'currentRatio', 'fcf', 'market_cap', 'pe_ratio', 'pb_ratio', 'margin_of_safety',
+    'dividendYield', 'payoutRatio', 'rsi', 'promoterHolding', 'volatility', 'beta', 'max_drawdown',
+    'avg_daily_traded_value', 'turnover_ratio', 'return_1m', 'return_3m', 'return_6m', 'return_12m',
+    'high_52w_distance', 'revenue_cagr_3y', 'net_income_cagr_3y', 'revenue_growth_stability'
+]
+
+RANK_SCOPES = ['universe', 'sector']
+
+
+def _to_float(value):
+    if value is None or isinstance(value, (bool, str, list, dict)):
+        return np.nan
+    return float(value)
+
+
+def group_percentile_ranks(values, group_codes):
+    """Percentile rank (0-100) of each value within its group, from one lexsort.
+
+    Ties share their average rank, the lowest value of a group ranks 0 and the highest 100; a
+    group with a single value ranks it 50. NaN values are not ranked and get NaN.
+    """
+    ranks = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return ranks
+
+    order = valid[np.lexsort((values[valid], group_codes[valid]))]
+    sorted_values = values[order]
+    sorted_groups = group_codes[order]
+    positions = np.arange(len(order))
+
+    # Boundaries of groups and of runs of tied values within a group
+    new_group = np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+    new_run = new_group | np.r_[True, sorted_values[1:] != sorted_values[:-1]]
+
+    group_ids = np.cumsum(new_group) - 1
+    group_starts = positions[new_group]
+    group_sizes = np.diff(np.r_[group_starts, len(order)])
+
+    run_ids = np.cumsum(new_run) - 1
+    run_starts = positions[new_run]
+    run_ends = np.r_[run_starts[1:], len(order)] - 1
+    average_positions = (run_starts + run_ends)[run_ids] / 2
+
+    within_group = average_positions - group_starts[group_ids]
+    sizes = group_sizes[group_ids]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ranks[order] = np.where(sizes > 1, within_group / (sizes - 1) * 100, 50.0)
+    return ranks
+
+
+def compute_percentile_ranks(records, sectors, metrics=RANKED_METRICS):
+    """Universe-wide and sector-wide percentile ranks of every metric for a list of stock records.
+
+    Each metric costs one sort for the universe and one for the sectors, O(N log N) per metric.
+    Returns a dict mapping metric to {'universe': ranks, 'sector': ranks} arrays aligned with
+    records, NaN where the metric is missing.
+    """
+    sector_names, sector_codes = np.unique(np.array(sectors, dtype=object).astype(str), return_inverse=True)
+    universe_codes = np.zeros(len(records), dtype=np.int64)
+
+    ranks = {}
+    for metric in metrics:
+        values = np.array([_to_float(data.get(metric)) for data in records], dtype=float)
+        ranks[metric] = {
+            'universe': group_percentile_ranks(values, universe_codes),
+            'sector': group_percentile_ranks(values, sector_codes)
+        }
+    return ranks
+
+
+def percentile_ranks_at(ranks, row):
+    """Ranks of one stock as {metric: {'universe': pct, 'sector': pct}}, skipping missing metrics"""
+    stock_ranks = {}
+    for metric, scopes in ranks.items():
+        if not np.isnan(scopes['universe'][row]):
+            stock_ranks[metric] = {scope: round(float(scopes[scope][row]), 2) for scope in RANK_SCOPES}
+    return stock_ranks
+
+
+def rank_column_name(metric, scope):
+    """Name of a rank column in the vectorized scorer's frame, e.g. roe_sector_pct"""
+    return f"{metric}_{scope}_pct"
+
+
+# ----- BENCHMARK -----
+
+def naive_percentile_ranks(values, group_codes):
+    """Peer scan per stock, for benchmarking against the single-sort ranks"""
+    ranks = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        if np.isnan(value):
+            continue
+        peers = values[(group_codes == group_codes[i]) & ~np.isnan(values)]
+        if len(peers) == 1:
+            ranks[i] = 50.0
+        else:
+            below = (peers < value).sum()
+            ties = (peers == value).sum()
+            ranks[i] = (below + (ties - 1) / 2) / (len(peers) - 1) * 100
+    return ranks
+
+
+def run_benchmark(sizes=(2_000, 20_000, 100_000), naive_limit=20_000):
+    """Time the sorted ranks against a per-stock peer scan and check they agree"""
+    rng = np.random.default_rng(42)
+    for size in sizes:
+        values = np.round(rng.normal(12, 10, size), 1)
+        values[rng.random(size) < 0.1] = np.nan
+        group_codes = rng.integers(0, 12, size)
+
+        start = time.perf_counter()
+        ranks = group_percentile_ranks(values, group_codes)
+        sorted_time = time.perf_counter() - start
+
+        line = f"{size:>7,} stocks: sorted ranks {sorted_time:.4f}s"
+        if size <= naive_limit:
+            start = time.perf_counter()
+            expected = naive_percentile_ranks(values, group_codes)
+            line += f", peer scan {time.perf_counter() - start:.3f}s"
+            line += ", identical" if np.allclose(ranks, expected, equal_nan=True) else ", MISMATCH"
+        print(line)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Percentile rank utilities')
+    parser.add_argument('--benchmark', action='store_true', help='Benchmark against a per-stock peer scan')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark()
+    else:
+        parser.print_help()
@@ -0,0 +1,265 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from correlation import CORRELATION_LOOKBACK, MIN_OVERLAP, return_panel, synthetic_returns
+from price_metrics import TRADING_DAYS_PER_YEAR, load_price_matrix
+from rule_compiler import PICK_THRESHOLD
+
+PORTFOLIO_PATH = 'data/portfolio.json'
+
+PORTFOLIO_SCHEMES = ['equal_weight', 'inverse_volatility', 'risk_parity', 'min_variance']
+MAX_SOLVER_ITERATIONS = 500
+SOLVER_TOLERANCE = 1e-10
+
+
+def shrunk_covariance(returns):
+    """Ledoit-Wolf covariance of a days x symbol return panel, shrunk toward a scaled identity.
+
+    Missing days are filled with the symbol's mean return, which keeps the sample covariance
+    positive semi-definite. The shrinkage intensity is the Ledoit-Wolf (2004) estimate, computed
+    from the per-day outer products without forming them. Returns the annualized covariance and
+    the shrinkage intensity.
+    """
+    observed = ~np.isnan(returns)
+    mean = np.where(observed, returns, 0.0).sum(axis=0) / observed.sum(axis=0)
+    centered = np.where(observed, returns - mean, 0.0)
+    days, count = centered.shape
+
+    sample = centered.T @ centered / days
+    scale = np.trace(sample) / count
+    target_distance = ((sample - scale * np.eye(count)) ** 2).sum()
+    # Sum over days of ||x x' - S||^2 = sum of ||x||^4 - days * ||S||^2
+    sample_error = (((centered ** 2).sum(axis=1) ** 2).sum() - days * (sample ** 2).sum()) / days ** 2
+    shrinkage = min(sample_error, target_distance) / target_distance if target_distance > 0 else 1.0
+
+    covariance = shrinkage * scale * np.eye(count) + (1 - shrinkage) * sample
+    return covariance * TRADING_DAYS_PER_YEAR, float(shrinkage)
+
+
+def equal_weight(covariance):
+    count = len(covariance)
+    return np.full(count, 1 / count)
+
+
+def inverse_volatility(covariance):
+    """Weights proportional to 1 / volatility"""
+    inverse = 1 / np.sqrt(np.diag(covariance))
+    return inverse / inverse.sum()
+
+
+def risk_parity(covariance, budgets=None):
+    """Weights whose risk contributions w_i (Cw)_i match the budgets (equal by default).
+
+    Solved as the convex problem min 1/2 y'Cy - b'log(y) (Spinu) with damped Newton steps that
+    keep y positive; the weights are y normalized to sum to one.
+    """
+    count = len(covariance)
+    budgets = np.full(count, 1 / count) if budgets is None else np.asarray(budgets, dtype=float)
+
+    def objective(y):
+        return 0.5 * y @ covariance @ y - budgets @ np.log(y)
+
+    y = inverse_volatility(covariance)
+    for _ in range(MAX_SOLVER_ITERATIONS):
+        gradient = covariance @ y - budgets / y
+        if np.abs(gradient * y).max() < SOLVER_TOLERANCE:
+            break
+        step = -np.linalg.solve(covariance + np.diag(budgets / y ** 2), gradient)
+        shrinking = step < 0
+        size = min(1.0, 0.99 * (-y[shrinking] / step[shrinking]).min()) if shrinking.any() else 1.0
+        current = objective(y)
+        while objective(y + size * step) > current + 1e-4 * size * gradient @ step and size > 1e-12:
+            size /= 2
+        y = y + size * step
+    return y / y.sum()
+
+
+def min_variance(covariance):
+    """Long-only minimum-variance weights (min w'Cw with w >= 0 and weights summing to one).
+
+    A primal active-set method: the free names get the equality-constrained solution, a step
+    that would take a weight negative stops at the bound and fixes that name at zero, and a
+    name at zero is released when its KKT multiplier is negative. The start drops names with
+    negative unconstrained weights until none are left, which is usually close to the optimum.
+    """
+    count = len(covariance)
+    ones = np.ones(count)
+
+    def free_solution(free):
+        x = np.zeros(count)
+        x[free] = np.linalg.solve(covariance[np.ix_(free, free)], ones[free])
+        return x / x[free].sum()
+
+    free = np.ones(count, dtype=bool)
+    weights = free_solution(free)
+    while (weights < 0).any():
+        free &= weights > 0
+        weights = free_solution(free)
+
+    for _ in range(MAX_SOLVER_ITERATIONS):
+        target = free_solution(free)
+        step = target - weights
+        blocking = free & (step < 0)
+        ratios = np.full(count, np.inf)
+        ratios[blocking] = -weights[blocking] / step[blocking]
+        size = min(1.0, ratios.min())
+        weights = np.maximum(weights + size * step, 0)
+        if size < 1:
+            free[np.argmin(ratios)] = False
+            continue
+
+        marginal = covariance @ weights
+        level = marginal[free].mean()
+        multipliers = np.where(free, 0.0, marginal - level)
+        if multipliers.min() >= -SOLVER_TOLERANCE * max(abs(level), 1):
+            break
+        free[np.argmin(multipliers)] = True
+    return weights / weights.sum()
+
+
+SCHEME_FUNCTIONS = {
+    'equal_weight': equal_weight,
+    'inverse_volatility': inverse_volatility,
+    'risk_parity': risk_parity,
+    'min_variance': min_variance
+}
+
+
+def portfolio_stats(weights, covariance):
+    """Annualized volatility (percent), effective number of names and the largest risk contribution"""
+    marginal = covariance @ weights
+    variance = weights @ marginal
+    contributions = weights * marginal / variance
+    return {
+        'volatility': float(np.sqrt(variance) * 100),
+        'effective_names': float(1 / (weights ** 2).sum()),
+        'positions': int((weights > 1e-6).sum()),
+        'max_weight': float(weights.max() * 100),
+        'max_risk_contribution': float(contributions.max() * 100)
+    }
+
+
+def build_portfolios(picks, close, schemes=None, lookback=CORRELATION_LOOKBACK):
+    """Position weights of the picks under each scheme from their price histories.
+
+    picks maps symbol to its analysis (the analysis picks). Picks without MIN_OVERLAP daily
+    returns in the lookback or without any price variation are left out and listed as excluded.
+    Returns None when fewer than two picks can be sized.
+    """
+    schemes = schemes or PORTFOLIO_SCHEMES
+    symbols, returns = return_panel(close, list(picks), lookback)
+    if symbols:
+        observed = ~np.isnan(returns)
+        usable = (observed.sum(axis=0) >= MIN_OVERLAP) & (np.nanstd(np.where(observed, returns, np.nan), axis=0) > 0)
+        symbols = [symbol for symbol, keep in zip(symbols, usable) if keep]
+        returns = returns[:, usable]
+    if len(symbols) < 2:
+        return None
+
+    covariance, shrinkage = shrunk_covariance(returns)
+    portfolios = {}
+    for scheme in schemes:
+        start = time.perf_counter()
+        weights = SCHEME_FUNCTIONS[scheme](covariance)
+        elapsed = time.perf_counter() - start
+        order = np.argsort(-weights, kind='stable')
+        portfolios[scheme] = {
+            'weights': {symbols[i]: float(weights[i]) for i in order if weights[i] > 1e-6},
+            'stats': portfolio_stats(weights, covariance),
+            'solve_ms': elapsed * 1000
+        }
+
+    priced = set(symbols)
+    return {
+        'picks': len(picks),
+        'sized': len(symbols),
+        'excluded': [symbol for symbol in picks if symbol not in priced],
+        'lookback_days': int(returns.shape[0]),
+        'shrinkage': shrinkage,
+        'portfolios': portfolios
+    }
+
+
+def save_portfolios(result, path=PORTFOLIO_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+
+
+def print_portfolios(result, limit=10):
+    print(f"Sized {result['sized']} of {result['picks']} picks over {result['lookback_days']} days "
+          f"(covariance shrinkage {result['shrinkage']:.2f})")
+    for scheme, portfolio in result['portfolios'].items():
+        stats = portfolio['stats']
+        top = ', '.join(f"{symbol.replace('.NS', '')} {weight * 100:.1f}%"
+                        for symbol, weight in list(portfolio['weights'].items())[:limit])
+        print(f"{scheme:<19} vol {stats['volatility']:5.1f}%  {stats['positions']:>4} positions  "
+              f"effective {stats['effective_names']:6.1f}  max weight {stats['max_weight']:5.1f}%  "
+              f"max risk {stats['max_risk_contribution']:5.1f}%  ({portfolio['solve_ms']:.1f} ms)")
+        print(f"    {top}")
+
+
+# ----- BENCHMARK -----
+
+def run_benchmark(sizes=(50, 200, 500)):
+    """Time every scheme on synthetic returns and report how closely each meets its conditions"""
+    for count in sizes:
+        returns = synthetic_returns(CORRELATION_LOOKBACK, count)
+        start = time.perf_counter()
+        covariance, shrinkage = shrunk_covariance(returns)
+        covariance_time = time.perf_counter() - start
+        print(f"{count} names: covariance in {covariance_time * 1000:.1f} ms (shrinkage {shrinkage:.3f})")
+
+        for scheme in PORTFOLIO_SCHEMES:
+            start = time.perf_counter()
+            weights = SCHEME_FUNCTIONS[scheme](covariance)
+            elapsed = time.perf_counter() - start
+            marginal = covariance @ weights
+            check = ''
+            if scheme == 'risk_parity':
+                contributions = weights * marginal / (weights @ marginal)
+                check = f"risk contribution spread {contributions.max() - contributions.min():.1e}"
+            elif scheme == 'min_variance':
+                level = marginal[weights > 0].mean()
+                check = (f"KKT: free spread {np.ptp(marginal[weights > 0]) / level:.1e}, "
+                         f"bound slack {(marginal[weights == 0] - level).min(initial=np.inf) / level:.1e}")
+            print(f"  {scheme:<19} {elapsed * 1000:7.2f} ms  vol {np.sqrt(weights @ marginal) * 100:5.2f}%  "
+                  f"min {weights.min():.4f}  sum {weights.sum():.6f}  {check}")
+
+
+if __name__ == "__main__":
+    import argparse
+    from price_metrics import PRICE_MATRIX_PATH
+    parser = argparse.ArgumentParser(description='Position weights for the pick list')
+    parser.add_argument('--prices', type=str, default=PRICE_MATRIX_PATH, help='Close matrix saved by the collector')
+    parser.add_argument('--picks', type=str, default='data/detailed_analysis.json',
+                        help='Detailed analysis whose stocks at or above --threshold are the picks')
+    parser.add_argument('--threshold', type=float, default=PICK_THRESHOLD, help='Total score a pick needs')
+    parser.add_argument('--schemes', nargs='+', choices=PORTFOLIO_SCHEMES, default=PORTFOLIO_SCHEMES,
+                        help='Weighting schemes to compute')
+    parser.add_argument('--output', type=str, default=PORTFOLIO_PATH, help='Where the weights are written')
+    parser.add_argument('--benchmark', action='store_true', help='Time the schemes on synthetic returns')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark()
+        raise SystemExit(0)
+
+    close = load_price_matrix(args.prices)
+    if close is None:
+        print(f"No price matrix at {args.prices}; run the data collector first")
+        raise SystemExit(1)
+    with open(args.picks, 'r') as f:
+        analysis = json.load(f)
+    picks = {symbol: data for symbol, data in analysis.items() if (data.get('total_score') or 0) >= args.threshold}
+
+    result = build_portfolios(picks, close, args.schemes)
+    if result is None:
+        print("Fewer than two picks have enough price history to size")
+        raise SystemExit(1)
+    save_portfolios(result, args.output)
+    print_portfolios(result)
+    print(f"Weights written to {args.output}")
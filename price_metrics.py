@@ -0,0 +1,273 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Benchmark index used for beta calculations (NIFTY 50)
+BENCHMARK_SYMBOL = '^NSEI'
+TRADING_DAYS_PER_YEAR = 252
+ATR_PERIOD = 14
+MIN_RETURN_OBSERVATIONS = 20
+LIQUIDITY_WINDOW = 20
+
+# Return horizons in calendar days, by the snapshot field each return is stored in
+RETURN_HORIZONS = {'return_1w': 7, 'return_1m': 30, 'return_3m': 91, 'return_6m': 182, 'return_12m': 365}
+HIGH_LOW_WINDOW_DAYS = 365
+# A horizon or window starting at most this many days before a symbol's first close still uses it
+HORIZON_TOLERANCE_DAYS = 7
+
+# Close matrix of the latest collection, kept for stages that need price series (correlation)
+PRICE_MATRIX_PATH = 'data/price_matrix.npz'
+
+
+def _trading_dates(index):
+    """Convert a (possibly timezone-aware) history index to plain trading dates"""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.values.astype('datetime64[D]')
+
+
+def build_price_matrices(price_histories, fields=('Close',)):
+    """Align OHLCV fields of every symbol's history into date x symbol matrices in one pass.
+
+    Returns a dict mapping each field to a DataFrame indexed by trading date with one column per
+    symbol. Days on which a symbol did not trade are NaN, and so are non-positive prices (the
+    collector fills gaps with 0).
+    """
+    histories = {symbol: history for symbol, history in price_histories.items()
+                 if history is not None and not history.empty}
+    if not histories:
+        return {field: pd.DataFrame() for field in fields}
+
+    symbols = list(histories.keys())
+    symbol_dates = [_trading_dates(history.index) for history in histories.values()]
+    all_dates = np.unique(np.concatenate(symbol_dates))
+
+    matrices = {field: np.full((len(all_dates), len(symbols)), np.nan) for field in fields}
+    for column, (history, dates) in enumerate(zip(histories.values(), symbol_dates)):
+        rows = np.searchsorted(all_dates, dates)
+        for field in fields:
+            if field in history.columns:
+                # Later rows win when a date appears twice, matching the most recent quote
+                matrices[field][rows, column] = history[field].to_numpy(dtype=float)
+
+    frames = {}
+    for field, values in matrices.items():
+        if field != 'Volume':
+            values[values <= 0] = np.nan
+        frames[field] = pd.DataFrame(values, index=pd.DatetimeIndex(all_dates), columns=symbols)
+    return frames
+
+
+def build_price_matrix(price_histories, field='Close'):
+    """Align one OHLCV field of every symbol's history into a date x symbol matrix"""
+    return build_price_matrices(price_histories, (field,))[field]
+
+
+def save_price_matrix(close, path=PRICE_MATRIX_PATH):
+    """Write a date x symbol close matrix (see build_price_matrices) to a compressed npz, atomically"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp.npz"
+    np.savez_compressed(temp_path, dates=close.index.values.astype('datetime64[D]'),
+                        symbols=np.array(close.columns, dtype=str), close=close.to_numpy(dtype=float))
+    os.replace(temp_path, path)
+
+
+def load_price_matrix(path=PRICE_MATRIX_PATH):
+    """Load the stored close matrix as a DataFrame, or None when there is none"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as store:
+            return pd.DataFrame(store['close'], index=pd.DatetimeIndex(store['dates']), columns=store['symbols'])
+    except Exception as e:
+        print(f"Error loading price matrix: {e}")
+        return None
+
+
+def _to_json_value(value):
+    """Convert NaN/inf to None so the result can be stored in the JSON snapshot"""
+    if value is None or not np.isfinite(value):
+        return None
+    return float(value)
+
+
+def compute_return_matrix(close):
+    """Simple daily returns for a date x symbol close array, NaN where either day is missing"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return close[1:] / close[:-1] - 1
+
+
+def compute_risk_metrics(close, high, low, benchmark_close=None):
+    """Compute annualized volatility, ATR, max drawdown and beta for every symbol at once.
+
+    close, high and low are date x symbol DataFrames sharing the same index and columns (see
+    build_price_matrices). benchmark_close is an optional Series of benchmark closes. Returns a
+    dict mapping symbol to its risk metrics.
+    """
+    if close is None or close.empty:
+        return {}
+
+    symbols = list(close.columns)
+    close_values = close.to_numpy(dtype=float)
+    high_values = high.reindex(index=close.index, columns=symbols).to_numpy(dtype=float)
+    low_values = low.reindex(index=close.index, columns=symbols).to_numpy(dtype=float)
+
+    returns = compute_return_matrix(close_values)
+    valid = ~np.isnan(returns)
+    observations = valid.sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Annualized volatility (in percent) from the sample standard deviation of daily returns
+        filled = np.where(valid, returns, 0.0)
+        mean_returns = filled.sum(axis=0) / observations
+        deviations = np.where(valid, returns - mean_returns, 0.0)
+        variance = (deviations ** 2).sum(axis=0) / (observations - 1)
+        volatility = np.sqrt(variance) * np.sqrt(TRADING_DAYS_PER_YEAR) * 100
+        volatility[observations < MIN_RETURN_OBSERVATIONS] = np.nan
+
+        # Max drawdown (in percent) against the running peak; fmax skips missing days
+        running_peak = np.fmax.accumulate(close_values, axis=0)
+        drawdowns = close_values / running_peak - 1
+        all_missing = np.isnan(drawdowns).all(axis=0)
+        max_drawdown = -np.nanmin(np.where(all_missing, 0.0, drawdowns), axis=0) * 100
+        max_drawdown[all_missing] = np.nan
+
+        # Average true range over the last ATR_PERIOD sessions
+        previous_close = np.vstack([np.full((1, len(symbols)), np.nan), close_values[:-1]])
+        true_range = np.fmax(high_values - low_values,
+                             np.fmax(np.abs(high_values - previous_close), np.abs(low_values - previous_close)))
+        recent_true_range = true_range[-ATR_PERIOD:]
+        recent_valid = ~np.isnan(recent_true_range)
+        atr = np.where(recent_valid, recent_true_range, 0.0).sum(axis=0) / recent_valid.sum(axis=0)
+        last_close = pd.DataFrame(close_values).ffill().to_numpy()[-1]
+        atr_percent = atr / last_close * 100
+
+        # Beta against the benchmark using pairwise-complete observations
+        beta = np.full(len(symbols), np.nan)
+        if benchmark_close is not None and not benchmark_close.empty:
+            benchmark = pd.Series(benchmark_close.to_numpy(dtype=float),
+                                  index=pd.DatetimeIndex(_trading_dates(benchmark_close.index)))
+            benchmark = benchmark[~benchmark.index.duplicated(keep='last')]
+            benchmark = benchmark.reindex(close.index).where(lambda s: s > 0).to_numpy(dtype=float)
+            benchmark_returns = compute_return_matrix(benchmark)[:, None]
+
+            paired = valid & ~np.isnan(benchmark_returns)
+            pair_counts = paired.sum(axis=0)
+            stock_part = np.where(paired, returns, 0.0)
+            benchmark_part = np.where(paired, benchmark_returns, 0.0)
+            stock_mean = stock_part.sum(axis=0) / pair_counts
+            benchmark_mean = benchmark_part.sum(axis=0) / pair_counts
+            covariance = (stock_part * benchmark_part).sum(axis=0) / pair_counts - stock_mean * benchmark_mean
+            benchmark_variance = (benchmark_part ** 2).sum(axis=0) / pair_counts - benchmark_mean ** 2
+            beta = covariance / benchmark_variance
+            beta[pair_counts < MIN_RETURN_OBSERVATIONS] = np.nan
+
+    results = {}
+    for i, symbol in enumerate(symbols):
+        results[symbol] = {
+            'volatility': _to_json_value(volatility[i]),
+            'beta': _to_json_value(beta[i]),
+            'max_drawdown': _to_json_value(max_drawdown[i]),
+            'atr': _to_json_value(atr[i]),
+            'atr_percent': _to_json_value(atr_percent[i])
+        }
+    return results
+
+
+def compute_liquidity_metrics(close, volume, market_caps=None):
+    """Compute average daily traded value, turnover ratio and zero-volume days for every symbol at once.
+
+    close and volume are date x symbol DataFrames (see build_price_matrices). Traded value and
+    turnover use the last LIQUIDITY_WINDOW sessions; zero-volume days are counted over the whole
+    history. market_caps optionally maps symbol to market cap for the turnover ratio (percent of
+    market cap traded per day). Returns a dict mapping symbol to its liquidity metrics.
+    """
+    if close is None or close.empty:
+        return {}
+
+    symbols = list(close.columns)
+    close_values = close.to_numpy(dtype=float)
+    volume_values = volume.reindex(index=close.index, columns=symbols).to_numpy(dtype=float)
+
+    market_cap_values = np.full(len(symbols), np.nan)
+    if market_caps:
+        market_cap_values = np.array([market_caps.get(symbol) or np.nan for symbol in symbols], dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Zero-volume sessions among the days the symbol was listed
+        listed = ~np.isnan(volume_values)
+        zero_volume_days = ((volume_values == 0) & listed).sum(axis=0)
+
+        traded_value = close_values[-LIQUIDITY_WINDOW:] * volume_values[-LIQUIDITY_WINDOW:]
+        traded_valid = ~np.isnan(traded_value)
+        avg_traded_value = np.where(traded_valid, traded_value, 0.0).sum(axis=0) / traded_valid.sum(axis=0)
+
+        market_cap_values[market_cap_values <= 0] = np.nan
+        turnover_ratio = avg_traded_value / market_cap_values * 100
+
+    results = {}
+    for i, symbol in enumerate(symbols):
+        results[symbol] = {
+            'avg_daily_traded_value': _to_json_value(avg_traded_value[i]),
+            'turnover_ratio': _to_json_value(turnover_ratio[i]),
+            'zero_volume_days': int(zero_volume_days[i]) if listed[:, i].any() else None
+        }
+    return results
+
+
+def compute_return_metrics(close):
+    """Compute multi-horizon returns and 52-week high/low distance for every symbol at once.
+
+    close is a date x symbol DataFrame (see build_price_matrices). Each return (in percent) runs
+    from the last close on or before the start of its horizon to the symbol's latest close, and
+    is None when the history does not reach back that far. The 52-week high and low come from
+    the closes of the year before the latest close; their distances are the percent the latest
+    close sits from them. Returns a dict mapping symbol to its return metrics.
+    """
+    if close is None or close.empty:
+        return {}
+
+    symbols = list(close.columns)
+    columns = np.arange(len(symbols))
+    dates = close.index.values.astype('datetime64[D]')
+    close_values = close.to_numpy(dtype=float)
+    # Each row holds the last close on or before its date
+    filled = pd.DataFrame(close_values).ffill().to_numpy()
+
+    has_close = ~np.isnan(close_values)
+    listed = has_close.any(axis=0)
+    first_rows = np.argmax(has_close, axis=0)
+    last_rows = len(dates) - 1 - np.argmax(has_close[::-1], axis=0)
+    first_dates = dates[first_rows]
+    last_dates = dates[last_rows]
+    last_close = filled[last_rows, columns]
+    tolerance = np.timedelta64(HORIZON_TOLERANCE_DAYS, 'D')
+
+    metrics = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for field, days in RETURN_HORIZONS.items():
+            start_dates = last_dates - np.timedelta64(days, 'D')
+            start_rows = np.maximum(np.searchsorted(dates, start_dates, side='right') - 1, first_rows)
+            returns = (last_close / filled[start_rows, columns] - 1) * 100
+            returns[~listed | (start_dates < first_dates - tolerance)] = np.nan
+            metrics[field] = returns
+
+        window_start = last_dates - np.timedelta64(HIGH_LOW_WINDOW_DAYS, 'D')
+        in_window = (dates[:, None] > window_start) & (np.arange(len(dates))[:, None] <= last_rows)
+        window_closes = np.where(in_window & has_close, close_values, np.nan)
+        covered = listed & (window_start >= first_dates - tolerance)
+        high = np.full(len(symbols), np.nan)
+        low = np.full(len(symbols), np.nan)
+        high[covered] = np.nanmax(window_closes[:, covered], axis=0)
+        low[covered] = np.nanmin(window_closes[:, covered], axis=0)
+        metrics['high_52w'] = high
+        metrics['low_52w'] = low
+        metrics['high_52w_distance'] = (last_close / high - 1) * 100
+        metrics['low_52w_distance'] = (last_close / low - 1) * 100
+
+    results = {}
+    for i, symbol in enumerate(symbols):
+        results[symbol] = {field: _to_json_value(values[i]) for field, values in metrics.items()}
+    return results
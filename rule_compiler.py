@@ -0,0 +1,237 @@
+import hashlib
+import json
+import operator
+import os
+
+import numpy as np
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scoring_rules.json')
+
+CATEGORIES = ['buffett', 'technical', 'growth']
+
+# Total score (sum of the categories) a stock needs to become a pick, for every rule set
+PICK_THRESHOLD = 10
+
+OPERATORS = {
+    '>': np.greater,
+    '<': np.less,
+    '>=': np.greater_equal,
+    '<=': np.less_equal
+}
+
+# The same comparisons for evaluating one record at a time
+SCALAR_OPERATORS = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le
+}
+
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    """Load a rule set file and compile it"""
+    with open(path, 'r') as f:
+        rule_set = json.load(f)
+    compiled = compile_rules(rule_set)
+    compiled['path'] = path
+    return compiled
+
+
+def compile_rules(rule_set):
+    """Validate a declarative rule set and compile it into arrays for the vectorized evaluator.
+
+    Each rule scores one metric with an ordered list of bands; the first matching band wins, like
+    an if/elif chain. A band has an operator ('>', '<', '>=', '<=' or 'between'), a value (a
+    [low, high] pair for 'between'), optional 'scale' column the value is multiplied by, the
+    points it awards and either a 'reason' or a 'warning' template. Templates are formatted with
+    value and abs_value. A rule may be gated on a flag column ('requires') and may emit a warning
+    when its metric is missing. Bands and missing warnings may name a reason 'code' (by default
+    the rule id and band number); the compiled 'templates' map every code to its template.
+    Rules are grouped into sections (by default their category); all rules of a section must
+    share one category.
+    """
+    compiled_rules = []
+    seen_ids = set()
+    section_categories = {}
+    templates = {}
+
+    def add_template(code, template):
+        if templates.get(code, template) != template:
+            raise ValueError(f"Reason code {code} is used with different templates")
+        templates[code] = template
+        return code
+
+    for rule in rule_set.get('rules', []):
+        rule_id = rule['id']
+        if rule_id in seen_ids:
+            raise ValueError(f"Duplicate rule id: {rule_id}")
+        seen_ids.add(rule_id)
+
+        if rule.get('category') not in CATEGORIES:
+            raise ValueError(f"Rule {rule_id} has unknown category {rule.get('category')!r}")
+        section = rule.get('section', rule['category'])
+        if section_categories.setdefault(section, rule['category']) != rule['category']:
+            raise ValueError(f"Rule {rule_id} is in section {section!r} of category "
+                             f"{section_categories[section]!r} but has category {rule['category']!r}")
+
+        bands = rule.get('bands', [])
+        if not bands:
+            raise ValueError(f"Rule {rule_id} has no bands")
+
+        conditions = []
+        codes = [None]
+        for number, band in enumerate(bands, 1):
+            op = band['op']
+            if op == 'between':
+                low, high = band['value']
+                conditions.append(('between', float(low), float(high), band.get('scale')))
+            elif op in OPERATORS:
+                conditions.append((op, float(band['value']), None, band.get('scale')))
+            else:
+                raise ValueError(f"Rule {rule_id} uses unknown operator {op!r}")
+
+            if ('reason' in band) == ('warning' in band):
+                raise ValueError(f"Each band of rule {rule_id} needs exactly one of 'reason' or 'warning'")
+            codes.append(add_template(band.get('code', f"{rule_id}_{number}"), band.get('reason', band.get('warning'))))
+
+        missing = rule.get('missing')
+        compiled_rules.append({
+            'id': rule_id,
+            'category': rule['category'],
+            'section': section,
+            'metric': rule['metric'],
+            'requires': rule.get('requires'),
+            'conditions': conditions,
+            # Index 0 is "no band matched" so that band codes can index the arrays directly
+            'points': np.array([0.0] + [float(band['points']) for band in bands]),
+            # Points as written in the file, so that record scores keep integer points integral
+            'band_points': [0] + [band['points'] for band in bands],
+            'codes': codes,
+            'templates': [None] + [band.get('reason', band.get('warning')) for band in bands],
+            'is_warning': [False] + ['warning' in band for band in bands],
+            'missing_metric': (missing.get('metric', rule['metric']) if missing else None),
+            'missing_warning': (missing['warning'] if missing else None),
+            'missing_code': (add_template(missing.get('code', f"{rule_id}_missing"), missing['warning'])
+                             if missing else None)
+        })
+
+    return {
+        'version': str(rule_set.get('version', 'unversioned')),
+        'description': rule_set.get('description', ''),
+        # Changes with any edit of the rule set, so results scored with it can be invalidated
+        'digest': hashlib.sha1(json.dumps(rule_set, sort_keys=True).encode('utf-8')).hexdigest(),
+        'rules': compiled_rules,
+        'templates': templates
+    }
+
+
+def _band_codes(rule, columns, row_count):
+    """Index (1-based) of the first band matching each row, or 0 when none matches"""
+    values = columns[rule['metric']]
+    conditions = []
+    with np.errstate(invalid='ignore'):
+        for op, value, high, scale in rule['conditions']:
+            if op == 'between':
+                low_bound, high_bound = value, high
+                if scale:
+                    low_bound, high_bound = value * columns[scale], high * columns[scale]
+                conditions.append((values >= low_bound) & (values <= high_bound))
+            else:
+                threshold = value * columns[scale] if scale else value
+                conditions.append(OPERATORS[op](values, threshold))
+
+    codes = np.select(conditions, np.arange(1, len(conditions) + 1), default=0).astype(np.int8)
+    if rule['requires']:
+        codes = np.where(columns[rule['requires']], codes, 0).astype(np.int8)
+    return np.broadcast_to(codes, (row_count,))
+
+
+def evaluate_rules(compiled, columns, present, row_count):
+    """Evaluate a compiled rule set over whole columns.
+
+    columns maps metric names to arrays and present maps them to not-None masks. Returns a dict
+    with per-category score arrays ('scores'), the matched band code per rule ('bands') and the
+    missing-data mask per rule that has a missing warning ('missing').
+    """
+    scores = {category: np.zeros(row_count) for category in CATEGORIES}
+    bands = {}
+    missing = {}
+
+    for rule in compiled['rules']:
+        codes = _band_codes(rule, columns, row_count)
+        bands[rule['id']] = codes
+        scores[rule['category']] = scores[rule['category']] + rule['points'][codes]
+
+        if rule['missing_warning']:
+            is_missing = ~present[rule['missing_metric']]
+            if rule['requires']:
+                is_missing = is_missing & columns[rule['requires']]
+            missing[rule['id']] = is_missing
+
+    return {'scores': scores, 'bands': bands, 'missing': missing}
+
+
+def _record_band(rule, value, values):
+    """Index (1-based) of the first band one record's value matches, or 0 when none matches"""
+    for code, (op, low, high, scale) in enumerate(rule['conditions'], 1):
+        factor = values[scale] if scale else 1
+        if op == 'between':
+            if low * factor <= value <= high * factor:
+                return code
+        elif SCALAR_OPERATORS[op](value, low * factor):
+            return code
+    return 0
+
+
+def evaluate_record(compiled, values):
+    """Evaluate a compiled rule set for a single record, the scalar counterpart of evaluate_rules.
+
+    values maps metric names to numbers, None when missing (NaN counts as present and matches no
+    band, as in the vectorized evaluator). Returns a dict mapping each section, in rule file
+    order, to its category and the (score, reasons, warnings) of its rules, so callers can list
+    each section's findings where its checks belong. Reasons and warnings are (code, value)
+    tuples, or (code,) for a missing-data warning, whose text is compiled['templates'][code]
+    (see format_rule_reason).
+    """
+    sections = {}
+    for rule in compiled['rules']:
+        section = sections.setdefault(rule['section'], {'category': rule['category'], 'score': 0,
+                                                        'reasons': [], 'warnings': []})
+        if rule['requires'] and not values.get(rule['requires']):
+            continue
+        value = values.get(rule['metric'])
+        code = _record_band(rule, value, values) if value is not None else 0
+        if code:
+            section['score'] += rule['band_points'][code]
+            message = (rule['codes'][code], value)
+            (section['warnings'] if rule['is_warning'][code] else section['reasons']).append(message)
+        elif rule['missing_code'] and values.get(rule['missing_metric']) is None:
+            section['warnings'].append((rule['missing_code'],))
+
+    return sections
+
+
+def format_rule_reason(compiled, reason):
+    """Text of a (code, value) or (code,) reason recorded by evaluate_record"""
+    template = compiled['templates'][reason[0]]
+    if len(reason) < 2:
+        return template
+    return template.format(value=reason[1], abs_value=abs(reason[1]))
+
+
+def format_rule_messages(compiled, evaluation, columns, row):
+    """Format the reasons and warnings the rules produced for one row.
+
+    Returns a dict mapping each section to a (reasons, warnings) pair of lists.
+    """
+    messages = {}
+    for rule in compiled['rules']:
+        reasons, warnings = messages.setdefault(rule['section'], ([], []))
+        code = int(evaluation['bands'][rule['id']][row])
+        if code:
+            value = float(columns[rule['metric']][row])
+            text = rule['templates'][code].format(value=value, abs_value=abs(value))
+            (warnings if rule['is_warning'][code] else reasons).append(text)
+        elif rule['id'] in evaluation['missing'] and evaluation['missing'][rule['id']][row]:
+            warnings.append(rule['missing_warning'])
+    return messages
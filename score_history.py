@@ -0,0 +1,193 @@
+import os
+
+import numpy as np
+
+from rule_compiler import PICK_THRESHOLD
+
+SCORE_HISTORY_PATH = 'data/score_history.npz'
+
+# Scores kept for every analyzed symbol on every run
+SCORE_FIELDS = ['buffett_score', 'technical_score', 'growth_score', 'total_score']
+TOTAL_SCORE = SCORE_FIELDS.index('total_score')
+
+MOVERS_LIMIT = 10
+# Runs kept in the store, about a year of weekday runs; older runs are dropped when a run is added
+MAX_HISTORY_RUNS = 260
+
+
+def empty_score_history():
+    """A score history with no runs"""
+    return {
+        'runs': np.array([], dtype=str),
+        'symbols': np.array([], dtype=str),
+        'scores': np.zeros((0, 0, len(SCORE_FIELDS)), dtype=np.float32)
+    }
+
+
+def load_score_history(path=SCORE_HISTORY_PATH):
+    """Load the score history store, or an empty history when there is none.
+
+    The store holds the run labels, the sorted symbol list and a run x symbol x SCORE_FIELDS
+    float32 array of scores, NaN where a symbol was not analyzed in a run.
+    """
+    if not path or not os.path.exists(path):
+        return empty_score_history()
+    try:
+        with np.load(path, allow_pickle=False) as store:
+            return {'runs': store['runs'], 'symbols': store['symbols'], 'scores': store['scores']}
+    except Exception as e:
+        print(f"Error loading score history: {e}")
+        return empty_score_history()
+
+
+def save_score_history(history, path=SCORE_HISTORY_PATH):
+    """Write the score history store (compressed npz), replacing the previous file atomically"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp.npz"
+    np.savez_compressed(temp_path, runs=history['runs'], symbols=history['symbols'], scores=history['scores'])
+    os.replace(temp_path, path)
+
+
+def align_symbols(symbols, sorted_symbols):
+    """Position of each symbol in a sorted symbol array, or -1 when it is not there (binary search join)"""
+    symbols = np.asarray(symbols, dtype=str)
+    if len(sorted_symbols) == 0:
+        return np.full(len(symbols), -1)
+    positions = np.minimum(np.searchsorted(sorted_symbols, symbols), len(sorted_symbols) - 1)
+    return np.where(sorted_symbols[positions] == symbols, positions, -1)
+
+
+def append_score_run(history, run, symbols, scores, max_runs=MAX_HISTORY_RUNS):
+    """Add one run's scores (one row of SCORE_FIELDS per symbol) to the history.
+
+    Symbols seen for the first time extend the symbol axis. A run with the same label as the
+    latest one replaces it, so analyzing the same snapshot again does not add a run. Only the
+    latest max_runs runs are kept, and symbols scored in none of them are dropped.
+    """
+    symbols = np.asarray(symbols, dtype=str)
+    all_symbols = np.union1d(history['symbols'], symbols)
+
+    runs = history['runs']
+    stored = np.full((len(runs), len(all_symbols), len(SCORE_FIELDS)), np.nan, dtype=np.float32)
+    stored[:, align_symbols(history['symbols'], all_symbols)] = history['scores']
+    if len(runs) and runs[-1] == run:
+        runs = runs[:-1]
+        stored = stored[:-1]
+
+    new_run = np.full((1, len(all_symbols), len(SCORE_FIELDS)), np.nan, dtype=np.float32)
+    new_run[0, align_symbols(symbols, all_symbols)] = np.asarray(scores, dtype=np.float32).reshape(-1, len(SCORE_FIELDS))
+
+    runs = np.append(runs, str(run))[-max_runs:]
+    stored = np.concatenate([stored, new_run])[-max_runs:]
+    scored = ~np.isnan(stored).all(axis=(0, 2))
+    return {
+        'runs': runs,
+        'symbols': all_symbols[scored],
+        'scores': stored[:, scored]
+    }
+
+
+def score_ranks(scores):
+    """Rank of every score among the scored symbols (1 is the highest, ties share the rank), NaN if unscored"""
+    scored = ~np.isnan(scores)
+    ordered = np.sort(scores[scored])
+    ranks = np.full(len(scores), np.nan)
+    ranks[scored] = len(ordered) - np.searchsorted(ordered, scores[scored], side='right') + 1
+    return ranks
+
+
+def _mover_rows(indexes, symbols, previous, current, previous_ranks, ranks):
+    def value(array, i):
+        return None if np.isnan(array[i]) else float(array[i])
+
+    rows = []
+    for i in indexes:
+        rows.append({
+            'symbol': str(symbols[i]),
+            'previous_score': value(previous, i),
+            'score': value(current, i),
+            'delta': value(current - previous, i),
+            'previous_rank': None if np.isnan(previous_ranks[i]) else int(previous_ranks[i]),
+            'rank': None if np.isnan(ranks[i]) else int(ranks[i]),
+            'rank_change': None if np.isnan(previous_ranks[i] - ranks[i]) else int(previous_ranks[i] - ranks[i])
+        })
+    return rows
+
+
+def compute_movers(history, previous=-2, current=-1, threshold=PICK_THRESHOLD, limit=MOVERS_LIMIT):
+    """Compare the total scores of two runs of the history (by default the last two).
+
+    Returns the run labels, the stocks that entered and left the pick list (total score at or
+    above threshold), and the largest score rises and falls among stocks scored in both runs,
+    each with scores, ranks and rank change. Returns None with fewer than two runs.
+    """
+    if len(history['runs']) < 2:
+        return None
+
+    symbols = history['symbols']
+    previous_scores = history['scores'][previous, :, TOTAL_SCORE].astype(float)
+    current_scores = history['scores'][current, :, TOTAL_SCORE].astype(float)
+    previous_ranks = score_ranks(previous_scores)
+    ranks = score_ranks(current_scores)
+
+    with np.errstate(invalid='ignore'):
+        was_pick = previous_scores >= threshold
+        is_pick = current_scores >= threshold
+        delta = current_scores - previous_scores
+    in_both = ~np.isnan(delta)
+
+    entries = np.flatnonzero(is_pick & ~was_pick)
+    entries = entries[np.argsort(-current_scores[entries], kind='stable')]
+    exits = np.flatnonzero(was_pick & ~is_pick)
+    exits = exits[np.argsort(-previous_scores[exits], kind='stable')]
+
+    changed = np.flatnonzero(in_both & (delta != 0))
+    by_delta = changed[np.argsort(-delta[changed], kind='stable')]
+    risers = by_delta[delta[by_delta] > 0][:limit]
+    fallers = by_delta[::-1][delta[by_delta[::-1]] < 0][:limit]
+
+    rows = (symbols, previous_scores, current_scores, previous_ranks, ranks)
+    return {
+        'previous_run': str(history['runs'][previous]),
+        'current_run': str(history['runs'][current]),
+        'threshold': threshold,
+        'entries': _mover_rows(entries, *rows),
+        'exits': _mover_rows(exits, *rows),
+        'risers': _mover_rows(risers, *rows),
+        'fallers': _mover_rows(fallers, *rows),
+        'changed': int(len(changed))
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Score history and movers between analysis runs')
+    parser.add_argument('--history', type=str, default=SCORE_HISTORY_PATH, help='Score history store')
+    parser.add_argument('--previous', type=int, default=-2, help='Index of the earlier run (default: second to last)')
+    parser.add_argument('--current', type=int, default=-1, help='Index of the later run (default: last)')
+    parser.add_argument('--limit', type=int, default=MOVERS_LIMIT, help='Risers and fallers to show')
+    parser.add_argument('--list', action='store_true', help='List the stored runs')
+    args = parser.parse_args()
+
+    history = load_score_history(args.history)
+    print(f"{len(history['runs'])} runs of {len(history['symbols'])} symbols in {args.history}")
+    if args.list:
+        for index, run in enumerate(history['runs']):
+            analyzed = int((~np.isnan(history['scores'][index, :, TOTAL_SCORE])).sum())
+            print(f"  [{index}] {run}: {analyzed} stocks")
+
+    movers = compute_movers(history, args.previous, args.current, limit=args.limit)
+    if movers is None:
+        print("Need at least two runs to compute movers")
+        raise SystemExit(0)
+
+    print(f"Movers from {movers['previous_run']} to {movers['current_run']} "
+          f"({movers['changed']} stocks changed score)")
+    for title, key in [('New picks', 'entries'), ('Dropped picks', 'exits'),
+                       ('Largest rises', 'risers'), ('Largest falls', 'fallers')]:
+        print(f"{title} ({len(movers[key])}):")
+        for row in movers[key][:args.limit]:
+            previous_score = '-' if row['previous_score'] is None else f"{row['previous_score']:g}"
+            score = '-' if row['score'] is None else f"{row['score']:g}"
+            rank_change = '' if row['rank_change'] is None else f"  rank {row['rank']} ({row['rank_change']:+d})"
+            print(f"  {row['symbol']:<16} {previous_score:>6} -> {score:>6}{rank_change}")
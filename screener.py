@@ -0,0 +1,253 @@
+import json
+import re
+import shlex
+import sys
+import time
+
+import numpy as np
+
+from buffet_analyzer import load_latest_data, normalize_stock_data
+
+# String fields that can be screened with = and !=; booleans are always categorical
+CATEGORICAL_FIELDS = ['sector', 'industry']
+
+OPERATORS = ['>=', '<=', '!=', '==', '=', '>', '<']
+OPERATOR_PATTERN = '|'.join(re.escape(op) for op in OPERATORS)
+FILTER_PATTERN = re.compile(r'^\s*([A-Za-z_]\w*)\s*(' + OPERATOR_PATTERN + r')\s*(.+?)\s*$')
+# A filter on a line runs until the next 'field op' starts, so values may contain spaces
+LINE_FILTER_PATTERN = re.compile(r'([A-Za-z_]\w*\s*(?:' + OPERATOR_PATTERN + r')\s*.+?)(?=\s+[A-Za-z_]\w*\s*(?:'
+                                 + OPERATOR_PATTERN + r')|\s*$)')
+
+DISPLAY_LIMIT = 50
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+
+def build_screen_index(stock_data):
+    """Build per-field indexes over every non-error stock of a snapshot.
+
+    Numeric fields get their values sorted once together with the row of each value, so a range
+    condition is two binary searches. Categorical fields (CATEGORICAL_FIELDS and booleans) map
+    each value to the sorted rows holding it. Records are read from the normalized view, so
+    debt-to-equity matches the analysis.
+    """
+    normalized_data = normalize_stock_data(stock_data)
+    symbols = [symbol for symbol, data in normalized_data.items() if 'error' not in data]
+    records = [normalized_data[symbol] for symbol in symbols]
+
+    numeric_values = {}
+    categorical_rows = {}
+    for row, data in enumerate(records):
+        for field, value in data.items():
+            if isinstance(value, bool) or (field in CATEGORICAL_FIELDS and isinstance(value, str)):
+                categorical_rows.setdefault(field, {}).setdefault(value, []).append(row)
+            elif _is_number(value):
+                rows, values = numeric_values.setdefault(field, ([], []))
+                rows.append(row)
+                values.append(value)
+
+    numeric = {}
+    for field, (rows, values) in numeric_values.items():
+        values = np.asarray(values, dtype=float)
+        order = np.argsort(values, kind='stable')
+        numeric[field] = {'values': values[order], 'rows': np.asarray(rows, dtype=np.int64)[order]}
+
+    categorical = {field: {value: np.asarray(rows, dtype=np.int64) for value, rows in by_value.items()}
+                   for field, by_value in categorical_rows.items()}
+
+    return {'symbols': symbols, 'records': records, 'numeric': numeric, 'categorical': categorical}
+
+
+def parse_filter(expression):
+    """Parse 'field op value' (op one of >, >=, <, <=, =, ==, !=) into a (field, op, value) tuple"""
+    match = FILTER_PATTERN.match(expression)
+    if not match:
+        raise ValueError(f"Cannot parse filter {expression!r}; expected e.g. 'roe>20' or 'sector=Technology'")
+    field, op, value = match.groups()
+    if op == '==':
+        op = '='
+    return field, op, value.strip('\'"')
+
+
+def split_filter_line(line):
+    """Split one line of filters such as 'sector=Consumer Defensive roe > 25' into filter expressions.
+
+    Quotes are honoured like a shell would, and spaces are allowed around operators and inside values.
+    """
+    text = ' '.join(shlex.split(line))
+    expressions = LINE_FILTER_PATTERN.findall(text)
+    if not expressions or LINE_FILTER_PATTERN.sub('', text).strip():
+        raise ValueError(f"Cannot parse filters {line.strip()!r}; expected e.g. 'roe > 20 sector=Technology'")
+    return expressions
+
+
+def _numeric_rows(field_index, op, value):
+    """Rows matching a numeric condition, from binary searches on the sorted values"""
+    values = field_index['values']
+    rows = field_index['rows']
+    if op == '>':
+        return rows[np.searchsorted(values, value, side='right'):]
+    if op == '>=':
+        return rows[np.searchsorted(values, value, side='left'):]
+    if op == '<':
+        return rows[:np.searchsorted(values, value, side='left')]
+    if op == '<=':
+        return rows[:np.searchsorted(values, value, side='right')]
+
+    low = np.searchsorted(values, value, side='left')
+    high = np.searchsorted(values, value, side='right')
+    if op == '=':
+        return rows[low:high]
+    return np.concatenate([rows[:low], rows[high:]])
+
+
+def _categorical_rows(field_index, op, value, row_count):
+    """Rows matching = or != on a categorical field"""
+    if op not in ('=', '!='):
+        raise ValueError(f"Only = and != can be used on categorical fields, not {op!r}")
+
+    if value.lower() in ('true', 'false') and any(isinstance(key, bool) for key in field_index):
+        matches = field_index.get(value.lower() == 'true', np.empty(0, dtype=np.int64))
+    else:
+        matches = field_index.get(value, np.empty(0, dtype=np.int64))
+
+    if op == '=':
+        return matches
+    return np.setdiff1d(np.arange(row_count), matches, assume_unique=True)
+
+
+def filter_rows(screen_index, filters):
+    """Rows of the stocks matching every filter, by intersecting the per-condition row sets.
+
+    filters are (field, op, value) tuples (see parse_filter). Conditions are intersected from
+    the most selective one up, so later intersections work on small sets.
+    """
+    row_count = len(screen_index['symbols'])
+    matches = []
+    for field, op, value in filters:
+        if field in screen_index['numeric']:
+            try:
+                number = float(value)
+            except ValueError:
+                raise ValueError(f"{field} is numeric, cannot compare it with {value!r}")
+            rows = _numeric_rows(screen_index['numeric'][field], op, number)
+        elif field in screen_index['categorical']:
+            rows = _categorical_rows(screen_index['categorical'][field], op, value, row_count)
+        else:
+            raise ValueError(f"Unknown or non-indexed field {field!r}")
+        matches.append(np.sort(rows))
+
+    if not matches:
+        return np.arange(row_count)
+
+    matches.sort(key=len)
+    result = matches[0]
+    for rows in matches[1:]:
+        if len(result) == 0:
+            break
+        result = np.intersect1d(result, rows, assume_unique=True)
+    return result
+
+
+def screen(screen_index, expressions, sort_by=None, descending=False, limit=None):
+    """Run a screen given as filter expressions and return the matching symbols.
+
+    With sort_by, the order comes from that field's sorted index (stocks without the field
+    last); otherwise symbols keep snapshot order.
+    """
+    rows = filter_rows(screen_index, [parse_filter(expression) for expression in expressions])
+
+    if sort_by:
+        if sort_by not in screen_index['numeric']:
+            raise ValueError(f"Cannot sort by {sort_by!r}; it is not a numeric field")
+        sorted_rows = screen_index['numeric'][sort_by]['rows']
+        if descending:
+            sorted_rows = sorted_rows[::-1]
+        ordered = sorted_rows[np.isin(sorted_rows, rows, assume_unique=True)]
+        rows = np.concatenate([ordered, np.setdiff1d(rows, ordered, assume_unique=True)])
+
+    if limit is not None:
+        rows = rows[:limit]
+    return [screen_index['symbols'][row] for row in rows]
+
+
+def print_results(screen_index, symbols, fields, total):
+    """Print matching stocks with the screened fields"""
+    records = dict(zip(screen_index['symbols'], screen_index['records']))
+    header = f"{'Symbol':<16} {'Name':<30} {'Sector':<24}" + ''.join(f" {field:>14}" for field in fields)
+    print(header)
+    print('-' * len(header))
+    for symbol in symbols:
+        data = records[symbol]
+        line = f"{symbol:<16} {str(data.get('name', ''))[:30]:<30} {str(data.get('sector', ''))[:24]:<24}"
+        for field in fields:
+            value = data.get(field)
+            line += f" {value:>14,.2f}" if _is_number(value) else f" {str(value):>14}"
+        print(line)
+    print(f"{total} stocks matched" + (f", showing {len(symbols)}" if len(symbols) < total else ''))
+
+
+def run_screen(screen_index, expressions, args):
+    """Run and print one screen"""
+    start = time.perf_counter()
+    matched = screen(screen_index, expressions, sort_by=args.sort, descending=args.desc)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(matched[:args.limit]))
+        return
+
+    fields = []
+    for expression in expressions:
+        field = parse_filter(expression)[0]
+        if field not in fields and field not in ('sector',):
+            fields.append(field)
+    if args.sort and args.sort not in fields:
+        fields.append(args.sort)
+
+    print_results(screen_index, matched[:args.limit], fields, len(matched))
+    print(f"Screen ran in {elapsed * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Screen the stock snapshot with filter expressions',
+                                     epilog='Example: python screener.py "roe>20" "debt_to_equity<0.5" '
+                                            '"sector=Technology" --sort roe --desc')
+    parser.add_argument('filters', nargs='*', help="Filter expressions such as roe>20 or sector=Technology")
+    parser.add_argument('--data', type=str, default=None, help='Snapshot to screen (defaults to data/latest.json)')
+    parser.add_argument('--sort', type=str, default=None, help='Numeric field to sort the results by')
+    parser.add_argument('--desc', action='store_true', help='Sort in descending order')
+    parser.add_argument('--limit', type=int, default=DISPLAY_LIMIT, help='Maximum number of stocks to show')
+    parser.add_argument('--json', action='store_true', help='Print matching symbols as JSON')
+    parser.add_argument('--interactive', action='store_true',
+                        help='Read one screen per line from stdin, reusing the index')
+    args = parser.parse_args()
+
+    if args.data:
+        with open(args.data, 'r') as f:
+            stock_data = json.load(f)
+    else:
+        stock_data = load_latest_data()
+
+    start = time.perf_counter()
+    screen_index = build_screen_index(stock_data)
+    if not args.json:
+        print(f"Indexed {len(screen_index['symbols'])} stocks and {len(screen_index['numeric'])} numeric fields "
+              f"in {time.perf_counter() - start:.3f}s")
+
+    try:
+        if args.interactive:
+            for line in sys.stdin:
+                if line.strip():
+                    try:
+                        run_screen(screen_index, split_filter_line(line), args)
+                    except ValueError as e:
+                        print(f"Error: {e}")
+        else:
+            run_screen(screen_index, args.filters, args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
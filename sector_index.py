@@ -0,0 +1,198 @@
+import math
+import time
+import random
+
+import numpy as np
+
+# Metrics compared against sector peers
+SECTOR_METRICS = ['roe', 'debt_to_equity', 'pe_ratio', 'revenue_yoy']
+SECTOR_QUANTILES = {'p25': 0.25, 'median': 0.5, 'p75': 0.75}
+
+
+def build_sector_index(stock_data, metrics=SECTOR_METRICS, normalizers=None):
+    """Build per-sector aggregates for the peer comparison metrics in a single pass.
+
+    For every sector the index keeps the member count, and for every (sector, metric) the sum,
+    count and sorted values of the metric. Each symbol's position in the sorted values is recorded
+    so that lookups can exclude the stock itself (leave-one-out) in O(1).
+
+    normalizers optionally maps a metric to a function applied to each raw value before indexing,
+    so that the index sees the same normalized values as the analyzer.
+    """
+    normalizers = normalizers or {}
+    members = {}
+    member_symbols = {}
+    values = {}
+
+    for symbol, data in stock_data.items():
+        if 'error' in data:
+            continue
+
+        sector = data.get('sector')
+        members[sector] = members.get(sector, 0) + 1
+        member_symbols[symbol] = sector
+
+        for metric in metrics:
+            value = data.get(metric)
+            if value is None:
+                continue
+            if metric in normalizers:
+                value = normalizers[metric](value)
+            values.setdefault((sector, metric), ([], []))
+            values[(sector, metric)][0].append(value)
+            values[(sector, metric)][1].append(symbol)
+
+    aggregates = {}
+    positions = {}
+    for key, (metric_values, symbols) in values.items():
+        metric_values = np.asarray(metric_values, dtype=float)
+        order = np.argsort(metric_values, kind='stable')
+        aggregates[key] = {
+            'sum': math.fsum(metric_values),
+            'count': len(metric_values),
+            'sorted': metric_values[order]
+        }
+        metric = key[1]
+        for position, symbol_idx in enumerate(order.tolist()):
+            positions[(symbols[symbol_idx], metric)] = position
+
+    return {
+        'metrics': list(metrics),
+        'members': members,
+        'member_symbols': member_symbols,
+        'aggregates': aggregates,
+        'positions': positions
+    }
+
+
+def count_sector_peers(sector_index, symbol, sector):
+    """Number of other (non-error) stocks in the sector"""
+    count = sector_index['members'].get(sector, 0)
+    if sector_index['member_symbols'].get(symbol, object()) == sector:
+        count -= 1
+    return count
+
+
+def _leave_one_out_quantile(sorted_values, excluded_position, quantile):
+    """Linear-interpolated quantile of sorted_values with one position removed"""
+    remaining = len(sorted_values) - (0 if excluded_position is None else 1)
+    if remaining <= 0:
+        return None
+
+    h = quantile * (remaining - 1)
+    lower = int(math.floor(h))
+    upper = min(lower + 1, remaining - 1)
+    fraction = h - lower
+
+    def value_at(j):
+        if excluded_position is not None and j >= excluded_position:
+            j += 1
+        return float(sorted_values[j])
+
+    lower_value = value_at(lower)
+    return lower_value + fraction * (value_at(upper) - lower_value)
+
+
+def sector_peer_stats(sector_index, symbol, sector, metric):
+    """Sector aggregates for a metric excluding the stock itself.
+
+    Returns a dict with the peer count, mean, median and quartiles, or None when no peer has
+    a value for the metric.
+    """
+    aggregate = sector_index['aggregates'].get((sector, metric))
+    if aggregate is None:
+        return None
+
+    position = sector_index['positions'].get((symbol, metric))
+    if sector_index['member_symbols'].get(symbol, object()) != sector:
+        position = None
+
+    total = aggregate['sum']
+    count = aggregate['count']
+    if position is not None:
+        total -= aggregate['sorted'][position]
+        count -= 1
+
+    if count <= 0:
+        return None
+
+    stats = {'count': count, 'mean': total / count}
+    for name, quantile in SECTOR_QUANTILES.items():
+        stats[name] = _leave_one_out_quantile(aggregate['sorted'], position, quantile)
+    return stats
+
+
+# ----- BENCHMARK -----
+
+def generate_synthetic_universe(size, seed=42):
+    """Generate a synthetic stock universe with realistic sector sizes for benchmarking"""
+    rng = random.Random(seed)
+    sectors = ['Industrials', 'Consumer Cyclical', 'Basic Materials', 'Financial Services', 'Technology',
+               'Healthcare', 'Consumer Defensive', 'Real Estate', 'Communication Services', 'Utilities',
+               'Energy', 'Unknown']
+    weights = [327, 313, 255, 157, 123, 113, 111, 50, 49, 33, 25, 22]
+
+    universe = {}
+    for i in range(size):
+        universe[f"SYN{i}.NS"] = {
+            'sector': rng.choices(sectors, weights)[0],
+            'roe': rng.gauss(12, 10) if rng.random() > 0.05 else None,
+            'debt_to_equity': abs(rng.gauss(0.6, 0.5)) if rng.random() > 0.05 else None,
+            'pe_ratio': abs(rng.gauss(30, 20)) if rng.random() > 0.1 else None,
+            'revenue_yoy': rng.gauss(10, 15) if rng.random() > 0.5 else None
+        }
+    return universe
+
+
+def naive_sector_means(symbol, data, stock_data, metrics=SECTOR_METRICS):
+    """Peer scan over the whole universe, as the analyzer did before the sector index"""
+    sector = data.get('sector')
+    peers = [d for s, d in stock_data.items() if 'error' not in d and d.get('sector') == sector and s != symbol]
+    means = {}
+    for metric in metrics:
+        peer_values = [p[metric] for p in peers if p.get(metric) is not None]
+        if peer_values:
+            means[metric] = sum(peer_values) / len(peer_values)
+    return means
+
+
+def run_benchmark(sizes=(2_000, 20_000, 100_000), naive_limit=2_000):
+    """Time index construction and full-universe lookups against the naive peer scan"""
+    for size in sizes:
+        universe = generate_synthetic_universe(size)
+
+        start = time.perf_counter()
+        sector_index = build_sector_index(universe)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for symbol, data in universe.items():
+            for metric in SECTOR_METRICS:
+                sector_peer_stats(sector_index, symbol, data['sector'], metric)
+        lookup_time = time.perf_counter() - start
+
+        line = f"{size:>7,} symbols: build {build_time:.3f}s, lookups {lookup_time:.3f}s"
+
+        if size <= naive_limit:
+            start = time.perf_counter()
+            for symbol, data in universe.items():
+                naive_sector_means(symbol, data, universe)
+            line += f", naive peer scan {time.perf_counter() - start:.3f}s"
+        else:
+            line += ", naive peer scan skipped (quadratic)"
+
+        print(line)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Sector aggregate index utilities')
+    parser.add_argument('--benchmark', action='store_true', help='Benchmark the index on synthetic universes')
+    parser.add_argument('--sizes', type=str, default='2000,20000,100000',
+                        help='Comma separated universe sizes for the benchmark')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(tuple(int(size) for size in args.sizes.split(',')))
+    else:
+        parser.print_help()
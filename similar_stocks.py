@@ -0,0 +1,212 @@
+import time
+import warnings
+
+import numpy as np
+
+# Fundamentals compared between companies; market cap is compared on a log scale
+SIMILARITY_FEATURES = [
+    'roe', 'debt_to_equity', 'pe_ratio', 'pb_ratio', 'profit_margin', 'revenue_yoy', 'net_profit_yoy', 'market_cap'
+]
+LOG_FEATURES = {'market_cap'}
+NEIGHBOR_COUNT = 5
+# Two companies are only compared when both report at least this many of the features
+MIN_SHARED_FEATURES = 4
+# Standardized values are clipped so one extreme ratio does not dominate the distance
+Z_SCORE_CLIP = 3.0
+QUERY_BLOCK_SIZE = 256
+
+
+def _to_float(value):
+    if value is None or isinstance(value, (bool, str, list, dict)):
+        return np.nan
+    return float(value)
+
+
+def standardize_features(values):
+    """Robust z-scores of a stock x feature array: (value - median) / (IQR / 1.349), clipped.
+
+    Features without spread get zeros. Missing values stay NaN, as do features no stock reports.
+    """
+    with warnings.catch_warnings(), np.errstate(invalid='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(values, axis=0)
+        q25, q75 = np.nanpercentile(values, [25, 75], axis=0)
+        scale = (q75 - q25) / 1.349
+        scale = np.where(scale > 0, scale, np.nanstd(values, axis=0))
+        scores = (values - median) / np.where(scale > 0, scale, np.inf)
+    return np.clip(scores, -Z_SCORE_CLIP, Z_SCORE_CLIP)
+
+
+def build_similarity_index(records, symbols, features=SIMILARITY_FEATURES):
+    """Standardized feature vectors of every stock, built once per snapshot.
+
+    records are the normalized stock dicts aligned with symbols. Returns the symbols, the
+    zero-filled standardized values, the mask of reported features and the squared values,
+    which is all a batch query needs.
+    """
+    columns = []
+    for feature in features:
+        column = np.array([_to_float(data.get(feature)) for data in records], dtype=float)
+        if feature in LOG_FEATURES:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                column = np.where(column > 0, np.log(column), np.nan)
+        columns.append(column)
+    scores = standardize_features(np.column_stack(columns) if columns else np.zeros((len(records), 0)))
+
+    reported = ~np.isnan(scores)
+    values = np.where(reported, scores, 0.0)
+    return {
+        'symbols': list(symbols),
+        'features': list(features),
+        'values': values,
+        'mask': reported.astype(float),
+        'squares': values ** 2
+    }
+
+
+def query_neighbors(index, rows, count=NEIGHBOR_COUNT, block_size=QUERY_BLOCK_SIZE):
+    """Nearest neighbors of the given index rows in one batch, by blocked brute-force distance.
+
+    The distance between two stocks is the root mean squared difference over the features both
+    report, so missing fundamentals neither count as matches nor as differences. For a block of
+    queries all the sums over shared features come from three matrix products against the
+    whole index. Returns (neighbor rows, distances), each len(rows) x count, closest first and
+    padded with -1 and NaN when fewer than count stocks share enough features.
+    """
+    rows = np.asarray(rows, dtype=int)
+    values, mask, squares = index['values'], index['mask'], index['squares']
+    neighbors = np.full((len(rows), count), -1)
+    distances = np.full((len(rows), count), np.nan)
+    if len(values) == 0:
+        return neighbors, distances
+    take = min(count, len(values))
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        shared = mask[block] @ mask.T
+        # sum over shared features of (q - x)^2 = q^2 . m_x - 2 q . x + m_q . x^2
+        squared = squares[block] @ mask.T - 2 * values[block] @ values.T + mask[block] @ squares.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            block_distances = np.sqrt(np.maximum(squared, 0) / shared)
+        block_distances[shared < MIN_SHARED_FEATURES] = np.inf
+        block_distances[np.arange(len(block)), block] = np.inf
+
+        nearest = np.argpartition(block_distances, take - 1, axis=1)[:, :take]
+        nearest_distances = np.take_along_axis(block_distances, nearest, axis=1)
+        order = np.lexsort((nearest, nearest_distances), axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+
+        found = np.isfinite(nearest_distances)
+        neighbors[start:start + len(block), :take] = np.where(found, nearest, -1)
+        distances[start:start + len(block), :take] = np.where(found, nearest_distances, np.nan)
+    return neighbors, distances
+
+
+def similar_stocks_at(index, neighbors, distances, row, names=None):
+    """Neighbors of one queried stock as [{'symbol', 'name', 'distance'}], skipping padding"""
+    similar = []
+    for neighbor, distance in zip(neighbors[row], distances[row]):
+        if neighbor < 0:
+            continue
+        symbol = index['symbols'][neighbor]
+        similar.append({
+            'symbol': symbol,
+            'name': names[neighbor] if names is not None else symbol,
+            'distance': round(float(distance), 4)
+        })
+    return similar
+
+
+# ----- BENCHMARK -----
+
+def naive_neighbors(index, rows, count=NEIGHBOR_COUNT):
+    """Peer scan per query over every other stock, for benchmarking against the batch query"""
+    values, mask = index['values'], index['mask']
+    neighbors = np.full((len(rows), count), -1)
+    distances = np.full((len(rows), count), np.nan)
+    for i, row in enumerate(rows):
+        candidates = []
+        for other in range(len(values)):
+            both = (mask[row] > 0) & (mask[other] > 0)
+            if other == row or both.sum() < MIN_SHARED_FEATURES:
+                continue
+            candidates.append((np.sqrt(((values[row] - values[other])[both] ** 2).mean()), other))
+        for k, (distance, other) in enumerate(sorted(candidates)[:count]):
+            neighbors[i, k] = other
+            distances[i, k] = distance
+    return neighbors, distances
+
+
+def synthetic_records(size, seed=42):
+    """Stock dicts with heavy-tailed fundamentals and some missing values"""
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(size):
+        data = {
+            'roe': rng.normal(14, 10), 'debt_to_equity': abs(rng.normal(0.8, 0.8)), 'pe_ratio': rng.lognormal(3, 0.6),
+            'pb_ratio': rng.lognormal(1, 0.7), 'profit_margin': rng.normal(10, 8), 'revenue_yoy': rng.normal(12, 20),
+            'net_profit_yoy': rng.normal(10, 40), 'market_cap': rng.lognormal(24, 1.5)
+        }
+        records.append({key: (None if rng.random() < 0.1 else value) for key, value in data.items()})
+    return records
+
+
+def run_benchmark(sizes=(2_000, 20_000), queries=500, naive_limit=2_000):
+    """Time index build and batch query, and check the neighbors against a peer scan"""
+    for size in sizes:
+        records = synthetic_records(size)
+        symbols = [f"S{i:06d}" for i in range(size)]
+        rows = np.arange(0, size, max(size // queries, 1))[:queries]
+
+        start = time.perf_counter()
+        index = build_similarity_index(records, symbols)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        neighbors, distances = query_neighbors(index, rows)
+        query_time = time.perf_counter() - start
+
+        line = (f"{size:>7,} stocks, {len(rows)} queries: index {build_time * 1000:.1f} ms, "
+                f"batch query {query_time * 1000:.1f} ms")
+        if size <= naive_limit:
+            start = time.perf_counter()
+            expected_neighbors, expected_distances = naive_neighbors(index, rows)
+            line += f", peer scan {time.perf_counter() - start:.2f}s"
+            same = np.allclose(distances, expected_distances, equal_nan=True)
+            line += ", identical" if same else ", MISMATCH"
+        print(line)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from buffet_analyzer import load_latest_data, normalize_stock_data
+    parser = argparse.ArgumentParser(description='Companies with the most similar fundamentals')
+    parser.add_argument('symbols', nargs='*', help='Symbols to look up (e.g. TCS.NS)')
+    parser.add_argument('--count', type=int, default=NEIGHBOR_COUNT, help='Neighbors per symbol')
+    parser.add_argument('--json', action='store_true', help='Print the neighbors as JSON')
+    parser.add_argument('--benchmark', action='store_true', help='Time the batch query against a peer scan')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark()
+        raise SystemExit(0)
+
+    normalized_data = normalize_stock_data(load_latest_data())
+    symbols = [symbol for symbol, data in normalized_data.items() if 'error' not in data and '.BO' not in symbol]
+    records = [normalized_data[symbol] for symbol in symbols]
+    index = build_similarity_index(records, symbols)
+
+    positions = {symbol: row for row, symbol in enumerate(symbols)}
+    wanted = [symbol for symbol in args.symbols if symbol in positions]
+    for symbol in set(args.symbols) - set(wanted):
+        print(f"{symbol} is not in the analyzed universe")
+    neighbors, distances = query_neighbors(index, [positions[symbol] for symbol in wanted], args.count)
+
+    names = [data.get('name', symbol) for symbol, data in zip(symbols, records)]
+    results = {symbol: similar_stocks_at(index, neighbors, distances, i, names) for i, symbol in enumerate(wanted)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for symbol, similar in results.items():
+            print(f"{symbol}: " + ', '.join(f"{s['symbol']} ({s['distance']:.2f})" for s in similar))
@@ -0,0 +1,53 @@
+import glob
+import gzip
+import json
+import os
+import re
+
+import numpy as np
+
+SNAPSHOT_DIR = 'data/snapshots'
+# Gzipped daily snapshots, plus plain JSON ones written before the store was compressed
+SNAPSHOT_PATTERN = f"{SNAPSHOT_DIR}/stock_data_*.json*"
+SNAPSHOT_DATE_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2})')
+
+# Snapshots kept in the store, about a year of weekday runs; older ones are deleted when one is saved
+MAX_SNAPSHOTS = 260
+
+
+def find_snapshots(pattern=SNAPSHOT_PATTERN, start=None, end=None):
+    """Daily snapshot files as a date-sorted list of (date, path), optionally limited to [start, end]"""
+    snapshots = []
+    for path in glob.glob(pattern):
+        match = SNAPSHOT_DATE_PATTERN.search(os.path.basename(path))
+        if not match:
+            continue
+        date = np.datetime64(match.group(1), 'D')
+        if (start is None or date >= np.datetime64(start, 'D')) and (end is None or date <= np.datetime64(end, 'D')):
+            snapshots.append((date, path))
+    return sorted(snapshots)
+
+
+def load_snapshot(path):
+    """Load a snapshot file, gzipped or plain JSON"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        return json.load(f)
+
+
+def save_snapshot(stock_data, date, directory=SNAPSHOT_DIR, max_snapshots=MAX_SNAPSHOTS):
+    """Write one day's snapshot to the store, gzipped and atomically, and return its path.
+
+    A snapshot of the same date replaces the earlier one. Only the latest max_snapshots
+    snapshots are kept.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"stock_data_{date}.json.gz")
+    temp_path = f"{path}.tmp"
+    with gzip.open(temp_path, 'wt') as f:
+        json.dump(stock_data, f)
+    os.replace(temp_path, path)
+
+    for _, old_path in find_snapshots(os.path.join(directory, 'stock_data_*.json*'))[:-max_snapshots]:
+        os.remove(old_path)
+    return path
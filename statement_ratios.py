@@ -0,0 +1,300 @@
+import time
+
+import numpy as np
+
+from statements_panel import line_item_values
+
+# Line items the ratios are derived from, as (statement, yfinance labels tried in order)
+LINE_ITEMS = {
+    'total_revenue': ('income_stmt', ['Total Revenue', 'Operating Revenue']),
+    'net_income': ('income_stmt', ['Net Income', 'Net Income From Continuing Operation Net Minority Interest',
+                                   'Net Income Common Stockholders']),
+    'ebit': ('income_stmt', ['EBIT', 'Operating Income']),
+    'interest_expense': ('income_stmt', ['Interest Expense', 'Interest Expense Non Operating']),
+    'total_assets': ('balance_sheet', ['Total Assets']),
+    'total_equity': ('balance_sheet', ['Stockholders Equity', 'Total Equity Gross Minority Interest',
+                                       'Common Stock Equity']),
+    'total_debt': ('balance_sheet', ['Total Debt']),
+    'long_term_debt': ('balance_sheet', ['Long Term Debt']),
+    'current_debt': ('balance_sheet', ['Current Debt']),
+    'current_assets': ('balance_sheet', ['Current Assets']),
+    'current_liabilities': ('balance_sheet', ['Current Liabilities']),
+    'operating_cash_flow': ('cashflow', ['Operating Cash Flow', 'CashFlowFromOperations', 'CashFromOperations']),
+    'capital_expenditure': ('cashflow', ['Capital Expenditure', 'CapitalExpenditures', 'Capex'])
+}
+
+# Compound growth horizons in years, by the snapshot field suffix
+CAGR_YEARS = {'3y': 3, '5y': 5}
+# A period counts as N years back when its end date is within this many years of it
+PERIOD_MATCH_TOLERANCE_YEARS = 0.25
+# Growth stability is fitted over this many periods and needs at least MIN_STABILITY_PERIODS of them
+STABILITY_PERIODS = 5
+MIN_STABILITY_PERIODS = 3
+GROWTH_SERIES = {'revenue': 'total_revenue', 'net_income': 'net_income'}
+
+# Snapshot fields the analyzer reads that the collector has no other source for
+RATIO_FIELDS = ['profit_margin', 'returnOnAssets', 'interestCoverageRatio', 'currentRatio']
+# Snapshot fields the collector sets per stock first (Yahoo's info, FCF from the latest cashflow column);
+# the statement values fill them when missing
+FALLBACK_FIELDS = ['roe', 'debt_to_equity', 'fcf']
+GROWTH_FIELDS = ([f"{name}_cagr_{suffix}" for name in GROWTH_SERIES for suffix in CAGR_YEARS] +
+                 [f"{name}_growth_stability" for name in GROWTH_SERIES])
+
+
+def panel_line_items(panel):
+    """Symbol x period arrays of every line item in LINE_ITEMS, trying each item's labels in order"""
+    return {name: line_item_values(panel, statement, labels) for name, (statement, labels) in LINE_ITEMS.items()}
+
+
+def _years_between(period_ends):
+    """Symbol x period x period array of years from the later period end back to the earlier one"""
+    gaps = period_ends[:, :, None] - period_ends[:, None, :]
+    return np.where(np.isnat(gaps), np.nan, gaps.astype('timedelta64[D]').astype(float)) / 365.25
+
+
+def compound_growth(values, years_between, years):
+    """Annual compound growth (percent) of every period against the period about `years` earlier.
+
+    NaN when there is no such period or either value is not positive.
+    """
+    periods = values.shape[1]
+    later = np.arange(periods)[:, None] < np.arange(periods)[None, :]
+    with np.errstate(invalid='ignore'):
+        matches = (np.abs(years_between - years) <= PERIOD_MATCH_TOLERANCE_YEARS) & later
+    base_period = np.argmax(matches, axis=2)
+    base = np.take_along_axis(values, base_period, axis=1)
+    span = np.take_along_axis(years_between, base_period[:, :, None], axis=2)[:, :, 0]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        growth = ((values / base) ** (1 / span) - 1) * 100
+    growth[~matches.any(axis=2) | ~(values > 0) | ~(base > 0)] = np.nan
+    return growth
+
+
+def growth_stability(values, years_between):
+    """R^2 of a log-linear trend fitted to each period and the STABILITY_PERIODS - 1 before it.
+
+    1 means the series compounded at a steady rate (or did not change), 0 that it moved with no
+    trend. Only positive values take part; NaN with fewer than MIN_STABILITY_PERIODS of them.
+    """
+    symbols, periods = values.shape
+    stability = np.full((symbols, periods), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_values = np.log(np.where(values > 0, values, np.nan))
+        for period in range(periods):
+            window = slice(period, min(period + STABILITY_PERIODS, periods))
+            x = -years_between[:, period, window]
+            y = log_values[:, window]
+            used = ~np.isnan(x) & ~np.isnan(y)
+            n = used.sum(axis=1)
+            x, y = np.where(used, x, 0.0), np.where(used, y, 0.0)
+            x_spread = (x ** 2).sum(axis=1) - x.sum(axis=1) ** 2 / n
+            y_spread = (y ** 2).sum(axis=1) - y.sum(axis=1) ** 2 / n
+            covariance = (x * y).sum(axis=1) - x.sum(axis=1) * y.sum(axis=1) / n
+            r_squared = np.where(y_spread > 1e-12, covariance ** 2 / (x_spread * y_spread), 1.0)
+            stability[:, period] = np.where(n >= MIN_STABILITY_PERIODS, np.clip(r_squared, 0, 1), np.nan)
+    return stability
+
+
+def derive_ratios(panel):
+    """Every ratio for every symbol and period of the statements panel, as symbol x period arrays.
+
+    Profit margin, ROE and CAGRs are in percent; returnOnAssets is a fraction like Yahoo's
+    returnOnAssets. Ratios whose denominator is missing or not positive are NaN. Debt is Total
+    Debt, or long-term plus current debt when that is not reported.
+    """
+    items = panel_line_items(panel)
+    net_income = items['net_income']
+    equity = items['total_equity']
+    debt = np.where(np.isnan(items['total_debt']),
+                    np.where(np.isnan(items['long_term_debt']) & np.isnan(items['current_debt']), np.nan,
+                             np.nan_to_num(items['long_term_debt']) + np.nan_to_num(items['current_debt'])),
+                    items['total_debt'])
+    interest = np.abs(items['interest_expense'])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratios = {
+            'profit_margin': np.where(items['total_revenue'] > 0, net_income / items['total_revenue'] * 100, np.nan),
+            'returnOnAssets': np.where(items['total_assets'] > 0, net_income / items['total_assets'], np.nan),
+            'interestCoverageRatio': np.where(interest > 0, items['ebit'] / interest, np.nan),
+            'currentRatio': np.where(items['current_liabilities'] > 0,
+                                     items['current_assets'] / items['current_liabilities'], np.nan),
+            'roe': np.where((equity > 0) & (net_income != 0), net_income / equity * 100, np.nan),
+            'debt_to_equity': np.where(equity > 0, debt / equity, np.nan),
+            'fcf': items['operating_cash_flow'] - np.abs(items['capital_expenditure'])
+        }
+
+    years_between = _years_between(panel['period_ends'])
+    for name, item in GROWTH_SERIES.items():
+        for suffix, years in CAGR_YEARS.items():
+            ratios[f"{name}_cagr_{suffix}"] = compound_growth(items[item], years_between, years)
+        ratios[f"{name}_growth_stability"] = growth_stability(items[item], years_between)
+    return ratios, items
+
+
+def _to_json_value(value):
+    return None if not np.isfinite(value) else float(value)
+
+
+def statement_metrics(panel):
+    """Ratios and underlying line items of every symbol's latest period (period 0), for the snapshot.
+
+    Returns a dict mapping symbol to its ratio and growth fields (None when not derivable from the
+    latest period) and a 'statement_items' dict of that period's line items and end date. Values
+    are never taken from older periods, so all of a symbol's fields describe the same fiscal year.
+    """
+    ratios, items = derive_ratios(panel)
+    period_end = panel['period_ends'][:, 0]
+
+    results = {}
+    for row, symbol in enumerate(panel['symbols']):
+        metrics = {field: _to_json_value(values[row, 0]) for field, values in ratios.items()}
+        metrics['statement_items'] = {
+            'period_end': None if np.isnat(period_end[row]) else str(period_end[row]),
+            **{name: _to_json_value(values[row, 0]) for name, values in items.items()}
+        }
+        results[str(symbol)] = metrics
+    return results
+
+
+def latest_free_cash_flow(cash_flow):
+    """Operating cash flow less capital expenditure of a yfinance cashflow frame's latest column.
+
+    Uses the same labels as the statements panel; None when either item is not reported.
+    """
+    if cash_flow is None or cash_flow.empty:
+        return None
+    latest = {}
+    for name in ('operating_cash_flow', 'capital_expenditure'):
+        for label in LINE_ITEMS[name][1]:
+            if label in cash_flow.index and not np.isnan(float(cash_flow.loc[label].iloc[0])):
+                latest[name] = float(cash_flow.loc[label].iloc[0])
+                break
+    if len(latest) < 2:
+        return None
+    return latest['operating_cash_flow'] - abs(latest['capital_expenditure'])
+
+
+def apply_statement_metrics(all_data, metrics):
+    """Write derived metrics into the snapshot.
+
+    Ratio and growth fields and the line items are set for every symbol with statements; ROE,
+    D/E and FCF only fill values Yahoo's info did not provide.
+    """
+    for symbol, symbol_metrics in metrics.items():
+        data = all_data.get(symbol)
+        if data is None or 'error' in data:
+            continue
+        for field in RATIO_FIELDS + GROWTH_FIELDS + ['statement_items']:
+            data[field] = symbol_metrics[field]
+        for field in FALLBACK_FIELDS:
+            if data.get(field) is None:
+                data[field] = symbol_metrics[field]
+
+
+# ----- BENCHMARK -----
+
+def synthetic_panel(size, periods=6, seed=42):
+    """A statements panel with the LINE_ITEMS labels, some missing items and varying year ends"""
+    rng = np.random.default_rng(seed)
+    vocabulary = sorted({(statement, label) for statement, labels in LINE_ITEMS.values() for label in labels})
+    values = rng.lognormal(22, 1.5, (size, periods, len(vocabulary)))
+    values *= np.where(rng.random(values.shape) < 0.1, -1, 1)
+    values[rng.random(values.shape) < 0.3] = np.nan
+
+    year_end = np.datetime64('2025-03-31') - rng.choice([0, 91, 275], size).astype('timedelta64[D]')
+    period_ends = year_end[:, None] - (np.arange(periods) * 365.25).astype('timedelta64[D]')[None, :]
+    period_ends[rng.random((size, periods)) < 0.1] = np.datetime64('NaT')
+    return {
+        'symbols': np.array([f"S{i:05d}.NS" for i in range(size)]),
+        'statements': np.array([statement for statement, _ in vocabulary]),
+        'items': np.array([label for _, label in vocabulary]),
+        'period_ends': period_ends.astype('datetime64[D]'),
+        'values': values
+    }
+
+
+def scalar_ratios(panel, row, period):
+    """Per-symbol computation of a few ratios with scalar fallbacks, for checking the engine"""
+    def item(name):
+        statement, labels = LINE_ITEMS[name]
+        for label in labels:
+            column = np.flatnonzero((panel['statements'] == statement) & (panel['items'] == label))
+            if len(column) and not np.isnan(panel['values'][row, period, column[0]]):
+                return panel['values'][row, period, column[0]]
+        return None
+
+    results = {}
+    net_income, equity, revenue = item('net_income'), item('total_equity'), item('total_revenue')
+    results['roe'] = net_income / equity * 100 if net_income and equity and equity > 0 else None
+    results['profit_margin'] = net_income / revenue * 100 if net_income is not None and revenue and revenue > 0 else None
+    operating_cash_flow, capex = item('operating_cash_flow'), item('capital_expenditure')
+    results['fcf'] = operating_cash_flow - abs(capex) if operating_cash_flow is not None and capex is not None else None
+
+    results['revenue_cagr_3y'] = None
+    dates = panel['period_ends'][row]
+    for base_period in range(period + 1, len(dates)):
+        if np.isnat(dates[base_period]) or np.isnat(dates[period]):
+            continue
+        years = (dates[period] - dates[base_period]).astype(int) / 365.25
+        if abs(years - 3) <= PERIOD_MATCH_TOLERANCE_YEARS:
+            base = None
+            statement, labels = LINE_ITEMS['total_revenue']
+            for label in labels:
+                column = np.flatnonzero((panel['statements'] == statement) & (panel['items'] == label))
+                if len(column) and not np.isnan(panel['values'][row, base_period, column[0]]):
+                    base = panel['values'][row, base_period, column[0]]
+                    break
+            if revenue and revenue > 0 and base and base > 0:
+                results['revenue_cagr_3y'] = ((revenue / base) ** (1 / years) - 1) * 100
+            break
+    return results
+
+
+def run_benchmark(size=5_000, checked=300):
+    """Time the engine and check it against per-symbol scalar code"""
+    panel = synthetic_panel(size)
+    start = time.perf_counter()
+    ratios, _ = derive_ratios(panel)
+    engine_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mismatches = 0
+    for row in range(checked):
+        for period in range(panel['values'].shape[1]):
+            for field, expected in scalar_ratios(panel, row, period).items():
+                value = ratios[field][row, period]
+                if (expected is None) != np.isnan(value) or (expected is not None and not np.isclose(value, expected)):
+                    mismatches += 1
+    scalar_time = (time.perf_counter() - start) * size / checked
+    print(f"{size:,} symbols x {panel['values'].shape[1]} periods: {len(ratios)} ratios in "
+          f"{engine_time * 1000:.1f} ms (scalar code extrapolated: {scalar_time:.1f}s), "
+          f"{mismatches} mismatches over {checked} checked symbols")
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from statements_panel import STATEMENTS_PANEL_PATH, load_statements_panel
+    parser = argparse.ArgumentParser(description='Ratios derived from the statements panel')
+    parser.add_argument('symbols', nargs='*', help='Symbols whose derived metrics to print')
+    parser.add_argument('--panel', type=str, default=STATEMENTS_PANEL_PATH, help='Statements panel file')
+    parser.add_argument('--benchmark', action='store_true', help='Time the engine against scalar code')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark()
+        raise SystemExit(0)
+
+    panel = load_statements_panel(args.panel)
+    if panel is None:
+        print(f"No statements panel at {args.panel}; run the data collector first")
+        raise SystemExit(1)
+    metrics = statement_metrics(panel)
+    coverage = {field: sum(1 for m in metrics.values() if m[field] is not None)
+                for field in RATIO_FIELDS + FALLBACK_FIELDS + GROWTH_FIELDS}
+    print(f"Derived metrics for {len(metrics)} symbols:")
+    for field, count in coverage.items():
+        print(f"  {field:<28} {count:>6}")
+    for symbol in args.symbols:
+        print(json.dumps({symbol: metrics.get(symbol)}, indent=2))
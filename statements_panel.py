@@ -0,0 +1,212 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+STATEMENTS_PANEL_PATH = 'data/statements_panel.npz'
+
+# Annual statements fetched for every stock, by the yfinance attribute they come from
+STATEMENT_TYPES = ['balance_sheet', 'income_stmt', 'cashflow']
+# Fiscal periods kept per symbol, most recent first; six cover a five-year CAGR when Yahoo has them
+MAX_PERIODS = 6
+
+
+def _period_dates(columns):
+    """Statement columns (period end timestamps) as plain dates, NaT where a column is not a date"""
+    dates = pd.to_datetime(pd.Index(columns), errors='coerce')
+    if getattr(dates, 'tz', None) is not None:
+        dates = dates.tz_localize(None)
+    return dates.values.astype('datetime64[D]')
+
+
+def _numeric_values(frame):
+    """Frame values as floats; non-numeric cells (yfinance sometimes returns objects) become NaN"""
+    try:
+        return frame.to_numpy(dtype=float)
+    except (TypeError, ValueError):
+        return frame.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+
+def build_statements_panel(statements, max_periods=MAX_PERIODS):
+    """Stack every symbol's annual statements into one symbol x period x line-item array.
+
+    statements maps symbol to {statement type: DataFrame} as fetched from yfinance (line items
+    as rows, period end dates as columns). The line-item vocabulary is the sorted union of the
+    (statement, item) pairs seen across all symbols. A symbol's periods are the period end dates
+    of its statements, latest first, so period 0 is the latest fiscal year; statements sharing a
+    date land in the same period. Missing values are NaN.
+
+    Returns a dict with the symbols, the statement and item of each line item, the period end
+    dates (symbol x period, NaT when a symbol has fewer periods) and the values.
+    """
+    frames = {symbol: {kind: frame for kind, frame in symbol_statements.items()
+                       if kind in STATEMENT_TYPES and frame is not None and not frame.empty}
+              for symbol, symbol_statements in statements.items()}
+    symbols = sorted(symbol for symbol, symbol_frames in frames.items() if symbol_frames)
+
+    vocabulary = sorted({(kind, str(item)) for symbol in symbols
+                         for kind, frame in frames[symbol].items() for item in frame.index})
+    columns = {line_item: column for column, line_item in enumerate(vocabulary)}
+
+    period_ends = np.full((len(symbols), max_periods), np.datetime64('NaT'), dtype='datetime64[D]')
+    values = np.full((len(symbols), max_periods, len(vocabulary)), np.nan)
+    for row, symbol in enumerate(symbols):
+        dated = {kind: _period_dates(frame.columns) for kind, frame in frames[symbol].items()}
+        dates = np.unique(np.concatenate(list(dated.values())))
+        dates = dates[~np.isnat(dates)][::-1][:max_periods]
+        period_ends[row, :len(dates)] = dates
+
+        for kind, frame in frames[symbol].items():
+            # Periods are matched by date; columns older than the kept periods are dropped
+            periods = np.array([np.flatnonzero(dates == date)[0] if date in dates else -1 for date in dated[kind]],
+                               dtype=int)
+            kept = periods >= 0
+            if not kept.any():
+                continue
+            items = [columns[(kind, str(item))] for item in frame.index]
+            values[row, periods[kept][:, None], np.array(items)[None, :]] = _numeric_values(frame)[:, kept].T
+
+    return {
+        'symbols': np.array(symbols, dtype=str),
+        'statements': np.array([kind for kind, _ in vocabulary], dtype=str),
+        'items': np.array([item for _, item in vocabulary], dtype=str),
+        'period_ends': period_ends,
+        'values': values
+    }
+
+
+def line_item_column(panel, statement, item):
+    """Column of a line item in the panel's vocabulary, or None when no symbol reported it"""
+    matches = np.flatnonzero((panel['statements'] == statement) & (panel['items'] == item))
+    return int(matches[0]) if len(matches) else None
+
+
+def line_item_values(panel, statement, items):
+    """Symbol x period values of the first of several alternative line items each symbol reports.
+
+    yfinance labels the same figure differently across companies (e.g. 'Net Income' or 'Net
+    Income Common Stockholders'); the items are tried in order per symbol and period, NaN when
+    none is reported.
+    """
+    result = np.full(panel['values'].shape[:2], np.nan)
+    for item in items:
+        column = line_item_column(panel, statement, item)
+        if column is not None:
+            result = np.where(np.isnan(result), panel['values'][:, :, column], result)
+    return result
+
+
+def save_statements_panel(panel, path=STATEMENTS_PANEL_PATH):
+    """Write the panel to a compressed npz, replacing the previous file atomically"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp.npz"
+    np.savez_compressed(temp_path, **panel)
+    os.replace(temp_path, path)
+
+
+def load_statements_panel(path=STATEMENTS_PANEL_PATH):
+    """Load the statements panel, or None when there is none"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as store:
+            return {key: store[key] for key in ('symbols', 'statements', 'items', 'period_ends', 'values')}
+    except Exception as e:
+        print(f"Error loading statements panel: {e}")
+        return None
+
+
+def statements_at(panel, symbol):
+    """One symbol's statements as {statement type: DataFrame} with line items as rows, like yfinance"""
+    rows = np.flatnonzero(panel['symbols'] == symbol)
+    if not len(rows):
+        return {}
+    row = rows[0]
+    dates = panel['period_ends'][row]
+    has_period = ~np.isnat(dates)
+    result = {}
+    for kind in STATEMENT_TYPES:
+        columns = np.flatnonzero(panel['statements'] == kind)
+        values = panel['values'][row][has_period][:, columns].T
+        reported = ~np.isnan(values).all(axis=1)
+        if reported.any():
+            result[kind] = pd.DataFrame(values[reported], index=panel['items'][columns][reported],
+                                        columns=pd.DatetimeIndex(dates[has_period]))
+    return result
+
+
+# ----- BENCHMARK -----
+
+def synthetic_statements(size, items_per_statement=60, periods=4, seed=42):
+    """Statement frames shaped like yfinance's, with varying line items and fiscal year ends"""
+    rng = np.random.default_rng(seed)
+    item_names = {kind: [f"{kind} item {i}" for i in range(items_per_statement * 2)] for kind in STATEMENT_TYPES}
+    statements = {}
+    for i in range(size):
+        year_end = pd.Timestamp('2025-03-31') - pd.DateOffset(months=int(rng.choice([0, 3, 9])))
+        dates = [year_end - pd.DateOffset(years=k) for k in range(periods)]
+        statements[f"S{i:05d}.NS"] = {
+            kind: pd.DataFrame(rng.lognormal(20, 2, (items_per_statement, periods)),
+                               index=rng.choice(names, items_per_statement, replace=False), columns=dates)
+            for kind, names in item_names.items()
+        }
+    return statements
+
+
+def run_benchmark(size=2_000):
+    """Time building the panel and compare its size on disk with the statements as JSON"""
+    import json
+    import tempfile
+    statements = synthetic_statements(size)
+
+    start = time.perf_counter()
+    panel = build_statements_panel(statements)
+    build_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'panel.npz')
+        start = time.perf_counter()
+        save_statements_panel(panel, path)
+        save_time = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = load_statements_panel(path)
+        load_time = time.perf_counter() - start
+        panel_size = os.path.getsize(path)
+
+    as_json = json.dumps({symbol: {kind: frame.rename(columns=str).to_dict() for kind, frame in frames.items()}
+                          for symbol, frames in statements.items()})
+    symbol = panel['symbols'][0]
+    round_trip = all(np.allclose(statements[symbol][kind].loc[frame.index, frame.columns], frame)
+                     for kind, frame in statements_at(loaded, symbol).items())
+    print(f"{size:,} symbols x {panel['values'].shape[1]} periods x {panel['values'].shape[2]} line items: "
+          f"built in {build_time:.2f}s, saved in {save_time:.2f}s, loaded in {load_time:.3f}s")
+    print(f"  {panel['values'].nbytes / 2**20:.0f} MB in memory, {panel_size / 2**20:.1f} MB on disk "
+          f"(the same statements as JSON: {len(as_json) / 2**20:.1f} MB), round trip {'ok' if round_trip else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Multi-period financial statements panel')
+    parser.add_argument('symbols', nargs='*', help='Symbols whose statements to print')
+    parser.add_argument('--panel', type=str, default=STATEMENTS_PANEL_PATH, help='Statements panel file')
+    parser.add_argument('--statement', choices=STATEMENT_TYPES, default=None, help='Only print this statement')
+    parser.add_argument('--benchmark', action='store_true', help='Time building and storing a synthetic panel')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark()
+        raise SystemExit(0)
+
+    panel = load_statements_panel(args.panel)
+    if panel is None:
+        print(f"No statements panel at {args.panel}; run the data collector first")
+        raise SystemExit(1)
+    reported = (~np.isnat(panel['period_ends'])).sum(axis=1)
+    print(f"{len(panel['symbols'])} symbols, {len(panel['items'])} line items, "
+          f"{np.bincount(reported, minlength=MAX_PERIODS + 1).tolist()} symbols by number of periods")
+    for symbol in args.symbols:
+        for kind, frame in statements_at(panel, symbol).items():
+            if args.statement in (None, kind):
+                print(f"\n{symbol} {kind}")
+                print(frame.to_string())
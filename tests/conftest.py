@@ -0,0 +1,26 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+sys.path.insert(0, ROOT)
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='session')
+def snapshot():
+    """A small snapshot: real records of a dozen sectors with synthetic growth, ownership and trend fields"""
+    return load_fixture('snapshot.json')
+
+
+@pytest.fixture(scope='session')
+def baseline():
+    """The fixture snapshot scored by the per-stock analyzers before the scoring rules were declarative"""
+    return load_fixture('baseline_analysis.json')
@@ -0,0 +1,28 @@
+import pytest
+
+from buffet_analyzer import format_reasons, normalize_stock_data, score_stock
+from sector_index import build_sector_index
+
+REASON_FIELDS = ['buffett_reasons', 'technical_reasons', 'growth_reasons', 'warnings']
+SCORE_FIELDS = ['buffett_score', 'technical_score', 'growth_score', 'total_score']
+
+
+@pytest.fixture(scope='module')
+def analyses(snapshot):
+    normalized = normalize_stock_data(snapshot)
+    sector_index = build_sector_index(normalized)
+    return {symbol: score_stock(symbol, normalized[symbol], normalized, sector_index) for symbol in normalized}
+
+
+def test_scores_match_baseline(analyses, baseline):
+    assert sorted(analyses) == sorted(baseline)
+    for symbol, analysis in analyses.items():
+        for field in SCORE_FIELDS:
+            assert analysis[field] == baseline[symbol][field], (symbol, field)
+        assert analysis['missing_data'] == baseline[symbol]['missing_data'], symbol
+
+
+def test_reasons_match_baseline_in_order(analyses, baseline):
+    for symbol, analysis in analyses.items():
+        for field in REASON_FIELDS:
+            assert format_reasons(analysis[field]) == baseline[symbol][field], (symbol, field)
@@ -0,0 +1,74 @@
+import pytest
+
+from buffet_analyzer import (
+    MOAT_KEYWORDS, build_analysis_sector_index, scan_business_summaries, scan_business_summary
+)
+from rule_compiler import format_rule_messages, load_rules
+from vectorized_scoring import prepare_frame, score_frame
+
+SCORE_FIELDS = ['buffett_score', 'technical_score', 'growth_score', 'total_score']
+REASON_FIELDS = {'buffett': 'buffett_reasons', 'technical': 'technical_reasons', 'growth': 'growth_reasons'}
+
+
+@pytest.fixture(scope='module')
+def rules():
+    return load_rules()
+
+
+@pytest.fixture(scope='module')
+def frame(snapshot):
+    return prepare_frame(snapshot)
+
+
+@pytest.fixture(scope='module')
+def scored(snapshot, frame, rules):
+    return score_frame(frame, build_analysis_sector_index(snapshot), rules)
+
+
+def is_subsequence(items, sequence):
+    remaining = iter(sequence)
+    return all(item in remaining for item in items)
+
+
+def test_scores_match_baseline(scored, baseline):
+    assert sorted(scored['symbols']) == sorted(baseline)
+    for i, symbol in enumerate(scored['symbols']):
+        for field in SCORE_FIELDS:
+            assert float(scored[field][i]) == baseline[symbol][field], (symbol, field)
+
+
+def test_rule_reasons_match_baseline_in_order(frame, scored, rules, baseline):
+    # Besides the rule findings, the baseline lists hold the qualitative, trend and sector reasons,
+    # so each category's rule findings must appear in them in the same order
+    section_categories = {rule['section']: rule['category'] for rule in rules['rules']}
+    found = 0
+    for i, symbol in enumerate(scored['symbols']):
+        messages = format_rule_messages(rules, scored['evaluation'], frame['columns'], i)
+        reasons = {field: [] for field in REASON_FIELDS.values()}
+        warnings = []
+        for section, (section_reasons, section_warnings) in messages.items():
+            reasons[REASON_FIELDS[section_categories[section]]].extend(section_reasons)
+            warnings.extend(section_warnings)
+        for field, texts in reasons.items():
+            assert is_subsequence(texts, baseline[symbol][field]), (symbol, field, texts)
+            found += len(texts)
+        assert is_subsequence(warnings, baseline[symbol]['warnings']), (symbol, warnings)
+        found += len(warnings)
+    assert found
+
+
+def test_summary_columns_match_scalar_scan(snapshot):
+    symbols = sorted(snapshot)
+    names = [snapshot[symbol].get('name') for symbol in symbols]
+    summaries = [snapshot[symbol].get('longBusinessSummary') for symbol in symbols]
+    # Append names and keywords at the edges of the name and summary, where offsets matter
+    names += ['ITC Limited', 'Leading brand', None]
+    summaries += ['A market leader in cigarettes', 'itc', 'network effect and switching cost']
+
+    hits = scan_business_summaries(names, summaries)
+    for i, (name, summary) in enumerate(zip(names, summaries)):
+        expected = scan_business_summary(name, summary)
+        assert hits['concentration'][i] == expected['concentration'], name
+        assert hits['strong_moat_company'][i] == (expected['strong_moat_company'] is not None), name
+        assert [moat_type for moat_type, hit in zip(MOAT_KEYWORDS, hits['moat_types'][i]) if hit] == \
+            expected['moat_types'], name
@@ -0,0 +1,383 @@
+import json
+import time
+
+import numpy as np
+
+# Sector parameters as ordered (keywords, value) pairs; the first pair with a keyword in the
+# sector name wins, otherwise the default applies
+GRAHAM_GROWTH_RATES = [(('Technology', 'Software'), 8), (('Consumer',), 6), (('Health',), 7),
+                       (('Financial', 'Bank'), 5)]
+DEFAULT_GRAHAM_GROWTH_RATE = 5
+
+DDM_GROWTH_RATES = [(('Technology', 'Software'), 5), (('Consumer',), 4)]
+DEFAULT_DDM_GROWTH_RATE = 3
+DDM_DISCOUNT_RATE = 0.10
+
+PE_MULTIPLES = [(('Technology',), 20), (('Consumer',), 18), (('Utilities',), 14), (('Financial',), 12)]
+DEFAULT_PE_MULTIPLE = 15
+
+PB_MULTIPLES = [(('Financial', 'Bank'), 1.2), (('Technology',), 3.0), (('Consumer',), 2.5)]
+DEFAULT_PB_MULTIPLE = 1.5
+
+# Two-stage free cash flow DCF: DCF_STAGE_ONE_YEARS of growth, then a Gordon growth terminal value
+DCF_STAGE_ONE_YEARS = 5
+DCF_STAGE_ONE_GROWTH = 0.10
+DCF_TERMINAL_GROWTH = 0.04
+DCF_DISCOUNT_RATE = 0.12
+
+# Monte Carlo draws over the stage one growth and the discount rate. The same seeded draws are
+# used for every stock, so a stock's distribution does not depend on which stocks share the batch
+DCF_MONTE_CARLO_DRAWS = 500
+DCF_GROWTH_STDEV = 0.03
+DCF_DISCOUNT_STDEV = 0.015
+DCF_MIN_TERMINAL_SPREAD = 0.02
+DCF_SEED = 42
+DCF_PERCENTILES = (10, 50, 90)
+
+VALUATION_METHODS = ['graham', 'ddm', 'pe_multiple', 'book_value', 'dcf']
+
+# Sensitivity grid: growth is offset around the stock's sector growth estimate and the exit
+# multiple is scaled around its sector P/E multiple
+SENSITIVITY_GROWTH_OFFSETS = np.arange(-4, 4.5, 1) / 100
+SENSITIVITY_DISCOUNT_RATES = np.arange(0.10, 0.165, 0.01)
+SENSITIVITY_MULTIPLE_SCALES = np.array([0.6, 0.8, 1.0, 1.2, 1.4])
+SENSITIVITY_YEARS = 5
+SENSITIVITY_PERCENTILES = (10, 50, 90)
+
+# Margin of safety bands (percent), matching the valuation analyzer thresholds
+MARGIN_OF_SAFETY_BANDS = [(40, 'huge'), (30, 'substantial'), (20, 'good'), (10, 'some'), (0, 'thin')]
+
+
+def sector_parameter(sector, table, default):
+    """Look up a sector parameter in an ordered (keywords, value) table"""
+    for keywords, value in table:
+        if any(keyword in sector for keyword in keywords):
+            return value
+    return default
+
+
+def _sector_parameters(sectors, table, default):
+    """Sector parameter for every stock, looked up once per distinct sector"""
+    lookup = {sector: sector_parameter(sector, table, default) for sector in set(sectors)}
+    return [lookup[sector] for sector in sectors]
+
+
+def _to_float(value):
+    if value is None or isinstance(value, (str, list, dict)):
+        return np.nan
+    return float(value)
+
+
+def build_valuation_inputs(records):
+    """Collect the valuation inputs of a list of stock records into arrays"""
+    return {
+        # Same fallback as the analyzer: a missing or zero EPS falls back to trailing EPS
+        'eps': np.array([_to_float(data.get('eps') or data.get('trailingEPS')) for data in records]),
+        'dividend_yield': np.array([_to_float(data.get('dividendYield')) for data in records]),
+        'current_price': np.array([_to_float(data.get('current_price')) for data in records]),
+        'book_value': np.array([_to_float(data.get('bookValue')) for data in records]),
+        'pe_ratio': np.array([_to_float(data.get('pe_ratio')) for data in records]),
+        'fcf': np.array([_to_float(data.get('fcf')) for data in records]),
+        'market_cap': np.array([_to_float(data.get('market_cap')) for data in records]),
+        'sector': [data.get('sector', '') or '' for data in records]
+    }
+
+
+def _two_stage_value(cash_flow, growth, discount_rate, terminal_growth, years):
+    """Present value of a cash flow growing for `years` and then at the terminal growth rate"""
+    ratio = (1 + growth) / (1 + discount_rate)
+    ratio_power = np.ones_like(ratio)
+    stage_one = np.zeros_like(ratio)
+    for _ in range(years):
+        ratio_power = ratio_power * ratio
+        stage_one = stage_one + ratio_power
+    terminal = ratio_power * (1 + terminal_growth) / (discount_rate - terminal_growth)
+    return cash_flow * (stage_one + terminal)
+
+
+def compute_dcf(inputs, stage_one_growth=DCF_STAGE_ONE_GROWTH, terminal_growth=DCF_TERMINAL_GROWTH,
+                discount_rate=DCF_DISCOUNT_RATE, years=DCF_STAGE_ONE_YEARS, draws=DCF_MONTE_CARLO_DRAWS,
+                seed=DCF_SEED):
+    """Two-stage free cash flow DCF per share for all stocks in one pass.
+
+    Free cash flow per share is fcf / (market_cap / current_price); stocks without positive free
+    cash flow, market cap or price get NaN. With draws > 0, stage one growth and the discount
+    rate are also drawn from normal distributions around the given values (the discount rate
+    kept at least DCF_MIN_TERMINAL_SPREAD above terminal growth) and the value percentiles over
+    the draws are returned. Returns a dict with the base case 'value', the 'percentiles' (None
+    without draws) and the 'parameters' used.
+    """
+    if discount_rate - terminal_growth < DCF_MIN_TERMINAL_SPREAD:
+        raise ValueError("The discount rate must exceed terminal growth by at least "
+                         f"{DCF_MIN_TERMINAL_SPREAD:.0%}")
+
+    fcf = inputs['fcf']
+    market_cap = inputs['market_cap']
+    current_price = inputs['current_price']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        valid = (fcf > 0) & (market_cap > 0) & (current_price > 0)
+        fcf_per_share = np.where(valid, fcf * current_price / market_cap, np.nan)
+
+    value = _two_stage_value(fcf_per_share, np.float64(stage_one_growth), np.float64(discount_rate),
+                             terminal_growth, years)
+
+    percentiles = None
+    if draws > 0:
+        rng = np.random.default_rng(seed)
+        growth_draws = rng.normal(stage_one_growth, DCF_GROWTH_STDEV, draws)
+        discount_draws = np.maximum(rng.normal(discount_rate, DCF_DISCOUNT_STDEV, draws),
+                                    terminal_growth + DCF_MIN_TERMINAL_SPREAD)
+        draw_values = _two_stage_value(fcf_per_share[:, None], growth_draws[None, :], discount_draws[None, :],
+                                       terminal_growth, years)
+        percentiles = {f'p{q}': np.full(len(fcf), np.nan) for q in DCF_PERCENTILES}
+        if valid.any():
+            for q, values in zip(DCF_PERCENTILES, np.percentile(draw_values[valid], DCF_PERCENTILES, axis=1)):
+                percentiles[f'p{q}'][valid] = values
+
+    return {
+        'value': value,
+        'percentiles': percentiles,
+        'parameters': {'stage_one_growth': stage_one_growth, 'terminal_growth': terminal_growth,
+                       'discount_rate': discount_rate, 'years': years, 'draws': draws}
+    }
+
+
+def compute_valuation_methods(inputs, dcf_options=None):
+    """Compute the Graham, dividend discount, P/E multiple, book value and DCF methods for all stocks.
+
+    Returns a dict with one value array per method (NaN where the method does not apply), the
+    parameters used for each method, the DCF percentiles and the median across the available
+    methods. dcf_options are passed on to compute_dcf.
+    """
+    sectors = inputs['sector']
+    parameters = {
+        'graham': _sector_parameters(sectors, GRAHAM_GROWTH_RATES, DEFAULT_GRAHAM_GROWTH_RATE),
+        'ddm': _sector_parameters(sectors, DDM_GROWTH_RATES, DEFAULT_DDM_GROWTH_RATE),
+        'pe_multiple': _sector_parameters(sectors, PE_MULTIPLES, DEFAULT_PE_MULTIPLE),
+        'book_value': _sector_parameters(sectors, PB_MULTIPLES, DEFAULT_PB_MULTIPLE)
+    }
+    graham_growth = np.array(parameters['graham'], dtype=float)
+    ddm_growth = np.array(parameters['ddm'], dtype=float)
+    pe_multiple = np.array(parameters['pe_multiple'], dtype=float)
+    pb_multiple = np.array(parameters['book_value'], dtype=float)
+
+    eps = inputs['eps']
+    dividend_yield = inputs['dividend_yield']
+    current_price = inputs['current_price']
+    book_value = inputs['book_value']
+
+    with np.errstate(invalid='ignore'):
+        has_eps = eps > 0
+        has_dividend = (dividend_yield > 0) & (current_price > 0)
+        has_book_value = book_value > 0
+
+        current_dividend = (dividend_yield / 100) * current_price
+        values = {
+            'graham': np.where(has_eps, eps * (8.5 + (2 * graham_growth)), np.nan),
+            'ddm': np.where(has_dividend, current_dividend * (1 + ddm_growth / 100) /
+                            (DDM_DISCOUNT_RATE - ddm_growth / 100), np.nan),
+            'pe_multiple': np.where(has_eps, eps * pe_multiple, np.nan),
+            'book_value': np.where(has_book_value, book_value * pb_multiple, np.nan)
+        }
+
+    dcf = compute_dcf(inputs, **(dcf_options or {}))
+    values['dcf'] = dcf['value']
+    parameters['dcf'] = dcf['parameters']
+
+    stacked = np.column_stack([values[method] for method in VALUATION_METHODS])
+    available = ~np.isnan(stacked)
+    median = np.full(len(eps), np.nan)
+    any_available = available.any(axis=1)
+    median[any_available] = np.nanmedian(stacked[any_available], axis=1)
+
+    return {'values': values, 'parameters': parameters, 'dcf_percentiles': dcf['percentiles'], 'median': median}
+
+
+def valuation_methods_at(valuations, row):
+    """Methods dict for one stock, in the format stored with the analysis"""
+    descriptions = {
+        'graham': "Graham's formula with {}% growth estimate",
+        'ddm': "Dividend Discount Model with {}% growth",
+        'pe_multiple': "P/E Multiple Method ({}x earnings)",
+        'book_value': "Book Value Method ({}x book value)"
+    }
+    methods = {}
+    for method in VALUATION_METHODS:
+        value = valuations['values'][method][row]
+        if np.isnan(value):
+            continue
+
+        if method == 'dcf':
+            dcf = valuations['parameters']['dcf']
+            methods['dcf'] = {
+                'value': float(value),
+                'description': (f"Two-stage FCF DCF ({dcf['years']}y at {dcf['stage_one_growth']:.0%} growth, "
+                                f"then {dcf['terminal_growth']:.0%}, discounted at {dcf['discount_rate']:.0%})")
+            }
+            if valuations['dcf_percentiles']:
+                methods['dcf']['percentiles'] = {name: float(values[row])
+                                                 for name, values in valuations['dcf_percentiles'].items()}
+        else:
+            methods[method] = {
+                'value': float(value),
+                'description': descriptions[method].format(valuations['parameters'][method][row])
+            }
+    return methods
+
+
+# ----- SENSITIVITY GRID -----
+
+def margin_of_safety_band(margin_of_safety):
+    """Band label for a margin of safety in percent"""
+    for threshold, band in MARGIN_OF_SAFETY_BANDS:
+        if margin_of_safety > threshold:
+            return band
+    return 'overvalued'
+
+
+def compute_sensitivity_grid(inputs, growth_offsets=SENSITIVITY_GROWTH_OFFSETS,
+                             discount_rates=SENSITIVITY_DISCOUNT_RATES,
+                             multiple_scales=SENSITIVITY_MULTIPLE_SCALES, years=SENSITIVITY_YEARS):
+    """Value every stock over a growth x discount rate x exit multiple grid in one broadcast.
+
+    Each scenario discounts `years` of earnings growing at the scenario growth rate plus an exit
+    value at the scenario multiple of the final year's earnings. Earnings per share fall back to
+    price / P/E when EPS was not collected. Returns per-stock percentiles of the scenario values
+    ('low', 'base', 'high'), the margin of safety at each of them, the share of scenarios valuing
+    the stock above its price and the number of scenarios. Stocks without positive earnings are NaN.
+    """
+    eps = inputs['eps']
+    current_price = inputs['current_price']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        implied_eps = np.where(inputs['pe_ratio'] > 0, current_price / inputs['pe_ratio'], np.nan)
+    earnings = np.where(eps > 0, eps, implied_eps)
+    valid = earnings > 0
+
+    sectors = inputs['sector']
+    base_growth = np.array(_sector_parameters(sectors, GRAHAM_GROWTH_RATES, DEFAULT_GRAHAM_GROWTH_RATE),
+                           dtype=float)[valid] / 100
+    base_multiple = np.array(_sector_parameters(sectors, PE_MULTIPLES, DEFAULT_PE_MULTIPLE), dtype=float)[valid]
+
+    # Axes: stock x growth x discount rate x multiple
+    growth = base_growth[:, None, None, None] + growth_offsets[None, :, None, None]
+    discount = discount_rates[None, None, :, None]
+    multiple = base_multiple[:, None, None, None] * multiple_scales[None, None, None, :]
+
+    ratio = (1 + growth) / (1 + discount)
+    discounted_earnings = np.zeros_like(ratio)
+    ratio_power = np.ones_like(ratio)
+    for _ in range(years):
+        ratio_power = ratio_power * ratio
+        discounted_earnings = discounted_earnings + ratio_power
+    scenario_values = earnings[valid][:, None, None, None] * (discounted_earnings + ratio_power * multiple)
+    scenario_values = scenario_values.reshape(len(base_growth), -1)
+
+    count = len(earnings)
+    result = {name: np.full(count, np.nan) for name in
+              ['low', 'base', 'high', 'margin_of_safety_low', 'margin_of_safety_base',
+               'margin_of_safety_high', 'undervalued_share']}
+    result['scenarios'] = scenario_values.shape[1]
+
+    percentiles = np.percentile(scenario_values, SENSITIVITY_PERCENTILES, axis=1)
+    price = current_price[valid]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name, values in zip(['low', 'base', 'high'], percentiles):
+            result[name][valid] = values
+            result[f'margin_of_safety_{name}'][valid] = (values - price) / values * 100
+        undervalued = np.where(price > 0, (scenario_values > price[:, None]).mean(axis=1), np.nan)
+    result['undervalued_share'][valid] = undervalued
+    return result
+
+
+def sensitivity_at(grid, row):
+    """Intrinsic value range and margin of safety band for one stock, or None without a grid"""
+    if np.isnan(grid['base'][row]):
+        return None
+
+    summary = {name: float(grid[name][row]) for name in
+               ['low', 'base', 'high', 'margin_of_safety_low', 'margin_of_safety_base', 'margin_of_safety_high']}
+    if np.isnan(grid['undervalued_share'][row]):
+        summary['undervalued_share'] = None
+        summary['band'] = None
+    else:
+        summary['undervalued_share'] = float(grid['undervalued_share'][row])
+        summary['band'] = margin_of_safety_band(summary['margin_of_safety_base'])
+    return summary
+
+
+# ----- BENCHMARK -----
+
+def generate_synthetic_inputs(size, seed=42):
+    """Synthetic valuation inputs with realistic sector mix for benchmarking"""
+    rng = np.random.default_rng(seed)
+    sectors = ['Industrials', 'Consumer Cyclical', 'Basic Materials', 'Financial Services', 'Technology',
+               'Healthcare', 'Consumer Defensive', 'Real Estate', 'Utilities', 'Energy']
+    price = rng.lognormal(6, 1, size)
+    return {
+        'eps': np.where(rng.random(size) < 0.8, price / rng.uniform(8, 60, size), np.nan),
+        'dividend_yield': np.where(rng.random(size) < 0.6, rng.uniform(0, 5, size), np.nan),
+        'current_price': price,
+        'book_value': price / rng.uniform(0.5, 8, size),
+        'pe_ratio': rng.uniform(8, 60, size),
+        'fcf': np.where(rng.random(size) < 0.6, rng.lognormal(20, 2, size), -rng.lognormal(19, 2, size)),
+        'market_cap': rng.lognormal(23, 2, size),
+        'sector': [sectors[i] for i in rng.integers(0, len(sectors), size)]
+    }
+
+
+def run_benchmark(sizes=(2_000, 20_000), dcf_options=None):
+    """Time the valuation methods (including the DCF draws) and the full sensitivity grid"""
+    for size in sizes:
+        inputs = generate_synthetic_inputs(size)
+
+        start = time.perf_counter()
+        compute_valuation_methods(inputs, dcf_options)
+        methods_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        grid = compute_sensitivity_grid(inputs)
+        grid_time = time.perf_counter() - start
+
+        print(f"{size:>7,} stocks: methods {methods_time:.3f}s, "
+              f"sensitivity grid ({grid['scenarios']} scenarios each) {grid_time:.3f}s")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Vectorized intrinsic value engine')
+    parser.add_argument('--data', type=str, default='data/latest.json', help='Snapshot to value')
+    parser.add_argument('--benchmark', action='store_true', help='Benchmark on synthetic universes')
+    parser.add_argument('--dcf-growth', type=float, default=DCF_STAGE_ONE_GROWTH, help='DCF stage one growth rate')
+    parser.add_argument('--dcf-terminal-growth', type=float, default=DCF_TERMINAL_GROWTH,
+                        help='DCF terminal growth rate')
+    parser.add_argument('--dcf-discount-rate', type=float, default=DCF_DISCOUNT_RATE, help='DCF discount rate')
+    parser.add_argument('--dcf-draws', type=int, default=DCF_MONTE_CARLO_DRAWS,
+                        help='Monte Carlo draws for the DCF distribution (0 disables)')
+    args = parser.parse_args()
+    dcf_options = {'stage_one_growth': args.dcf_growth, 'terminal_growth': args.dcf_terminal_growth,
+                   'discount_rate': args.dcf_discount_rate, 'draws': args.dcf_draws}
+
+    if args.benchmark:
+        run_benchmark(dcf_options=dcf_options)
+    else:
+        with open(args.data, 'r') as f:
+            stock_data = json.load(f)
+        records = [data for data in stock_data.values() if 'error' not in data]
+
+        start = time.perf_counter()
+        inputs = build_valuation_inputs(records)
+        valuations = compute_valuation_methods(inputs, dcf_options)
+        grid = compute_sensitivity_grid(inputs)
+        elapsed = time.perf_counter() - start
+
+        bands = {}
+        for row in range(len(records)):
+            summary = sensitivity_at(grid, row)
+            band = summary['band'] if summary else 'no earnings'
+            bands[band] = bands.get(band, 0) + 1
+
+        print(f"Valued {len(records)} stocks in {elapsed:.3f}s")
+        for method in VALUATION_METHODS:
+            print(f"  {method}: {int((~np.isnan(valuations['values'][method])).sum())} stocks")
+        print("Margin of safety bands (base scenario): " +
+              ", ".join(f"{band} {count}" for band, count in sorted(bands.items(), key=lambda x: -x[1])))
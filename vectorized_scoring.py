@@ -0,0 +1,394 @@
+import json
+import time
+
+import numpy as np
+
+from buffet_analyzer import (
+    INDUSTRY_OUTCOMES, MACRO_OUTCOMES, REGULATORY_OUTCOMES, build_analysis_sector_index, classify_sector,
+    load_latest_data, normalize_stock_data, scan_business_summaries, score_stock, symbol_exchange
+)
+from percentile_ranks import RANK_SCOPES, RANKED_METRICS, compute_percentile_ranks, rank_column_name
+from rule_compiler import PICK_THRESHOLD, evaluate_rules, load_rules
+from sector_index import SECTOR_METRICS, build_sector_index
+
+# Numeric inputs read by the scoring rules and the structural checks
+NUMERIC_COLUMNS = [
+    'revenue_yoy', 'revenue_ttm_yoy', 'revenue_qoq', 'operating_profit_yoy', 'operating_profit_qoq',
+    'net_profit_yoy', 'net_profit_qoq', 'profit_margin', 'roe', 'returnOnAssets', 'debt_to_equity',
+    'interestCoverageRatio', 'currentRatio', 'fcf', 'market_cap', 'pe_ratio', 'pb_ratio', 'intrinsic_value',
+    'current_price', 'margin_of_safety', 'dividendYield', 'rsi', 'ma_50', 'ma_200', 'macd_line', 'macd_signal',
+    'macd_histogram', 'promoterHolding', 'promoterHoldingChange', 'fiiHolding', 'diiHolding', 'fiiHoldingChange',
+    'diiHoldingChange', 'payoutRatio'
+]
+
+# Price momentum fields of the snapshot, available to rule sets
+MOMENTUM_COLUMNS = [
+    'return_1w', 'return_1m', 'return_3m', 'return_6m', 'return_12m', 'high_52w_distance', 'low_52w_distance'
+]
+
+# Risk fields computed from the price history, scored by the risk rules
+RISK_COLUMNS = ['volatility', 'beta', 'max_drawdown', 'atr_percent']
+
+# Multi-year growth fields derived from the statements panel, available to rule sets
+STATEMENT_GROWTH_COLUMNS = [
+    'revenue_cagr_3y', 'revenue_cagr_5y', 'net_income_cagr_3y', 'net_income_cagr_5y',
+    'revenue_growth_stability', 'net_income_growth_stability'
+]
+
+# Flags read by the analyzers (truthiness only)
+FLAG_COLUMNS = ['price_history_available', 'shareholding_data_available', 'hasRecentBuyback']
+
+# Sector performance comparison direction per metric
+SECTOR_HIGHER_BETTER = {'roe': True, 'debt_to_equity': False, 'pe_ratio': False, 'revenue_yoy': True}
+
+
+def _to_float(value):
+    if value is None or isinstance(value, (str, list, dict)):
+        return np.nan
+    return float(value)
+
+
+def build_stock_frame(stock_data):
+    """Build a columnar frame of every analyzable stock.
+
+    Returns a dict with the symbol list, one float array per numeric input (NaN when missing), one
+    bool array per flag and the sector, name and business summary strings. Snapshots can contain
+    NaN values, which the analyzers treat as present, so 'present' holds a mask of the values that
+    are not None for each numeric input. Debt-to-equity is normalized the same way the analyzer does.
+    """
+    symbols = [symbol for symbol, data in stock_data.items()
+               if 'error' not in data and '.BO' not in symbol]
+    records = [stock_data[symbol] for symbol in symbols]
+
+    columns = {}
+    present = {}
+    for column in NUMERIC_COLUMNS + RISK_COLUMNS + MOMENTUM_COLUMNS + STATEMENT_GROWTH_COLUMNS:
+        values = [data.get(column) for data in records]
+        columns[column] = np.array([_to_float(value) for value in values], dtype=float)
+        present[column] = np.array([value is not None for value in values], dtype=bool)
+    for column in FLAG_COLUMNS:
+        columns[column] = np.array([bool(data.get(column, False)) for data in records], dtype=bool)
+
+    debt_to_equity = columns['debt_to_equity']
+    with np.errstate(invalid='ignore'):
+        columns['debt_to_equity'] = np.where(debt_to_equity > 3, debt_to_equity / 100, debt_to_equity)
+
+    return {
+        'symbols': symbols,
+        'columns': columns,
+        'present': present,
+        'sector': [data.get('sector', 'Unknown') for data in records],
+        'name': [data.get('name', '') for data in records],
+        'summary': [data.get('longBusinessSummary', '') for data in records]
+    }
+
+
+def add_derived_columns(frame):
+    """Add the derived rule inputs (ratios, gated values and per-stock thresholds) to the frame.
+
+    Derived columns are NaN where buffet_analyzer.rule_inputs leaves them None, so their present
+    mask is simply where they are not NaN.
+    """
+    c = frame['columns']
+    sectors = frame['sector']
+    is_financial = np.array([any(s in (sector or '') for s in ['Bank', 'Financial', 'Insurance'])
+                             for sector in sectors], dtype=bool)
+    is_high_yield_sector = np.array([any(s in (sector or '') for s in ['Utility', 'REIT', 'Energy'])
+                                     for sector in sectors], dtype=bool)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        positive_fcf = c['fcf'] > 0
+        has_market_cap = c['market_cap'] > 0
+
+        intrinsic_value = c['intrinsic_value']
+        current_price = c['current_price']
+        has_value = (intrinsic_value > 0) & frame['present']['current_price']
+        computed_margin = np.where(current_price < intrinsic_value,
+                                   (intrinsic_value - current_price) / intrinsic_value * 100, 0.0)
+        margin_of_safety = np.where(frame['present']['margin_of_safety'], c['margin_of_safety'], computed_margin)
+
+        derived = {
+            'roa_percent': c['returnOnAssets'] * 100,
+            'fcf_yield': np.where(positive_fcf & has_market_cap, c['fcf'] / c['market_cap'] * 100, np.nan),
+            'fcf_positive_without_market_cap': (positive_fcf & ~has_market_cap).astype(float),
+            'positive_pe_ratio': np.where(c['pe_ratio'] > 0, c['pe_ratio'], np.nan),
+            'positive_pb_ratio': np.where(c['pb_ratio'] > 0, c['pb_ratio'], np.nan),
+            'pb_threshold': np.where(is_financial, 2.0, 3.0),
+            'effective_margin_of_safety': np.where(has_value, margin_of_safety, np.nan),
+            'institutional_holding': c['fiiHolding'] + c['diiHolding'],
+            'institutional_holding_change': c['fiiHoldingChange'] + c['diiHoldingChange'],
+            'positive_dividend_yield': np.where(c['dividendYield'] > 0, c['dividendYield'], np.nan),
+            'dividend_threshold': np.where(is_high_yield_sector, 4.0, 2.0)
+        }
+
+    for column, values in derived.items():
+        c[column] = values
+        frame['present'][column] = ~np.isnan(values)
+    return frame
+
+
+# ----- STRUCTURAL SCORERS -----
+# Checks that compare several inputs with each other rather than one metric against thresholds
+
+def score_growth_consistency_columns(c, p):
+    """Consistency and margin-expansion bonuses of analyze_growth_consistency"""
+    revenue_yoy = c['revenue_yoy']
+    op_profit_yoy = c['operating_profit_yoy']
+    net_profit_yoy = c['net_profit_yoy']
+
+    # Consistency bonuses need at least two of the three YoY metrics
+    yoy = np.vstack([revenue_yoy, op_profit_yoy, net_profit_yoy])
+    present = np.vstack([p['revenue_yoy'], p['operating_profit_yoy'], p['net_profit_yoy']])
+    enough = present.sum(axis=0) >= 2
+    with np.errstate(invalid='ignore'):
+        all_positive = np.all(~present | (yoy > 0), axis=0)
+        expanding = (op_profit_yoy > revenue_yoy) | (net_profit_yoy > revenue_yoy)
+    return (enough & all_positive).astype(float) + (enough & expanding).astype(float)
+
+
+def score_trend_columns(c, p):
+    """Moving average and MACD checks of analyze_technical_indicators"""
+    ma_50 = c['ma_50']
+    ma_200 = c['ma_200']
+    current_price = c['current_price']
+
+    with np.errstate(invalid='ignore'):
+        both_mas = p['ma_50'] & p['ma_200']
+        cross = np.select([ma_50 > ma_200, ma_50 < ma_200], [1.0, -1.0], default=0.0)
+        position = np.select([(current_price > ma_50) & (current_price > ma_200),
+                              (current_price < ma_50) & (current_price < ma_200)], [1.0, -1.0], default=0.0)
+        short_only = np.where(current_price > ma_50, 0.5, -0.5)
+    short_only = np.where(p['current_price'], short_only, 0.0)
+    score = np.where(both_mas, cross + position, np.where(p['ma_50'], short_only, 0.0))
+
+    macd_line = c['macd_line']
+    macd_signal = c['macd_signal']
+    macd_histogram = c['macd_histogram']
+    with np.errstate(invalid='ignore'):
+        score += np.select([(macd_line > macd_signal) & (macd_histogram > 0),
+                            (macd_line < macd_signal) & (macd_histogram < 0)], [2.0, -1.0], default=0.0)
+
+    return np.where(c['price_history_available'], score, 0.0)
+
+
+def score_sector_columns(frame, sector_index):
+    """Vectorized equivalent of analyze_sector_performance using leave-one-out sector means"""
+    c = frame['columns']
+    symbols = frame['symbols']
+    sectors = frame['sector']
+    count = len(symbols)
+
+    unique_sectors = list(dict.fromkeys(sectors))
+    sector_codes = np.array([unique_sectors.index(s) for s in sectors]) if count else np.zeros(0, dtype=int)
+
+    members = np.array([sector_index['members'].get(s, 0) for s in unique_sectors], dtype=float)
+    is_member = np.array([sector_index['member_symbols'].get(sym, object()) == sec
+                          for sym, sec in zip(symbols, sectors)], dtype=bool)
+    peer_counts = members[sector_codes] - is_member
+
+    compared = np.zeros(count)
+    outperformed = np.zeros(count)
+    for metric in SECTOR_METRICS:
+        sums = np.zeros(len(unique_sectors))
+        counts = np.zeros(len(unique_sectors))
+        for i, sector in enumerate(unique_sectors):
+            aggregate = sector_index['aggregates'].get((sector, metric))
+            if aggregate is not None:
+                sums[i] = aggregate['sum']
+                counts[i] = aggregate['count']
+
+        own = c[metric]
+        has_own = frame['present'][metric]
+        # The stock's own value is part of the index only if it is a sector member with a value
+        in_index = has_own & is_member
+        peer_sum = sums[sector_codes] - np.where(in_index, own, 0.0)
+        peer_count = counts[sector_codes] - in_index
+
+        usable = has_own & (peer_count >= 2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sector_avg = peer_sum / peer_count
+            ratio = np.where(sector_avg != 0, own / sector_avg, 1.0)
+            if SECTOR_HIGHER_BETTER[metric]:
+                better = ratio > 1.2
+            else:
+                better = ratio < 0.8
+
+        compared += usable
+        outperformed += usable & better
+
+    score = outperformed + ((compared >= 2) & (outperformed == compared))
+    eligible = (peer_counts >= 2) & np.array([s != 'Unknown' for s in sectors], dtype=bool)
+    return np.where(eligible, score, 0.0)
+
+
+def score_qualitative_columns(frame):
+    """Qualitative scores (industry, regulation, macro and moat) for every stock.
+
+    Sector classifications are computed once per distinct sector and exchange and indexed per
+    stock. The business summary keyword hits come from one pass of the compiled matcher over all
+    names and summaries (see scan_business_summaries), so the scores are sums of whole columns.
+    """
+    c = frame['columns']
+    keys = [(sector, symbol_exchange(symbol)) for symbol, sector in zip(frame['symbols'], frame['sector'])]
+    key_positions = {key: position for position, key in enumerate(dict.fromkeys(keys))}
+    distinct_keys = list(key_positions)
+    key_codes = np.array([key_positions[key] for key in keys], dtype=np.int64)
+    classifications = [classify_sector(sector, exchange) for sector, exchange in distinct_keys]
+
+    def per_stock(values):
+        return np.array(values, dtype=float)[key_codes]
+
+    industry = per_stock([INDUSTRY_OUTCOMES[classification['industry']][0] for classification in classifications])
+    regulatory = per_stock([REGULATORY_OUTCOMES[classification['regulatory']][0]
+                            for classification in classifications])
+    macro = per_stock([MACRO_OUTCOMES[exchange][classification['macro']][0]
+                       for (_, exchange), classification in zip(distinct_keys, classifications)])
+    sector_moats = per_stock([float(classification['network_effects'] + classification['brand_moat'] +
+                                    classification['switching_costs']) for classification in classifications])
+
+    hits = scan_business_summaries(frame['name'], frame['summary'])
+    # A strong market position in the summary lifts the industry score; it needs a summary
+    has_summary = np.array([bool(summary) for summary in frame['summary']], dtype=bool)
+    industry += has_summary & hits['concentration']
+
+    with np.errstate(invalid='ignore'):
+        moat = (2.0 * hits['strong_moat_company'] + sector_moats + (c['profit_margin'] > 20) + (c['roe'] > 25) +
+                0.5 * hits['moat_types'].sum(axis=1))
+    return industry + regulatory + macro + np.minimum(moat, 4)
+
+
+def score_frame(frame, sector_index, rules):
+    """Score a prepared frame with a compiled rule set.
+
+    The frame (see build_stock_frame and add_derived_columns) can be scored with several rule
+    sets without rebuilding it. Returns a dict of the symbol list, one score array per category
+    and the rule evaluation used for reasons.
+    """
+    c = frame['columns']
+    p = frame['present']
+    evaluation = evaluate_rules(rules, c, p, len(frame['symbols']))
+    rule_scores = evaluation['scores']
+
+    growth_score = rule_scores['growth'] + score_growth_consistency_columns(c, p)
+    buffett_score = rule_scores['buffett'] + frame['qualitative_score']
+    technical_score = (rule_scores['technical'] +
+                       score_trend_columns(c, p) +
+                       score_sector_columns(frame, sector_index))
+
+    return {
+        'symbols': frame['symbols'],
+        'buffett_score': buffett_score,
+        'technical_score': technical_score,
+        'growth_score': growth_score,
+        'total_score': buffett_score + technical_score + growth_score,
+        'evaluation': evaluation
+    }
+
+
+def add_rank_columns(frame, stock_data):
+    """Add universe and sector percentile rank columns (e.g. roe_sector_pct) for rank-based rules"""
+    normalized_data = normalize_stock_data({symbol: stock_data[symbol] for symbol in frame['symbols']})
+    ranks = compute_percentile_ranks([normalized_data[symbol] for symbol in frame['symbols']], frame['sector'])
+    for metric, scopes in ranks.items():
+        for scope, values in scopes.items():
+            column = rank_column_name(metric, scope)
+            frame['columns'][column] = values
+            frame['present'][column] = ~np.isnan(values)
+    return frame
+
+
+def uses_rank_columns(rules):
+    """Whether a compiled rule set reads any percentile rank column"""
+    rank_columns = {rank_column_name(metric, scope) for metric in RANKED_METRICS for scope in RANK_SCOPES}
+    for rule in rules['rules']:
+        columns = {rule['metric'], rule['missing_metric'], rule['requires']}
+        columns.update(condition[3] for condition in rule['conditions'])
+        if columns & rank_columns:
+            return True
+    return False
+
+
+def prepare_frame(stock_data, ranks=True):
+    """Build the frame with derived and rank columns and qualitative scores, ready for any rule set.
+
+    ranks=False skips the rank columns for callers that score only rule sets without them.
+    """
+    frame = add_derived_columns(build_stock_frame(stock_data))
+    if ranks:
+        frame = add_rank_columns(frame, stock_data)
+    frame['qualitative_score'] = score_qualitative_columns(frame)
+    return frame
+
+
+def score_universe(stock_data, sector_index=None, rules=None):
+    """Score every analyzable stock in one pass over whole columns.
+
+    With the default rule set this produces the same buffett_score, technical_score and
+    growth_score as buffett_analysis.
+    """
+    if sector_index is None:
+        sector_index = build_analysis_sector_index(stock_data)
+    if rules is None:
+        rules = load_rules()
+    return score_frame(prepare_frame(stock_data), sector_index, rules)
+
+
+# ----- PARITY CHECK -----
+
+def check_parity(stock_data):
+    """Compare the vectorized engine against the per-stock analyzers on the same snapshot.
+
+    Returns the list of (symbol, category, serial score, vectorized score) mismatches.
+    """
+    vectorized = score_universe(stock_data)
+
+    serial_data = normalize_stock_data(stock_data)
+    sector_index = build_sector_index(serial_data)
+
+    mismatches = []
+    for i, symbol in enumerate(vectorized['symbols']):
+        analysis = score_stock(symbol, serial_data[symbol], serial_data, sector_index)
+        for category in ['buffett_score', 'technical_score', 'growth_score']:
+            if analysis[category] != vectorized[category][i]:
+                mismatches.append((symbol, category, analysis[category], float(vectorized[category][i])))
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Vectorized scoring engine')
+    parser.add_argument('--data', type=str, default=None, help='Snapshot to score (defaults to data/latest.json)')
+    parser.add_argument('--check-parity', action='store_true', help='Compare against the per-stock analyzers')
+    parser.add_argument('--rules', type=str, nargs='+', default=None,
+                        help='Rule set files to score side by side (defaults to scoring_rules.json)')
+    parser.add_argument('--threshold', type=float, default=PICK_THRESHOLD, help='Total score needed to become a pick')
+    args = parser.parse_args()
+
+    if args.data:
+        with open(args.data, 'r') as f:
+            stock_data = json.load(f)
+    else:
+        stock_data = load_latest_data()
+
+    # The snapshot is loaded and prepared once, then scored with every rule set
+    start = time.perf_counter()
+    sector_index = build_analysis_sector_index(stock_data)
+    frame = prepare_frame(stock_data)
+    print(f"Prepared {len(frame['symbols'])} stocks in {time.perf_counter() - start:.3f}s")
+
+    for rules_path in args.rules or [None]:
+        rules = load_rules(rules_path) if rules_path else load_rules()
+        start = time.perf_counter()
+        scores = score_frame(frame, sector_index, rules)
+        elapsed = time.perf_counter() - start
+        picks = int((scores['total_score'] >= args.threshold).sum())
+        print(f"{rules['path']} (version {rules['version']}): {picks} picks, "
+              f"mean total score {scores['total_score'].mean():.2f}, scored in {elapsed:.3f}s")
+
+    if args.check_parity:
+        mismatches = check_parity(stock_data)
+        for symbol, category, serial_score, vectorized_score in mismatches[:20]:
+            print(f"Mismatch {symbol} {category}: serial {serial_score}, vectorized {vectorized_score}")
+        print(f"Parity check: {len(mismatches)} mismatches across {len(frame['symbols'])} stocks")
+        if mismatches:
+            raise SystemExit(1)